@@ -2,23 +2,38 @@ import os
 import glob
 import logging
 import pandas as pd
-import backtrader as bt
-from typing import List, Dict, Optional
+from typing import TYPE_CHECKING, Callable, List, Dict, Optional
 from datetime import datetime
 
+from market_store import MarketStore
+from price_matrix import PriceMatrix, is_cache_valid
+from phase_profiler import PhaseProfiler
+
+if TYPE_CHECKING:
+    import backtrader as bt
+
 class DataManager:
     """数据管理类，负责加载和管理回测数据"""
     
-    def __init__(self, config):
-        """初始化数据管理器"""
+    # 从列式存储读取时投影的列
+    PROJECTED_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+    
+    def __init__(self, config, profiler: Optional[PhaseProfiler] = None):
+        """初始化数据管理器
+        
+        Args:
+            config: 配置对象
+            profiler: 可选，分阶段计时注册表
+        """
         self.config = config
+        self.profiler = profiler or PhaseProfiler(enabled=False)
         self.data_dir = config.data_dir
         self.specific_data_dir = config.specific_data_dir
         self.available_currencies = set()
         self.loaded_pairs = []
         self.data_feeds = {}  # 存储加载的数据
     
-    def load_data(self, cerebro: bt.Cerebro, pairs: List[str], data_dir: str = None) -> bool:
+    def load_data(self, cerebro: 'bt.Cerebro', pairs: List[str], data_dir: str = None) -> bool:
         """加载数据到Backtrader
         
         Args:
@@ -29,13 +44,132 @@ class DataManager:
         Returns:
             bool: 是否成功加载足够数据
         """
+        import backtrader as bt
+
+        if self.config.data_feed == 'stream':
+            return self._load_stream_feeds(cerebro, pairs, data_dir)
+
+        with self.profiler.phase('data.load'):
+            frames = self.load_frames(pairs, data_dir)
+        
+        # 清空之前的数据
+        self.data_feeds.clear()
+        
+        feeds_start = self.profiler.start()
+        for pair_name, df in frames.items():
+            # 创建数据源
+            data = bt.feeds.PandasData(
+                dataname=df,
+                datetime='datetime',
+                open='open',
+                high='high',
+                low='low',
+                close='close',
+                volume='volume',
+                name=pair_name,  # 使用下划线格式作为名称
+                timeframe=bt.TimeFrame.Seconds,
+                compression=1
+            )
+            
+            # 添加到cerebro
+            cerebro.adddata(data)
+            self.data_feeds[pair_name] = data
+        self.profiler.stop('data.build_feeds', feeds_start)
+        self.profiler.count('data.rows', sum(len(df) for df in frames.values()))
+        
+        return self.check_loaded()
+
+    def _load_stream_feeds(self, cerebro: 'bt.Cerebro', pairs: List[str], data_dir: str = None) -> bool:
+        """为每个交易对添加分块读取的流式数据源，不预先读取数据
+        
+        Args:
+            cerebro: Backtrader实例，应以preload=False、runonce=False、exactbars=1创建
+            pairs: 需要加载的交易对(下划线格式)
+            data_dir: 可选的数据目录，如果不提供则使用self.data_dir
+            
+        Returns:
+            bool: 是否成功加载足够数据
+        """
+        from stream_feed import streaming_feed
+
+        if data_dir:
+            self.data_dir = data_dir
+        self.data_feeds.clear()
+        
+        feeds_start = self.profiler.start()
+        sources = self.chunk_sources(pairs)
+        for pair, chunks in sources.items():
+            data = streaming_feed(chunks, pair)
+            cerebro.adddata(data)
+            self.data_feeds[pair] = data
+        self.profiler.stop('data.build_feeds', feeds_start)
+        
+        logging.info(f"添加 {len(sources)}/{len(pairs)} 个交易对的流式数据源，每块 {self.config.feed_chunk_rows} 行")
+        return self.check_loaded()
+
+    def chunk_sources(self, pairs: List[str], start_date: str = None) -> Dict[str, Callable]:
+        """每个交易对的分块读取函数，不预先读取数据
+        
+        Args:
+            pairs: 需要加载的交易对(下划线格式)
+            start_date: 可选，列式存储从这一天开始读取，默认config.start_date；CSV总是从头读取
+            
+        Returns:
+            dict: 交易对 -> 返回块迭代器的无参函数，块格式见stream_feed
+        """
+        from functools import partial
+        from stream_feed import iter_csv_chunks, iter_store_chunks
+
+        self.available_currencies = set()
+        self.loaded_pairs = []
+        chunk_rows = self.config.feed_chunk_rows
+        
+        if self.config.data_format == 'parquet':
+            store = MarketStore(self.config.store_dir, self.config.interval)
+            sources = {pair: partial(iter_store_chunks, store, pair, start_date or self.config.start_date,
+                                     self.config.end_date, chunk_rows)
+                       for pair in self.precheck_store_pairs(store, pairs)}
+        else:
+            files_by_pair = {os.path.splitext(os.path.basename(f))[0]: f
+                             for f in glob.glob(os.path.join(self.data_dir, "*.csv"))}
+            sources = {}
+            for pair in pairs:
+                if pair in files_by_pair:
+                    sources[pair] = partial(iter_csv_chunks, files_by_pair[pair], chunk_rows)
+                else:
+                    logging.warning(f"未找到交易对 {pair} 的数据文件")
+        
+        for pair in sources:
+            base, quote = pair.split('_')
+            self.available_currencies.add(base)
+            self.available_currencies.add(quote)
+            self.loaded_pairs.append(pair)
+        return sources
+
+    def load_frames(self, pairs: List[str], data_dir: str = None) -> Dict[str, pd.DataFrame]:
+        """读取交易对数据为DataFrame，不依赖Backtrader
+        
+        Args:
+            pairs: 需要加载的交易对(下划线格式)
+            data_dir: 可选的数据目录，如果不提供则使用self.data_dir
+            
+        Returns:
+            dict: 交易对 -> DataFrame，列名已统一为小写并带有datetime列
+        """
         if data_dir:
             self.data_dir = data_dir
+        
+        self.available_currencies = set()
+        self.loaded_pairs = []
+        frames = {}
+
+        if self.config.data_format == 'parquet':
+            return self._load_store_frames(pairs)
             
         data_files = glob.glob(os.path.join(self.data_dir, "*.csv"))
         if not data_files:
             logging.error(f"在 {self.data_dir} 目录中没有找到CSV文件")
-            return False
+            return frames
             
         logging.info(f"找到 {len(data_files)} 个数据文件")
         
@@ -45,26 +179,16 @@ class DataManager:
         logging.info(f"使用时间范围: {start_time} 到 {end_time} (UTC)")
         
         # 过滤匹配的文件
+        files_by_pair = {os.path.splitext(os.path.basename(f))[0]: f for f in data_files}
         selected_files = []
         for pair in pairs:
-            matching_files = [f for f in data_files 
-                              if os.path.splitext(os.path.basename(f))[0] == pair 
-                              or pair + ".csv" == os.path.basename(f)]  # 匹配带扩展名的情况
-            if matching_files:
-                selected_files.extend(matching_files)
+            if pair in files_by_pair:
+                selected_files.append(files_by_pair[pair])
             else:
                 logging.warning(f"未找到交易对 {pair} 的数据文件")
         
         logging.info(f"找到 {len(selected_files)}/{len(pairs)} 个需求交易对的数据文件")
         
-        # 加载数据
-        loaded_count = 0
-        self.available_currencies = set()
-        self.loaded_pairs = []
-        
-        # 清空之前的数据
-        self.data_feeds.clear()
-        
         for file_path in selected_files:
             try:
                 # 从文件名提取交易对
@@ -96,26 +220,8 @@ class DataManager:
                 else:
                     df['datetime'] = pd.to_datetime(df['timestamp'], unit='ms')
                 
-                # 创建数据源
-                data = bt.feeds.PandasData(
-                    dataname=df,
-                    datetime='datetime',
-                    open='open',
-                    high='high',
-                    low='low',
-                    close='close',
-                    volume='volume',
-                    name=pair_name,  # 使用下划线格式作为名称
-                    timeframe=bt.TimeFrame.Seconds,
-                    compression=1
-                )
-                
-                # 添加到cerebro
-                cerebro.adddata(data)
+                frames[pair_name] = df
                 self.loaded_pairs.append(pair_name)
-                self.data_feeds[pair_name] = data
-                
-                loaded_count += 1
                 logging.info(f"加载 {pair_name} 数据，共 {len(df)} 条记录")
                 
             except Exception as e:
@@ -123,18 +229,198 @@ class DataManager:
                 import traceback
                 traceback.print_exc()
         
+        return frames
+
+    def _load_store_frames(self, pairs: List[str]) -> Dict[str, pd.DataFrame]:
+        """从列式存储按日期范围读取数据，只解码回测需要的列
+        
+        Args:
+            pairs: 需要加载的交易对(下划线格式)
+            
+        Returns:
+            dict: 交易对 -> DataFrame
+        """
+        store = MarketStore(self.config.store_dir, self.config.interval)
+        logging.info(f"从列式存储 {store.base_dir} 读取 {self.config.start_date} 到 {self.config.end_date} 的数据")
+        
+        frames = {}
+        for pair in self.precheck_store_pairs(store, pairs):
+            try:
+                df = store.read(pair, self.config.start_date, self.config.end_date, columns=self.PROJECTED_COLUMNS)
+                if df is None or df.empty:
+                    logging.warning(f"未找到交易对 {pair} 的数据文件")
+                    continue
+                
+                df['datetime'] = pd.to_datetime(df['timestamp'], unit='ms')
+                base, quote = pair.split('_')
+                self.available_currencies.add(base)
+                self.available_currencies.add(quote)
+                
+                frames[pair] = df
+                self.loaded_pairs.append(pair)
+                logging.info(f"加载 {pair} 数据，共 {len(df)} 条记录")
+            except Exception as e:
+                logging.error(f"读取交易对 {pair} 时出错: {str(e)}")
+        
+        logging.info(f"找到 {len(frames)}/{len(pairs)} 个需求交易对的数据")
+        return frames
+
+    def precheck_store_pairs(self, store: MarketStore, pairs: List[str]) -> List[str]:
+        """用统计索引预先排除日期范围内没有数据的交易对，不读取Parquet分区
+        
+        索引中没有记录的交易对(如索引建立之前入库的数据)按分区文件是否存在判断。
+        
+        Args:
+            store: 列式存储
+            pairs: 需要加载的交易对
+            
+        Returns:
+            list: 可能有数据的交易对，保持输入顺序
+        """
+        summary = store.stats.pair_summary(self.config.start_date, self.config.end_date, pairs)
+        date_list = MarketStore.date_range(self.config.start_date, self.config.end_date)
+        available = []
+        for pair in pairs:
+            if pair in summary.index:
+                has_data = summary.at[pair, 'rows'] > 0
+            else:
+                has_data = any(store.has_day(pair, day) for day in date_list)
+            if has_data:
+                available.append(pair)
+            else:
+                logging.warning(f"未找到交易对 {pair} 的数据文件")
+        return available
+
+    def load_price_matrix(self, pairs: List[str], data_dir: str = None) -> Optional[PriceMatrix]:
+        """加载整个数据目录对齐后的价格矩阵，优先使用memmap缓存
+        
+        矩阵覆盖数据目录中的全部交易对，首次构建后保存在目录下的缓存中，
+        之后的回测和并行进程只读映射同一份文件，共享操作系统页缓存。
+        
+        Args:
+            pairs: 回测需要的交易对(下划线格式)
+            data_dir: 可选的数据目录，如果不提供则使用self.data_dir
+            
+        Returns:
+            PriceMatrix: 价格矩阵，数据目录为空时返回None
+        """
+        if data_dir:
+            self.data_dir = data_dir
+        self.available_currencies = set()
+        self.loaded_pairs = []
+        
+        cache_dir = self.matrix_cache_dir()
+        sources = self._matrix_sources()
+        if not sources:
+            logging.error(f"在 {self.data_dir} 中没有找到可用于构建价格矩阵的数据")
+            return None
+        fingerprint = [[pair, name, size, mtime] for pair, (name, size, mtime) in sorted(sources.items())]
+        
+        if is_cache_valid(cache_dir, fingerprint):
+            logging.info(f"使用价格矩阵缓存: {cache_dir}")
+            matrix = PriceMatrix.open_cache(cache_dir)
+        else:
+            logging.info(f"构建价格矩阵缓存: {cache_dir}")
+            matrix = PriceMatrix.build_cache(
+                cache_dir,
+                sorted(sources),
+                lambda pair, columns: self._read_matrix_columns(pair, sources[pair][0], columns),
+                fingerprint
+            )
+        
+        available = set(matrix.pairs)
+        for pair in pairs:
+            if pair not in available:
+                logging.warning(f"未找到交易对 {pair} 的数据文件")
+                continue
+            base, quote = pair.split('_')
+            self.available_currencies.add(base)
+            self.available_currencies.add(quote)
+            self.loaded_pairs.append(pair)
+        
+        logging.info(f"价格矩阵包含 {len(matrix.pairs)} 个交易对，其中 {len(self.loaded_pairs)}/{len(pairs)} 个为需求交易对")
+        return matrix
+
+    def matrix_cache_dir(self) -> str:
+        """价格矩阵缓存目录: CSV数据放在数据目录下，列式存储按日期范围区分"""
+        if self.config.data_format == 'parquet':
+            date_range = f"{self.config.start_date.replace('-', '')}_{self.config.end_date.replace('-', '')}"
+            return os.path.join(self.config.store_dir, '.price_matrix', f"{self.config.interval}_{date_range}")
+        return os.path.join(self.data_dir, '.price_matrix')
+
+    def _matrix_sources(self) -> Dict[str, tuple]:
+        """构建价格矩阵的数据源
+        
+        Returns:
+            dict: 交易对 -> (文件名, 大小, 修改时间)，列式存储时为该日期范围内各分区的合计
+        """
+        sources = {}
+        if self.config.data_format == 'parquet':
+            store = MarketStore(self.config.store_dir, self.config.interval)
+            for pair in store.pairs():
+                files = [store.day_path(pair, day) for day in store.date_range(self.config.start_date, self.config.end_date)]
+                stats = [os.stat(f) for f in files if os.path.exists(f)]
+                if stats:
+                    sources[pair] = (pair, sum(st.st_size for st in stats), max(st.st_mtime_ns for st in stats))
+            return sources
+        
+        for file_path in glob.glob(os.path.join(self.data_dir, "*.csv")):
+            file_name = os.path.basename(file_path)
+            symbol_parts = os.path.splitext(file_name)[0].split('_')[:2]
+            if len(symbol_parts) < 2:
+                continue
+            st = os.stat(file_path)
+            sources[f"{symbol_parts[0]}_{symbol_parts[1]}"] = (file_name, st.st_size, st.st_mtime_ns)
+        return sources
+
+    def _read_matrix_columns(self, pair: str, file_name: str, columns: List[str]) -> pd.DataFrame:
+        """只读取构建价格矩阵需要的列
+        
+        Args:
+            pair: 交易对
+            file_name: 数据目录中的CSV文件名，列式存储时不使用
+            columns: timestamp/close/volume中的若干列
+            
+        Returns:
+            pd.DataFrame: 列名为小写的数据
+        """
+        if self.config.data_format == 'parquet':
+            store = MarketStore(self.config.store_dir, self.config.interval)
+            return store.read(pair, self.config.start_date, self.config.end_date, columns=columns)
+        
+        file_path = os.path.join(self.data_dir, file_name)
+        header = pd.read_csv(file_path, nrows=0).columns
+        csv_names = {'timestamp': 'timestamp', 'close': 'Close', 'volume': 'Volume'}
+        usecols = [csv_names[c] for c in columns if csv_names[c] in header]
+        if 'timestamp' in columns and 'timestamp' not in header:
+            usecols.append('datetime_utc')
+        df = pd.read_csv(file_path, usecols=usecols)
+        df.rename(columns={'Close': 'close', 'Volume': 'volume'}, inplace=True)
+        if 'datetime_utc' in df.columns:
+            df['datetime'] = pd.to_datetime(df['datetime_utc'])
+        return df
+
+    def check_loaded(self) -> bool:
+        """检查已加载的数据能否构成套利路径
+        
+        Returns:
+            bool: 是否加载了足够数据
+        """
+        loaded_count = len(self.loaded_pairs)
+        
         # 验证是否加载了足够数据
         if loaded_count < 3:  # 至少需要三个交易对才能形成套利三角形
             logging.error(f"加载的交易对数量不足，无法形成三角形套利! 只加载了 {loaded_count} 个交易对")
             return False
             
-        # 检查基础货币是否存在
-        if self.config.base_currency not in self.available_currencies:
-            logging.error(f"基础货币 {self.config.base_currency} 不在任何交易对中! 可用货币: {sorted(self.available_currencies)}")
+        # 检查每个基础货币是否存在
+        missing = [base for base in self.config.base_currency_list() if base not in self.available_currencies]
+        if missing:
+            logging.error(f"基础货币 {', '.join(missing)} 不在任何交易对中! 可用货币: {sorted(self.available_currencies)}")
             return False
             
         logging.info(f"成功加载 {loaded_count} 个数据集")
-        return loaded_count >= 3
+        return True
 
     @staticmethod
     def convert_to_underscore_format(pair: str) -> str:
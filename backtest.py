@@ -3,22 +3,19 @@ import os
 import logging
 import datetime
 import json
-import matplotlib.pyplot as plt
 from typing import List, Optional, Dict, Any
 import traceback
 
 from DataManager import DataManager
 from tri_arb import TriangularArbStrategy, calculate_arb_paths
+from phase_profiler import PhaseProfiler, run_profile
+from results_catalog import ResultsCatalog
 
-# 创建结果目录
+# 结果目录，首次写入时创建
 RESULTS_DIR = './results'
-if not os.path.exists(RESULTS_DIR):
-    os.makedirs(RESULTS_DIR)
 
-# 创建图表存储目录
+# 图表存储目录，首次写入时创建
 PLOTS_DIR = './plots'
-if not os.path.exists(PLOTS_DIR):
-    os.makedirs(PLOTS_DIR)
 
 class BinanceCommissionInfo(bt.CommInfoBase):
     """Binance交易所手续费模型"""
@@ -48,16 +45,23 @@ class TriangleArbBacktest:
         self.config = config or ArbConfig()
         
         # 初始化cerebro引擎
-        self.cerebro = bt.Cerebro()
-        self.cerebro = bt.Cerebro(stdstats=False)
+        if self.config.data_feed == 'stream':
+            # 流式数据源: 不预加载，逐根K线推进，只保留当前值
+            self.cerebro = bt.Cerebro(stdstats=False, preload=False, runonce=False, exactbars=1)
+        else:
+            self.cerebro = bt.Cerebro(stdstats=False)
         self.cerebro.broker.set_cash(self.config.initial_cash)
         
         # 设置手续费
         self.commission_info = self.setup_commission()
         self.cerebro.broker.addcommissioninfo(self.commission_info)
         
+        # 分阶段计时，未开启时为空操作
+        self.profiler = PhaseProfiler(enabled=self.config.profile_phases)
+        self.profile_result = {}
+
         # 初始化数据管理器
-        self.data_manager = DataManager(self.config)
+        self.data_manager = DataManager(self.config, self.profiler)
         
         # 数据加载状态
         self.data_loaded = False
@@ -137,26 +141,36 @@ class TriangleArbBacktest:
             self.cerebro.addstrategy(
                 TriangularArbStrategy,
                 fee=taker_fee,
-                base_currency=self.config.base_currency,
+                base_currency=self.config.base_currency_list(),
                 trade_amount=self.config.trade_amount,
                 threshold=self.config.threshold,
                 max_positions=self.config.max_positions,
                 skip_seconds=self.config.skip_seconds,
+                max_age=self.config.max_price_age,
                 debug=self.config.debug,
                 paths_file=None,
-                available_pairs=self.final_pairs
+                available_pairs=self.final_pairs,
+                eval_mode=self.config.eval_mode,
+                max_legs=self.config.max_path_legs,
+                cycle_detection=self.config.cycle_detection,
+                base_settings=self.config.base_settings,
+                path_cache=self.config.path_cache,
+                trade_format=self.config.trade_format,
+                export_excel=self.config.export_trades_excel,
+                profiler=self.profiler
             )
             
             # 记录回测开始
             logging.info(f"开始回测 - "
-                        f"基础货币: {self.config.base_currency}, "
+                        f"基础货币: {', '.join(self.config.base_currency_list())}, "
                         f"手续费: 挂单 {maker_fee*100:.4f}%, 吃单 {taker_fee*100:.4f}%, "
                         f"套利阈值: {self.config.threshold*100:.4f}%")
             
             start_time = datetime.datetime.now()
             
             # 运行回测
-            results = self.cerebro.run()
+            with run_profile(self.config.profile_mode, self.profile_result), self.profiler.phase('engine.run'):
+                results = self.cerebro.run()
             strategy = results[0]
             
             end_time = datetime.datetime.now()
@@ -168,6 +182,7 @@ class TriangleArbBacktest:
             self.export_results(strategy)
             if self.config.plot:
                 self.plot()
+            self.log_phases()
         
             return strategy
         except Exception as e:
@@ -182,7 +197,7 @@ class TriangleArbBacktest:
             strategy: 策略对象
         """
         initial = self.config.initial_cash
-        final = self.cerebro.broker.getvalue()
+        final = self.get_final_value()
         
         logging.info(f"初始资金: {initial:.2f}")
         logging.info(f"最终资金: {final:.2f}")
@@ -212,15 +227,69 @@ class TriangleArbBacktest:
             
             if strategy.num_trades > 0:
                 logging.info(f"平均每次套利收益: {strategy.total_profit / strategy.num_trades:.6f}")
-        
+
+        latency = getattr(strategy, 'latency', None)
+        if latency is not None and latency.count:
+            logging.info(f"每根K线处理耗时: {latency.format_summary()}")
+
+        # 多基础货币时分别显示各基础货币的结果和合计
+        summary = getattr(strategy, 'summary', None)
+        if summary and len(summary['per_base']) > 1:
+            for base, result in summary['per_base'].items():
+                logging.info(f"[{base}] 初始资金: {result['initial_cash']:.6f}, 最终资金: {result['final_value']:.6f}, "
+                             f"收益率: {result['percent_profit']:.2f}%, 套利次数: {result['triangle_arb_trades']}")
+            combined = summary['combined']
+            logging.info(f"[合计 {combined['base_currency']}] 初始资金: {combined['initial_cash']:.2f}, "
+                         f"最终资金: {combined['final_value']:.2f}, 总收益: {combined['absolute_profit']:.2f}, "
+                         f"套利次数: {combined['triangle_arb_trades']}")
+            if combined['unconverted']:
+                logging.warning(f"无法折算为 {combined['base_currency']} 的基础货币未计入合计金额: "
+                                f"{', '.join(combined['unconverted'])}")
+        
+    def get_final_value(self):
+        """回测结束时的账户价值"""
+        return self.cerebro.broker.getvalue()
+
+    def performance_results(self, strategy):
+        """每根K线处理耗时、分阶段耗时和剖析结果
+
+        引擎总耗时中除去策略初始化、逐根K线处理和结束处理的部分记为engine.overhead，
+        对Backtrader即为Cerebro的数据同步开销。
+        """
+        latency = getattr(strategy, 'latency', None)
+        phases = self.profiler.summary()
+        if phases is not None and 'engine.run' in phases['phases']:
+            strategy_ms = sum(phases['phases'].get(name, {}).get('total_ms', 0.0)
+                              for name in ('strategy.init', 'strategy.next', 'strategy.stop'))
+            phases['derived'] = {
+                'engine.overhead_ms': phases['phases']['engine.run']['total_ms'] - strategy_ms,
+            }
+        return {
+            "bar_latency": latency.summary() if latency is not None else None,
+            "bar_latency_histogram": latency.to_dict() if latency is not None else None,
+            "phases": phases,
+            "profile": self.profile_result or None,
+        }
+
+    def log_phases(self):
+        """输出分阶段耗时表"""
+        if not self.profiler.enabled:
+            return
+        logging.info("分阶段耗时:")
+        for line in self.profiler.format_lines():
+            logging.info(f"  {line}")
+        if self.profile_result:
+            logging.info(f"剖析文件({self.profile_result['mode']}): {self.profile_result['file']}")
+
     def export_results(self, strategy):
         """导出回测结果到JSON文件
         
         Args:
             strategy: 策略对象
         """
+        export_start = self.profiler.start()
         try:
-            final_value = self.cerebro.broker.getvalue()
+            final_value = self.get_final_value()
             profit = final_value - self.config.initial_cash
             profit_pct = (final_value / self.config.initial_cash - 1) * 100
             
@@ -228,7 +297,8 @@ class TriangleArbBacktest:
                 "backtest_summary": {
                     "start_date": self.config.start_date,
                     "end_date": self.config.end_date,
-                    "base_currency": self.config.base_currency,
+                    "base_currency": self.config.base_currency_list()[0],
+                    "base_currencies": self.config.base_currency_list(),
                     "traded_pairs": self.data_count
                 },
                 "financial_results": {
@@ -241,6 +311,10 @@ class TriangleArbBacktest:
                     "triangle_arb_trades": getattr(strategy, 'num_trades', 0),
                     "total_arb_profit": getattr(strategy, 'total_profit', 0.0)
                 },
+                "base_results": getattr(strategy, 'summary', None),
+                "trade_files": {ledger.base_currency: ledger.trade_files
+                                for ledger in getattr(strategy, 'ledgers', [])},
+                "performance": None,
                 "binance_settings": {
                     "maker_fee_pct": self.commission_info.p.maker * 100,
                     "taker_fee_pct": self.commission_info.p.taker * 100,
@@ -249,18 +323,26 @@ class TriangleArbBacktest:
                 "config": self.config.to_dict()
             }
             
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            # 文件名包含微秒和进程号，并行批量回测同一秒内完成时不会互相覆盖，results_catalog也按文件名区分回测
+            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
             threshold_info = f"thresh{self.config.threshold*100:.2f}"
-            currency_info = f"{self.config.base_currency}"
+            currency_info = "-".join(self.config.base_currency_list())
             
-            filename = f"arb_results_{currency_info}_{threshold_info}_{timestamp}.json"
+            filename = f"arb_results_{currency_info}_{threshold_info}_{timestamp}_{os.getpid()}.json"
             filepath = os.path.join(RESULTS_DIR, filename)
+            os.makedirs(RESULTS_DIR, exist_ok=True)
             
+            # 阶段耗时最后收集，export_results本身不含写文件的时间
+            self.profiler.stop('export_results', export_start)
+            results["performance"] = self.performance_results(strategy)
+
             # 保存到文件
             with open(filepath, 'w', encoding='utf-8') as f:
                 json.dump(results, f, indent=4)
             
             logging.info(f"回测结果已导出到: {filepath}")
+            if self.config.results_catalog:
+                ResultsCatalog(self.config.results_catalog).record(results, filepath)
         
         except Exception as e:
             logging.error(f"导出结果时出错: {str(e)}")
@@ -271,12 +353,19 @@ class TriangleArbBacktest:
         if not hasattr(self, 'cerebro') or not self.data_loaded:
             logging.error("无法绘图: 回测未完成")
             return
+        if self.config.data_feed == 'stream':
+            logging.warning("流式数据源不保留历史数据，无法绘图")
+            return
         
         try:
+            # matplotlib导入较慢，只在绘图时加载
+            import matplotlib.pyplot as plt
+
             # 生成文件名
             timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"arb_plot_{timestamp}.png"
             plot_file = os.path.join(PLOTS_DIR, filename)
+            os.makedirs(PLOTS_DIR, exist_ok=True)
             
             # 设置中文显示（如果需要）
             plt.rcParams['font.sans-serif'] = ['SimHei']
@@ -312,7 +401,14 @@ def run_backtest(config=None):
             config = ArbConfig()
         
         # 创建回测实例
-        backtest = TriangleArbBacktest(config)
+        if config.engine == 'replay':
+            from fast_backtest import FastReplayBacktest
+            backtest = FastReplayBacktest(config)
+        elif config.engine == 'daily':
+            from day_backtest import DayPartitionedBacktest
+            backtest = DayPartitionedBacktest(config)
+        else:
+            backtest = TriangleArbBacktest(config)
         
         # 设置回测环境
         if not backtest.setup():
@@ -3,8 +3,13 @@ import sys
 import logging
 import datetime
 import copy
+import glob
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from configs.ArbConfig import ArbConfig
 from backtest import run_backtest
+from market_store import MarketStore
+from latency import LatencyHistogram
 from utils import setup_logging  # 导入工具函数
 
 def limit_memory(max_mem_gb=6):
@@ -24,12 +29,10 @@ def limit_memory(max_mem_gb=6):
             print(f"无法设置内存限制: {e}")
     
     print("请注意手动监控程序内存使用")
-    
-limit_memory(6)  # 限制为6GB
 
-def run_backtest_for_date(start_date, end_date):
-    """针对特定日期范围回测"""
-    config = ArbConfig()
+def make_date_config(start_date, end_date, base_config=None):
+    """生成特定日期范围的回测配置，其余字段取自base_config"""
+    config = copy.deepcopy(base_config) if base_config is not None else ArbConfig()
     
     # 更新配置中的日期
     config.start_date = start_date
@@ -38,6 +41,11 @@ def run_backtest_for_date(start_date, end_date):
     # 设置特定数据目录
     date_range = f"{start_date.replace('-', '')}_{end_date.replace('-', '')}"
     config.specific_data_dir = f"{config.data_dir}/{config.interval}_{date_range}"
+    return config
+
+def run_backtest_for_date(start_date, end_date, base_config=None):
+    """针对特定日期范围回测"""
+    config = make_date_config(start_date, end_date, base_config)
     
     log_file = setup_logging(start_date, reset_handlers=True)
     print(f"日志记录到: {log_file}")
@@ -63,9 +71,9 @@ def run_backtest_for_date(start_date, end_date):
         print(f"\n===== {start_date} 至 {end_date} 回测结果 =====")
         print(f"总耗时: {duration:.2f} 秒")
         print(f"初始资金: {config.initial_cash:.2f}")
-        print(f"最终资金: {backtest.cerebro.broker.getvalue():.2f}")
-        print(f"绝对收益: {backtest.cerebro.broker.getvalue() - config.initial_cash:.2f}")
-        print(f"收益率: {(backtest.cerebro.broker.getvalue() / config.initial_cash - 1) * 100:.2f}%")
+        print(f"最终资金: {backtest.get_final_value():.2f}")
+        print(f"绝对收益: {backtest.get_final_value() - config.initial_cash:.2f}")
+        print(f"收益率: {(backtest.get_final_value() / config.initial_cash - 1) * 100:.2f}%")
         
         if hasattr(strategy, 'num_trades'):
             print(f"套利交易次数: {strategy.num_trades}")
@@ -75,30 +83,149 @@ def run_backtest_for_date(start_date, end_date):
     print("="*50 + "\n")
     return strategy, backtest
 
-def main():
+def summarize_result(start_date, end_date, strategy, backtest, duration, initial_cash):
+    """把单个日期范围的回测结果整理为可跨进程传递的字典"""
+    summary = {
+        'start_date': start_date,
+        'end_date': end_date,
+        'ok': strategy is not None and backtest is not None,
+        'duration': duration,
+        'pid': os.getpid(),
+    }
+    if summary['ok']:
+        final_value = backtest.get_final_value()
+        summary.update({
+            'final_value': final_value,
+            'profit': final_value - initial_cash,
+            'profit_pct': (final_value / initial_cash - 1) * 100,
+            'num_trades': getattr(strategy, 'num_trades', 0),
+            'total_arb_profit': getattr(strategy, 'total_profit', 0.0),
+        })
+        if getattr(strategy, 'latency', None) is not None:
+            # 直方图以字典形式跨进程传回，在主进程中合并
+            summary['latency'] = strategy.latency.to_dict()
+    return summary
+
+def estimate_date_cost(start_date, end_date, base_config=None):
+    """以数据目录的总字节数估算回测耗时，用于调度排序"""
+    config = make_date_config(start_date, end_date, base_config)
+    if config.data_format == 'parquet':
+        pattern = os.path.join(config.store_dir, config.interval, '*', '*.parquet')
+        days = {day.strftime('%Y-%m-%d') for day in MarketStore.date_range(start_date, end_date)}
+        files = [f for f in glob.glob(pattern) if os.path.splitext(os.path.basename(f))[0] in days]
+    else:
+        files = glob.glob(os.path.join(config.specific_data_dir, '*.csv'))
+    return sum(os.path.getsize(f) for f in files)
+
+def _init_worker(max_mem_gb):
+    """进程池工作进程初始化: 设置单进程内存上限"""
+    if max_mem_gb:
+        limit_memory(max_mem_gb)
+
+def _run_date_worker(start_date, end_date, base_config=None):
+    """在工作进程中回测一个日期范围，日志写入该日期独立的日志文件"""
+    config = make_date_config(start_date, end_date, base_config)
+    log_file = setup_logging(f"{start_date}_pid{os.getpid()}", reset_handlers=True)
+    logging.info(f"处理日期范围: {start_date} 至 {end_date}")
+    logging.info(f"数据目录: {config.specific_data_dir}")
+    
+    start_time = time.time()
+    strategy, backtest = run_backtest(config)
+    summary = summarize_result(start_date, end_date, strategy, backtest, time.time() - start_time, config.initial_cash)
+    summary['log_file'] = log_file
+    return summary
+
+def run_batch_parallel(date_ranges, workers=None, max_mem_gb=None, base_config=None):
+    """用进程池并行回测多个日期范围
+    
+    Args:
+        date_ranges: [(起始日期, 结束日期), ...]
+        workers: 工作进程数，None表示CPU核数
+        max_mem_gb: 每个工作进程的内存上限(GB)，None表示不限制
+        base_config: 各日期回测共用的基础配置，None表示默认配置
+        
+    Returns:
+        list: 各日期范围的结果字典，按日期排序
+    """
+    workers = workers or os.cpu_count()
+    # 数据量大的日期先调度，缩短整体完成时间
+    ordered = sorted(date_ranges, key=lambda d: estimate_date_cost(*d, base_config), reverse=True)
+    print(f"使用 {workers} 个进程并行回测 {len(ordered)} 个日期范围")
+    
+    summaries = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(max_mem_gb,)) as executor:
+        futures = {executor.submit(_run_date_worker, start, end, base_config): (start, end) for start, end in ordered}
+        for future in as_completed(futures):
+            start_date, end_date = futures[future]
+            try:
+                summary = future.result()
+            except Exception as e:
+                # 工作进程崩溃(如超出内存上限)时记录为失败
+                summary = {'start_date': start_date, 'end_date': end_date, 'ok': False, 'error': str(e)}
+            summaries.append(summary)
+            status = "完成" if summary['ok'] else "失败"
+            print(f"[{len(summaries)}/{len(ordered)}] {start_date} 至 {end_date} {status}"
+                  + (f", 耗时 {summary['duration']:.1f} 秒" if 'duration' in summary else ""))
+    
+    return sorted(summaries, key=lambda s: (s['start_date'], s['end_date']))
+
+def merge_latency(summaries):
+    """合并各日期回测的每根K线耗时直方图"""
+    merged = LatencyHistogram()
+    for summary in summaries:
+        if summary.get('latency'):
+            merged.merge(LatencyHistogram.from_dict(summary['latency']))
+    return merged
+
+def print_batch_summary(summaries):
+    """打印所有日期范围的汇总结果"""
+    succeeded = [s for s in summaries if s['ok']]
+    print("\n=========== 全部回测结果汇总 ===========")
+    for s in summaries:
+        if s['ok']:
+            print(f"{s['start_date']} 至 {s['end_date']}: 收益 {s['profit']:.2f} ({s['profit_pct']:.2f}%), 交易 {s['num_trades']} 次")
+        else:
+            print(f"{s['start_date']} 至 {s['end_date']}: 回测失败 {s.get('error', '')}")
+    if succeeded:
+        total_profit = sum(s['profit'] for s in succeeded)
+        total_trades = sum(s['num_trades'] for s in succeeded)
+        mean_pct = sum(s['profit_pct'] for s in succeeded) / len(succeeded)
+        print("-----------------------------------------")
+        print(f"成功 {len(succeeded)}/{len(summaries)} 个, 总收益 {total_profit:.2f}, "
+              f"平均收益率 {mean_pct:.2f}%, 总交易 {total_trades} 次")
+        print(f"各回测累计耗时: {sum(s['duration'] for s in succeeded):.1f} 秒")
+        latency = merge_latency(succeeded)
+        if latency.count:
+            print(f"每根K线处理耗时(全部回测合并): {latency.format_summary()}")
+    print("=========================================\n")
+
+def main(config=None):
     # 创建基础配置
-    bas_config = ArbConfig()
+    bas_config = config or ArbConfig()
     date_ranges = bas_config.batch_test_dates
     print(f"将对{len(date_ranges)}个日期范围进行回测")
-
-    # 存储所有回测结果
-    results = {}
     
-    # 执行每个日期的回测
-    for start_date, end_date in date_ranges:
-        strategy, backtest = run_backtest_for_date(start_date, end_date)
-        if backtest is not None:
-            results[(start_date, end_date)] = (strategy, backtest)
+    start_time = time.time()
+    if bas_config.batch_workers != 1:
+        summaries = run_batch_parallel(
+            date_ranges,
+            workers=bas_config.batch_workers or None,
+            max_mem_gb=bas_config.batch_worker_memory_gb,
+            base_config=bas_config
+        )
+    else:
+        limit_memory(bas_config.batch_worker_memory_gb)
+        summaries = []
+        # 执行每个日期的回测
+        for start_date, end_date in date_ranges:
+            task_start = time.time()
+            strategy, backtest = run_backtest_for_date(start_date, end_date, bas_config)
+            summaries.append(summarize_result(start_date, end_date, strategy, backtest,
+                                              time.time() - task_start, bas_config.initial_cash))
+    
     # 显示所有结果的汇总
-    if len(results) > 0:
-        print("\n=========== 全部回测结果汇总 ===========")
-        for (start_date, end_date), (strategy, backtest) in results.items():
-            if backtest is not None:
-                profit = backtest.cerebro.broker.getvalue() - bas_config.initial_cash
-                profit_pct = (profit / bas_config.initial_cash) * 100
-                num_trades = getattr(strategy, 'num_trades', 0)
-                print(f"{start_date} 至 {end_date}: 收益 {profit:.2f} ({profit_pct:.2f}%), 交易 {num_trades} 次")
-        print("=========================================\n")
+    print_batch_summary(summaries)
+    print(f"批量回测总耗时: {time.time() - start_time:.1f} 秒")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
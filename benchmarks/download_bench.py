@@ -0,0 +1,355 @@
+"""下载器的本地检查和基准
+
+    python benchmarks/download_bench.py
+    python benchmarks/download_bench.py --symbols 40 --days 3 --latency 0.05 --workers 1 4 8 16
+
+在本地启动一个模拟data.binance.vision的HTTP服务器，提供按固定种子生成的日K线压缩包和
+.CHECKSUM文件，每个请求固定延迟latency秒模拟网络往返，可以按路径注入故障状态码。
+
+检查:
+1. 批量下载: 每个 (交易对, 日期) 只请求一次，写出的CSV与压缩包内容一致
+2. 404: fetch_archive立即返回，不重试；发布已久的日期记为没有数据，近期的日期不记录
+3. 429/5xx: 先返回限流或服务端错误，fetch_archive退避重试后成功；重试耗尽时返回None
+4. 校验: 第一次返回损坏的压缩包，download_daily_data重新下载后通过校验
+5. 限速: 设置rate_limit时服务器收到的请求间隔不小于 1/rate 秒
+6. 续传: 某一天持续503时不写CSV，重新运行只请求这一天，之后写出CSV；
+   404的日期写入空分区，重新运行时不再请求
+
+基准: 不同workers下batch_download_symbols的耗时。任何一项检查失败时以非零状态退出。
+"""
+import os
+import io
+import sys
+import time
+import shutil
+import hashlib
+import logging
+import zipfile
+import argparse
+import tempfile
+import threading
+import contextlib
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 基准只关心耗时，关闭下载进度条
+os.environ.setdefault('TQDM_DISABLE', '1')
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+import numpy as np
+import pandas as pd
+
+from fetch_data_from_Binance import (PUBLISH_LAG_DAYS, RateLimiter, batch_download_symbols, create_session,
+                                     download_daily_data, fetch_archive)
+from market_store import MarketStore
+
+INTERVAL = '1s'
+START_DATE = '2025-04-07'
+SEED = 0
+
+
+def kline_archive(symbol: str, day: str, rows: int, rng: np.random.Generator) -> tuple:
+    """生成一天的K线压缩包，格式与Binance一致(无表头的CSV，12列)
+
+    Returns:
+        tuple: (压缩包文件名, 压缩包内容)
+    """
+    start = int(datetime.strptime(day, '%Y-%m-%d').timestamp() * 1000) + 8 * 3_600_000
+    ts = start + np.arange(rows, dtype=np.int64) * 1000
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 1e-4, rows)))
+    volume = rng.exponential(10.0, rows)
+    lines = [f"{t},{c:.8f},{c:.8f},{c:.8f},{c:.8f},{v:.8f},{t + 999},{v * c:.8f},{n},{v / 2:.8f},{v * c / 2:.8f},0"
+             for t, c, v, n in zip(ts.tolist(), close.tolist(), volume.tolist(), rng.poisson(20, rows).tolist())]
+    name = f"{symbol}-{INTERVAL}-{day}"
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(f"{name}.csv", "\n".join(lines) + "\n")
+    return f"{name}.zip", buffer.getvalue()
+
+
+class FixtureServer:
+    """本地压缩包服务器
+
+    files为 URL路径 -> 内容；faults为 URL路径 -> 依次返回的故障状态码列表，用完后正常返回；
+    corrupt中的路径第一次返回损坏的内容。hits记录每个路径的请求次数，times记录所有请求的到达时间。
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.files = {}
+        self.faults = defaultdict(list)
+        self.corrupt = set()
+        self.hits = Counter()
+        self.times = []
+        self._lock = threading.Lock()
+        self._server = None
+
+    def add_day(self, symbol: str, day: str, rows: int, rng: np.random.Generator) -> bytes:
+        """加入一天的压缩包和对应的 .CHECKSUM 文件，返回压缩包内容"""
+        name, content = kline_archive(symbol, day, rows, rng)
+        path = f"/data/spot/daily/klines/{symbol}/{INTERVAL}/{name}"
+        self.files[path] = content
+        self.files[path + '.CHECKSUM'] = f"{hashlib.sha256(content).hexdigest()}  {name}\n".encode()
+        return content
+
+    @staticmethod
+    def archive_path(symbol: str, day: str) -> str:
+        return f"/data/spot/daily/klines/{symbol}/{INTERVAL}/{symbol}-{INTERVAL}-{day}.zip"
+
+    def reset_counters(self):
+        with self._lock:
+            self.hits.clear()
+            self.times.clear()
+
+    def _respond(self, path: str) -> tuple:
+        with self._lock:
+            self.hits[path] += 1
+            self.times.append(time.monotonic())
+            if self.faults[path]:
+                return self.faults[path].pop(0), b''
+            if path in self.corrupt:
+                self.corrupt.discard(path)
+                return 200, b'corrupted'
+        if path not in self.files:
+            return 404, b''
+        return 200, self.files[path]
+
+    def start(self) -> str:
+        fixture = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                if fixture.latency:
+                    time.sleep(fixture.latency)
+                status, body = fixture._respond(self.path)
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def run_batch(base_url: str, work_dir: str, symbols: list, days: list, workers: int, rate_limit=None,
+              verify_checksum: bool = True) -> tuple:
+    """运行一次batch_download_symbols，返回 (成功列表, 失败列表, 输出目录)"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return batch_download_symbols(
+            [symbol.replace('USDT', '/USDT') for symbol in symbols], interval=INTERVAL,
+            start_date=days[0], end_date=days[-1], base_dir=work_dir, workers=workers, rate_limit=rate_limit,
+            base_url=base_url, cache_dir=os.path.join(work_dir, 'cache'), verify_checksum=verify_checksum
+        )
+
+
+class Checks:
+    """收集检查结果"""
+
+    def __init__(self):
+        self.failures = 0
+
+    def check(self, name: str, ok: bool, detail: str = ''):
+        self.failures += not ok
+        print(f"{'OK  ' if ok else 'FAIL'} {name}{': ' + detail if detail else ''}")
+
+
+def check_batch(server: FixtureServer, base_url: str, work_dir: str, symbols: list, days: list, checks: Checks):
+    server.reset_counters()
+    success, failed, out_dir = run_batch(base_url, work_dir, symbols, days, workers=4)
+    archives = [server.archive_path(symbol, day) for symbol in symbols for day in days]
+    checks.check("批量下载全部成功", len(success) == len(symbols) and not failed, f"{len(success)}/{len(symbols)}")
+    checks.check("每个压缩包只请求一次", all(server.hits[path] == 1 for path in archives))
+
+    symbol = symbols[0]
+    df = pd.read_csv(os.path.join(out_dir, f"{symbol.replace('USDT', '_USDT')}.csv"))
+    expected = sum(len(zipfile.ZipFile(io.BytesIO(server.files[server.archive_path(symbol, day)]))
+                       .read(f"{symbol}-{INTERVAL}-{day}.csv").splitlines()) for day in days)
+    checks.check("CSV行数与压缩包一致", len(df) == expected, f"{len(df)} 行")
+
+
+def check_fetch_paths(server: FixtureServer, base_url: str, symbols: list, days: list, checks: Checks):
+    session = create_session(1)
+    missing = server.archive_path(symbols[0], '2020-01-01')
+    server.reset_counters()
+    checks.check("404返回空内容", fetch_archive(session, base_url + missing, retries=3, backoff=0.01) == b'')
+    checks.check("404不重试", server.hits[missing] == 1, f"{server.hits[missing]} 次请求")
+    df = download_daily_data(symbols[0], INTERVAL, datetime(2020, 1, 1), session, base_url=base_url)
+    checks.check("早已发布的日期404返回空表", df is not None and len(df) == 0)
+    recent = datetime.combine(datetime.utcnow().date(), datetime.min.time()) - timedelta(days=PUBLISH_LAG_DAYS - 1)
+    df = download_daily_data(symbols[0], INTERVAL, recent, session, base_url=base_url)
+    checks.check("近期日期404返回None", df is None)
+
+    path = server.archive_path(symbols[0], days[0])
+    for status in (429, 500, 502, 503):
+        server.faults[path] = [status, status]
+        server.reset_counters()
+        content = fetch_archive(session, base_url + path, retries=3, backoff=0.01)
+        checks.check(f"{status}后重试成功", content == server.files[path] and server.hits[path] == 3,
+                     f"{server.hits[path]} 次请求")
+
+    server.faults[path] = [503] * 4
+    server.reset_counters()
+    start = time.perf_counter()
+    content = fetch_archive(session, base_url + path, retries=3, backoff=0.01)
+    elapsed = time.perf_counter() - start
+    checks.check("重试耗尽返回None", content is None and server.hits[path] == 4, f"{server.hits[path]} 次请求")
+    checks.check("指数退避", elapsed >= 0.01 + 0.02 + 0.04, f"{elapsed * 1000:.0f} 毫秒")
+    server.faults[path] = []
+
+    server.corrupt.add(path)
+    server.reset_counters()
+    df = download_daily_data(symbols[0], INTERVAL, datetime.strptime(days[0], '%Y-%m-%d'), session,
+                             base_url=base_url)
+    checks.check("校验失败后重新下载", df is not None and len(df) > 0 and server.hits[path] == 2,
+                 f"{server.hits[path]} 次请求")
+    session.close()
+
+
+def check_rate_limit(server: FixtureServer, base_url: str, work_dir: str, symbols: list, days: list,
+                     checks: Checks, rate: float = 50.0):
+    server.reset_counters()
+    start = time.perf_counter()
+    run_batch(base_url, work_dir, symbols, days, workers=8, rate_limit=rate, verify_checksum=False)
+    elapsed = time.perf_counter() - start
+    gaps = np.diff(sorted(server.times))
+    # 请求在限速器放行后才发出，到达服务器的间隔会有少量抖动
+    checks.check(f"限速 {rate:.0f}/秒", len(gaps) > 0 and np.median(gaps) >= 0.9 / rate
+                 and elapsed >= (len(server.times) - 1) / rate,
+                 f"{len(server.times)} 次请求, 耗时 {elapsed:.2f} 秒, 间隔中位数 {np.median(gaps) * 1000:.1f} 毫秒")
+
+    # RateLimiter本身: 多个线程同时等待时按 1/rate 的时间片依次放行(线程唤醒有抖动，比较总跨度和间隔中位数)
+    limiter = RateLimiter(rate)
+    stamps = []
+    threads = [threading.Thread(target=lambda: [limiter.wait() or stamps.append(time.monotonic())
+                                                for _ in range(5)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stamps.sort()
+    gaps = np.diff(stamps)
+    checks.check("RateLimiter多线程间隔", stamps[-1] - stamps[0] >= 0.95 * len(gaps) / rate
+                 and np.median(gaps) >= 0.9 / rate,
+                 f"{len(stamps)} 次放行, 间隔中位数 {np.median(gaps) * 1000:.1f} 毫秒")
+
+
+@contextlib.contextmanager
+def patched_backoff(backoff: float):
+    """缩短fetch_archive的默认退避时间，持续故障的检查不必等待真实的退避"""
+    import fetch_data_from_Binance
+    defaults = fetch_data_from_Binance.fetch_archive.__defaults__
+    fetch_data_from_Binance.fetch_archive.__defaults__ = (None, 3, backoff)
+    try:
+        yield
+    finally:
+        fetch_data_from_Binance.fetch_archive.__defaults__ = defaults
+
+
+def check_resume(server: FixtureServer, base_url: str, work_dir: str, symbols: list, days: list, checks: Checks):
+    store = MarketStore(os.path.join(work_dir, 'cache'), INTERVAL)
+    out_dir = os.path.join(work_dir, f"{INTERVAL}_{days[0].replace('-', '')}_{days[-1].replace('-', '')}")
+    csv_file = lambda pair: os.path.join(out_dir, f"{pair}.csv")
+    flaky, gappy, empty = [symbol.replace('USDT', '_USDT') for symbol in symbols[:3]]
+    flaky_path = server.archive_path(symbols[0], days[-1])
+    server.faults[flaky_path] = [503] * 20
+    # gappy缺最后一天，empty所有日期都不存在
+    removed = {path: server.files.pop(path) for symbol in symbols[1:3] for day in days[-1 if symbol == symbols[1] else 0:]
+               for path in (server.archive_path(symbol, day), server.archive_path(symbol, day) + '.CHECKSUM')}
+
+    server.reset_counters()
+    with patched_backoff(0.001):
+        success, failed, _ = run_batch(base_url, work_dir, symbols[:3], days, workers=4)
+    checks.check("持续503时不写CSV", flaky in failed and not os.path.exists(csv_file(flaky))
+                 and not store.has_day(flaky, days[-1]))
+    checks.check("404的日期记为没有数据", gappy in success and store.has_day(gappy, days[-1])
+                 and os.path.exists(csv_file(gappy)))
+    checks.check("全部日期不存在时记为失败", empty in failed and not os.path.exists(csv_file(empty))
+                 and all(store.has_day(empty, day) for day in days))
+
+    server.faults[flaky_path] = []
+    server.reset_counters()
+    success, failed, _ = run_batch(base_url, work_dir, symbols[:3], days, workers=4)
+    flaky_hits = {path for path in server.hits if f"/{symbols[0]}/" in path}
+    checks.check("重新运行只请求失败的日期", flaky_hits <= {flaky_path, flaky_path + '.CHECKSUM'}
+                 and server.hits[flaky_path] == 1, f"{sorted(flaky_hits)}")
+    checks.check("补齐后写出CSV", flaky in success and os.path.exists(csv_file(flaky)))
+    checks.check("没有数据的日期不再请求", not any(f"/{symbol}/" in path for symbol in symbols[1:3] for path in server.hits),
+                 f"{sum(server.hits.values())} 次请求")
+    server.files.update(removed)
+
+
+def bench_workers(server: FixtureServer, base_url: str, root: str, symbols: list, days: list, workers: list) -> dict:
+    """不同workers下从空缓存批量下载的耗时"""
+    timings = {}
+    for count in workers:
+        work_dir = os.path.join(root, f"bench_{count}")
+        start = time.perf_counter()
+        success, _, _ = run_batch(base_url, work_dir, symbols, days, workers=count)
+        timings[count] = time.perf_counter() - start
+        shutil.rmtree(work_dir)
+        if len(success) != len(symbols):
+            raise RuntimeError(f"workers={count} 下载失败")
+    return timings
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="下载器的本地检查和基准")
+    parser.add_argument('--symbols', type=int, default=20)
+    parser.add_argument('--days', type=int, default=3)
+    parser.add_argument('--rows', type=int, default=3600, help="每天的K线数")
+    parser.add_argument('--latency', type=float, default=0.02, help="每个请求的模拟网络往返(秒)")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8])
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.CRITICAL)
+    rng = np.random.default_rng(SEED)
+    symbols = [f"SYN{i:03d}USDT" for i in range(args.symbols)]
+    first = datetime.strptime(START_DATE, '%Y-%m-%d')
+    days = [(first + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(args.days)]
+
+    server = FixtureServer(args.latency)
+    for symbol in symbols:
+        for day in days:
+            server.add_day(symbol, day, args.rows, rng)
+    base_url = server.start()
+    checks = Checks()
+    try:
+        with tempfile.TemporaryDirectory(prefix='arb_download_') as root:
+            check_batch(server, base_url, os.path.join(root, 'batch'), symbols, days, checks)
+            check_fetch_paths(server, base_url, symbols, days, checks)
+            check_rate_limit(server, base_url, os.path.join(root, 'rate'), symbols[:5], days, checks)
+            check_resume(server, base_url, os.path.join(root, 'resume'), symbols, days, checks)
+
+            num_files = len(symbols) * len(days)
+            print(f"\n{len(symbols)} 个交易对 × {len(days)} 天, 每个请求延迟 {args.latency * 1000:.0f} 毫秒:")
+            timings = bench_workers(server, base_url, root, symbols, days, args.workers)
+            for count, seconds in timings.items():
+                print(f"  workers={count:<3} {seconds:>7.2f} 秒  {num_files / seconds:>7.1f} 文件/秒  "
+                      f"加速 {timings[args.workers[0]] / seconds:.1f}x")
+    finally:
+        server.stop()
+
+    if checks.failures:
+        print(f"\n{checks.failures} 项检查失败")
+        return 1
+    print("\n所有检查通过")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""回测引擎一致性检查
+
+    python benchmarks/parity.py                     # 默认每个交易对每秒缺失一半的K线
+    python benchmarks/parity.py --gap-rate 0.2 --seconds 3600
+
+在带缺口的合成行情上以相同配置运行各回测引擎，比较交易次数、套利收益和逐笔交易的
+时间与路径(参数扫描只有交易次数和收益)。交易对在某一秒没有K线时数据源停留在上一根K线，各引擎的当前时间、跳过
+时间和价格年龄都必须由所有交易对中最新的K线决定，结果应完全一致。
+
+场景:
+1. all_pairs: 数据目录中的全部交易对
+2. subset: 只选部分交易对(回放引擎的memmap缓存按整个数据目录构建)
+3. triangle: 只选一个三角，缓存矩阵中大量时间点只有未选的交易对有K线
+4. max_age_1 / max_age_3: 设置价格年龄上限(loop评估方式改用vectorized)
+5. four_legs: 3到4腿的路径
+
+各场景都包含开启cycle_detection(每根K线先做负权环检测)的运行，结果应与不检测时相同。
+
+任何一项与第一个引擎不一致时以非零状态退出。
+"""
+import os
+import sys
+import logging
+import argparse
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+from synthetic_market import synthetic_pairs, generate_market
+
+# (名称, 覆盖的配置)，第一个为参照
+ENGINES = (
+    ('backtrader', dict(engine='backtrader', data_feed='pandas')),
+    ('backtrader_stream', dict(engine='backtrader', data_feed='stream')),
+    ('backtrader_loop', dict(engine='backtrader', eval_mode='loop')),
+    ('replay', dict(engine='replay', matrix_cache=False)),
+    ('replay_incremental', dict(engine='replay', eval_mode='incremental')),
+    ('replay_cycle', dict(engine='replay', cycle_detection=True)),
+    ('backtrader_cycle', dict(engine='backtrader', eval_mode='incremental', cycle_detection=True)),
+    ('replay_cached', dict(engine='replay', matrix_cache=True)),
+    ('daily', dict(engine='daily')),
+    ('sweep', dict(engine='sweep', matrix_cache=True)),
+)
+# 收益的相对容差: 流式数据源用Arrow解析CSV，浮点数可能有最后一位的差别
+PROFIT_RTOL = 1e-9
+SEED = 0
+
+
+def scenarios(market: dict) -> list:
+    """(名称, 交易对列表, 覆盖的配置)"""
+    currencies = {'USDT'} | set(market['currencies'][:len(market['currencies']) // 2])
+    subset = [pair for pair in market['pairs'] if set(pair.split('_')) <= currencies]
+    # 第一个套利窗口的交叉盘和它的两条USDT腿
+    base, quote = market['windows'][0]['pair'].split('_')
+    triangle = [market['windows'][0]['pair'], f"{base}_USDT", f"{quote}_USDT"]
+    return [
+        ('all_pairs', market['pairs'], {}),
+        ('subset', subset, {}),
+        ('triangle', triangle, {}),
+        ('max_age_1', market['pairs'], {'max_price_age': 1}),
+        ('max_age_3', subset, {'max_price_age': 3}),
+        ('four_legs', subset, {'max_path_legs': 4}),
+    ]
+
+
+def run_engine(market: dict, data_dir: str, pairs: list, overrides: dict) -> dict:
+    """运行一次回测，返回交易次数、收益和逐笔交易(毫秒时间戳, 基础货币, 路径id)
+
+    engine为'sweep'时以单组参数运行param_sweep，没有逐笔交易。
+    """
+    from configs.ArbConfig import ArbConfig
+    from backtest import run_backtest
+    from param_sweep import run_sweep
+    from trade_sink import read_trades, datetime_to_ms
+
+    config = ArbConfig()
+    config.specific_data_dir = data_dir
+    config.selected_pairs = pairs
+    config.start_date = market['start_date']
+    config.end_date = market['end_date']
+    config.threshold = 0.001
+    config.path_cache = False
+    config.download_data = False
+    config.results_catalog = ''
+    for key, value in overrides.items():
+        setattr(config, key, value)
+
+    if config.engine == 'sweep':
+        results = run_sweep(config, {}, save=False)
+        if results is None:
+            raise RuntimeError(f"参数扫描失败: {overrides}")
+        row = results.iloc[0]
+        return {'num_trades': int(row['triangle_arb_trades']), 'profit': float(row['total_arb_profit']),
+                'trades': None}
+
+    strategy, _ = run_backtest(config)
+    if strategy is None:
+        raise RuntimeError(f"回测失败: {overrides}")
+    trades = []
+    for ledger in strategy.ledgers:
+        for file_path in ledger.trade_files:
+            df = read_trades(file_path, with_paths=False)
+            trades += [(datetime_to_ms(dt), ledger.base_currency, int(path_id))
+                       for dt, path_id in zip(df['datetime'].dt.to_pydatetime(), df['path_id'])]
+    return {'num_trades': strategy.num_trades, 'profit': strategy.total_profit, 'trades': trades}
+
+
+def differences(result: dict, reference: dict) -> list:
+    """与参照结果的差别"""
+    diffs = []
+    if result['num_trades'] != reference['num_trades']:
+        diffs.append(f"交易次数 {result['num_trades']} != {reference['num_trades']}")
+    if abs(result['profit'] - reference['profit']) > PROFIT_RTOL * max(1.0, abs(reference['profit'])):
+        diffs.append(f"收益 {result['profit']:.9f} != {reference['profit']:.9f}")
+    if result['trades'] is None:
+        return diffs
+    mismatched = [(got, want) for got, want in zip(result['trades'], reference['trades']) if got != want]
+    if mismatched:
+        got, want = mismatched[0]
+        diffs.append(f"{len(mismatched)} 笔交易不同，第一笔 {got} != {want}")
+    return diffs
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="回测引擎一致性检查")
+    parser.add_argument('--currencies', type=int, default=12)
+    parser.add_argument('--pairs', type=int, default=30)
+    parser.add_argument('--seconds', type=int, default=1800)
+    parser.add_argument('--gap-rate', type=float, default=0.5, help="每个交易对每秒缺失K线的概率")
+    parser.add_argument('--windows', type=int, default=40, help="注入的套利窗口数")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    failures = 0
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='arb_parity_') as work_dir:
+        data_dir = os.path.join(work_dir, 'data')
+        pairs = synthetic_pairs(args.currencies, args.pairs, SEED)
+        market = generate_market(data_dir, pairs, args.seconds, SEED, arb_windows=args.windows,
+                                 gap_rate=args.gap_rate)
+        # 回测会写出结果、路径、交易记录和检查点，全部放在临时目录
+        os.chdir(work_dir)
+        try:
+            for scenario, scenario_pairs, scenario_overrides in scenarios(market):
+                reference = None
+                for name, overrides in ENGINES:
+                    result = run_engine(market, data_dir, scenario_pairs, {**overrides, **scenario_overrides})
+                    diffs = differences(result, reference) if reference else []
+                    reference = reference or result
+                    failures += bool(diffs)
+                    status = '; '.join(diffs) if diffs else 'OK'
+                    print(f"{scenario:<12} {name:<20} {result['num_trades']:>6} 笔 "
+                          f"{result['profit']:>16.9f}  {status}")
+        finally:
+            os.chdir(cwd)
+
+    if failures:
+        print(f"\n{failures} 项与 {ENGINES[0][0]} 不一致")
+        return 1
+    print(f"\n所有引擎结果一致(缺失率 {args.gap_rate:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""启动开销检查
+
+    python benchmarks/startup.py
+
+1. `cli.py --help` 的耗时不超过 STARTUP_BUDGET_MS，且解析配置时不导入重型依赖
+2. 导入任何项目模块都没有副作用: 不创建文件或目录、不修改内存限制、不配置root日志
+
+任何一项不满足时以非零状态退出。
+"""
+import os
+import sys
+import json
+import time
+import statistics
+import subprocess
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# cli.py --help 的耗时上限(毫秒，取多次运行的中位数)
+STARTUP_BUDGET_MS = 300
+STARTUP_RUNS = 5
+# CLI启动和解析配置时不应加载的模块
+HEAVY_MODULES = ('numpy', 'pandas', 'pyarrow', 'backtrader', 'matplotlib', 'requests')
+# 检查导入副作用的项目模块
+PROJECT_MODULES = (
+    'cli', 'configs.ArbConfig', 'utils', 'path_set', 'path_cache', 'cycle_discovery', 'path_engine',
+    'price_matrix', 'pair_stats', 'market_store', 'latency', 'trade_sink', 'phase_profiler', 'stream_feed', 'results_catalog', 'DataManager', 'tri_arb', 'backtest', 'fast_backtest', 'day_backtest',
+    'param_sweep', 'data_process', 'fetch_data_from_Binance', 'run_backtest', 'batch_backtest',
+)
+
+_PROBE = """
+import json, logging, os, sys
+sys.path.insert(0, {repo!r})
+try:
+    import resource
+    limit_before = resource.getrlimit(resource.RLIMIT_AS)
+except ImportError:
+    resource = None
+__import__({module!r})
+print(json.dumps({{
+    'files': sorted(os.listdir('.')),
+    'rlimit_changed': bool(resource) and resource.getrlimit(resource.RLIMIT_AS) != limit_before,
+    'root_handlers': len(logging.getLogger().handlers),
+}}))
+"""
+
+_CLI_PROBE = """
+import json, sys
+sys.path.insert(0, {repo!r})
+import cli
+cli.load_config(cli.build_parser().parse_args(['backtest', '--set', 'engine=replay']))
+print(json.dumps(sorted(name for name in {heavy!r} if name in sys.modules)))
+"""
+
+
+def time_cli_help() -> float:
+    """cli.py --help 的中位耗时(毫秒)"""
+    timings = []
+    for _ in range(STARTUP_RUNS):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(REPO_DIR, 'cli.py'), '--help'],
+                       check=True, stdout=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def check_module(module: str) -> list:
+    """在空的临时目录中导入模块，返回发现的副作用描述"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        result = subprocess.run([sys.executable, '-c', _PROBE.format(repo=REPO_DIR, module=module)],
+                                cwd=work_dir, capture_output=True, text=True)
+    if result.returncode != 0:
+        return [f"导入失败: {result.stderr.strip().splitlines()[-1] if result.stderr.strip() else result.returncode}"]
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+    problems = []
+    if probe['files']:
+        problems.append(f"创建了 {probe['files']}")
+    if probe['rlimit_changed']:
+        problems.append("修改了内存限制")
+    if probe['root_handlers']:
+        problems.append("配置了root日志")
+    return problems
+
+
+def main() -> int:
+    failures = []
+
+    help_ms = time_cli_help()
+    print(f"cli.py --help: {help_ms:.0f} ms (上限 {STARTUP_BUDGET_MS} ms)")
+    if help_ms > STARTUP_BUDGET_MS:
+        failures.append(f"cli.py --help 耗时 {help_ms:.0f} ms 超出上限")
+
+    result = subprocess.run([sys.executable, '-c', _CLI_PROBE.format(repo=REPO_DIR, heavy=HEAVY_MODULES)],
+                            capture_output=True, text=True, check=True)
+    loaded = json.loads(result.stdout.strip().splitlines()[-1])
+    print(f"CLI解析配置时加载的重型模块: {loaded or '无'}")
+    if loaded:
+        failures.append(f"CLI启动加载了 {loaded}")
+
+    for module in PROJECT_MODULES:
+        problems = check_module(module)
+        print(f"import {module}: {'; '.join(problems) if problems else 'ok'}")
+        failures += [f"{module}: {problem}" for problem in problems]
+
+    if failures:
+        print("\n启动检查未通过:")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    print("\n启动检查通过")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+"""合成行情上的性能基准
+
+    python benchmarks/suite.py                      # small规模，与已保存的基线比较
+    python benchmarks/suite.py --preset large       # 更大的图和一整天的数据
+    python benchmarks/suite.py --save-baseline      # 把本次结果保存为基线
+
+基准项:
+1. 路径搜索: 不同规模的币种图上 find_arb_paths(3/4腿) 和 calculate_arb_paths(不用缓存) 的耗时，
+   以及每根K线负权环检测(NegativeCycleDetector)在没有/有套利环时的单次耗时
+2. 数据加载: DataManager.load_data 读取CSV并构建数据源的吞吐量(MB/s)
+3. 策略: 各回测引擎(含Backtrader流式数据源、回放引擎开启负权环检测)每秒处理的K线数(只计引擎运行阶段)
+4. 端到端: run_backtest 的总耗时
+
+所有数据由synthetic_market按固定种子生成，回测在临时目录中运行，不影响工作目录。
+基线按规模保存在 benchmarks/baselines/<preset>.json，基线与机器相关，应在同一台机器上比较；
+任何一项比基线慢超过 --tolerance 时以非零状态退出。
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+from synthetic_market import synthetic_pairs, generate_market
+
+BASELINES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+# 允许的相对变慢比例
+DEFAULT_TOLERANCE = 0.3
+
+# 规模: 回测行情(币种数, 交易对数, 秒数)和路径搜索的图规模[(币种数, 交易对数), ...]
+PRESETS = {
+    'small': dict(currencies=12, pairs=30, seconds=1800, graphs=[(20, 60), (50, 200), (100, 500)], repeat=3),
+    'large': dict(currencies=40, pairs=150, seconds=86400, graphs=[(50, 200), (150, 800), (300, 2000)], repeat=3),
+}
+# (名称, 回测引擎, Backtrader数据源, 覆盖的配置)
+ENGINES = (('backtrader', 'backtrader', 'pandas', {}), ('backtrader_stream', 'backtrader', 'stream', {}),
+           ('replay', 'replay', 'pandas', {}), ('replay_cycle', 'replay', 'pandas', {'cycle_detection': True}))
+# 负权环检测每次计时的调用次数
+CYCLE_CALLS = 20
+SEED = 0
+
+
+def metric(value: float, unit: str, better: str) -> dict:
+    """一项基准结果，better为'lower'或'higher'"""
+    return {'value': value, 'unit': unit, 'better': better}
+
+
+def best_of(func, repeat: int) -> float:
+    """多次运行取最短耗时(秒)"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def bench_path_discovery(preset: dict) -> dict:
+    from cycle_discovery import find_arb_paths
+    from tri_arb import calculate_arb_paths
+
+    results = {}
+    for num_currencies, num_pairs in preset['graphs']:
+        pairs = synthetic_pairs(num_currencies, num_pairs, SEED)
+        size = f"{num_currencies}c_{len(pairs)}p"
+        for legs in (3, 4):
+            seconds = best_of(lambda: find_arb_paths(pairs, 'USDT', max_legs=legs), preset['repeat'])
+            results[f"find_arb_paths.{size}.{legs}legs"] = metric(seconds, 's', 'lower')
+        seconds = best_of(lambda: calculate_arb_paths(pairs, 'USDT', save_to_file=False, use_cache=False),
+                          preset['repeat'])
+        results[f"calculate_arb_paths.{size}"] = metric(seconds, 's', 'lower')
+    return results
+
+
+def bench_cycle_detection(preset: dict) -> dict:
+    """公允价格(没有套利环)和一个交叉盘偏移1%(存在套利环)时单次检测的耗时"""
+    import numpy as np
+    from cycle_discovery import NegativeCycleDetector
+
+    results = {}
+    for num_currencies, num_pairs in preset['graphs']:
+        pairs = synthetic_pairs(num_currencies, num_pairs, SEED)
+        size = f"{num_currencies}c_{len(pairs)}p"
+        rng = np.random.default_rng(SEED)
+        value = {currency: 10 ** rng.uniform(-3, 3) for pair in pairs for currency in pair.split('_')}
+        value['USDT'] = 1.0
+        fair = np.array([value[pair.split('_')[0]] / value[pair.split('_')[1]] for pair in pairs])
+        hot = fair.copy()
+        hot[next(i for i, pair in enumerate(pairs) if not pair.endswith('_USDT'))] *= 1.01
+
+        detector = NegativeCycleDetector(pairs, pairs, fee=0.0005, threshold=0.001, max_legs=3)
+        for name, prices in (('no_cycle', fair), ('cycle', hot)):
+            seconds = best_of(lambda: [detector.find(prices) for _ in range(CYCLE_CALLS)], preset['repeat'])
+            results[f"cycle_detection.{size}.{name}"] = metric(seconds / CYCLE_CALLS * 1000, 'ms', 'lower')
+    return results
+
+
+def make_config(market: dict, data_dir: str, engine: str, data_feed: str = 'pandas'):
+    from configs.ArbConfig import ArbConfig
+
+    config = ArbConfig()
+    config.specific_data_dir = data_dir
+    config.selected_pairs = market['pairs']
+    config.start_date = market['start_date']
+    config.end_date = market['end_date']
+    config.engine = engine
+    config.data_feed = data_feed
+    # 注入的偏移大于阈值加三腿手续费，只在套利窗口内触发交易
+    config.threshold = 0.001
+    config.path_cache = False
+    config.matrix_cache = False
+    config.download_data = False
+    return config
+
+
+def bench_load_data(market: dict, data_dir: str, repeat: int) -> dict:
+    import backtrader as bt
+    from DataManager import DataManager
+
+    config = make_config(market, data_dir, 'backtrader')
+    seconds = best_of(lambda: DataManager(config).load_data(bt.Cerebro(), market['pairs'], data_dir), repeat)
+    rows = len(market['pairs']) * market['seconds']
+    return {
+        'load_data.mb_per_s': metric(market['total_bytes'] / 1e6 / seconds, 'MB/s', 'higher'),
+        'load_data.rows_per_s': metric(rows / seconds, 'rows/s', 'higher'),
+    }
+
+
+def bench_backtest(market: dict, data_dir: str) -> dict:
+    """每个引擎运行两次: 关闭分阶段计时测端到端耗时，开启后测每秒处理的K线数"""
+    from backtest import run_backtest
+
+    results = {}
+    for name, engine, data_feed, overrides in ENGINES:
+        config = make_config(market, data_dir, engine, data_feed)
+        for key, value in overrides.items():
+            setattr(config, key, value)
+        start = time.perf_counter()
+        strategy, _ = run_backtest(config)
+        elapsed = time.perf_counter() - start
+        if strategy is None:
+            raise RuntimeError(f"{name} 回测失败")
+        results[f"run_backtest.{name}"] = metric(elapsed, 's', 'lower')
+        results[f"run_backtest.{name}.trades"] = metric(strategy.num_trades, 'trades', None)
+
+        config.profile_phases = True
+        strategy, backtest = run_backtest(config)
+        phases = backtest.profiler.summary()['phases']
+        bars = phases['strategy.next']['calls']
+        results[f"strategy.{name}.bars_per_s"] = metric(bars / (phases['engine.run']['total_ms'] / 1000),
+                                                         'bars/s', 'higher')
+    return results
+
+
+def environment() -> dict:
+    import numpy as np
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def run_suite(preset_name: str) -> dict:
+    preset = PRESETS[preset_name]
+    metrics = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='arb_bench_') as work_dir:
+        data_dir = os.path.join(work_dir, 'data')
+        pairs = synthetic_pairs(preset['currencies'], preset['pairs'], SEED)
+        market = generate_market(data_dir, pairs, preset['seconds'], SEED)
+        # 回测会写出结果、路径和交易记录，全部放在临时目录
+        os.chdir(work_dir)
+        try:
+            metrics.update(bench_path_discovery(preset))
+            metrics.update(bench_cycle_detection(preset))
+            metrics.update(bench_load_data(market, data_dir, preset['repeat']))
+            metrics.update(bench_backtest(market, data_dir))
+        finally:
+            os.chdir(cwd)
+    return {
+        'preset': preset_name,
+        'market': {key: market[key] for key in ('seed', 'seconds', 'total_bytes')}
+                  | {'pairs': len(market['pairs']), 'currencies': len(market['currencies']),
+                     'windows': len(market['windows'])},
+        'environment': environment(),
+        'metrics': metrics,
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    """与基线比较，返回变慢超过tolerance的项"""
+    regressions = []
+    for name, current in result['metrics'].items():
+        base = baseline['metrics'].get(name)
+        if base is None or not current['better'] or not base['value']:
+            continue
+        if current['better'] == 'lower':
+            ratio = current['value'] / base['value']
+        else:
+            ratio = base['value'] / current['value']
+        if ratio > 1 + tolerance:
+            regressions.append(f"{name}: {current['value']:.4g} {current['unit']} "
+                               f"(基线 {base['value']:.4g}, 慢 {(ratio - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="合成行情上的性能基准")
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='small')
+    parser.add_argument('--save-baseline', action='store_true', help="保存为该规模的基线")
+    parser.add_argument('--baseline', help="基线文件，默认 baselines/<preset>.json")
+    parser.add_argument('--output', help="另存本次结果的JSON文件")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    result = run_suite(args.preset)
+    for name, item in result['metrics'].items():
+        print(f"{name:<50} {item['value']:>14.4g} {item['unit']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+
+    baseline_file = args.baseline or os.path.join(BASELINES_DIR, f"{args.preset}.json")
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(baseline_file), exist_ok=True)
+        with open(baseline_file, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        print(f"\n基线已保存到: {baseline_file}")
+        return 0
+
+    if not os.path.exists(baseline_file):
+        print(f"\n没有基线 {baseline_file}，使用 --save-baseline 保存")
+        return 0
+    with open(baseline_file, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare(result, baseline, args.tolerance)
+    if regressions:
+        print(f"\n相对基线({baseline['environment'].get('commit')})变慢:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print(f"\n与基线({baseline['environment'].get('commit')})相比没有超过 {args.tolerance:.0%} 的变慢")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+"""可复现的合成行情
+
+按固定种子生成 M 个币种、N 个交易对、T 秒的1s K线，文件格式与下载器输出的
+CSV一致(见fetch_data_from_Binance.append_csv_day)，可直接作为specific_data_dir回测。
+各币种的价格是独立的随机游走，交易对价格为两币种价格之比加微小噪声，扣除手续费后
+没有套利机会；再在若干随机时间窗口内把某个交叉盘的价格偏移arb_edge，注入已知的
+三角套利机会，窗口记录在输出目录的market.json中。gap_rate大于0时各交易对随机缺失
+一部分K线(第一根除外)，模拟成交稀疏的交易对。
+
+    python benchmarks/synthetic_market.py OUT_DIR --currencies 12 --pairs 30 --seconds 3600
+"""
+import os
+import sys
+import json
+import argparse
+import datetime
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+from market_store import CSV_COLUMN_MAP
+
+# 报价货币，按优先级排列: 两个报价货币之间的交易对以排在后面的为基础货币(如ETH_BTC)
+QUOTE_CURRENCIES = ('USDT', 'BTC', 'ETH', 'BNB', 'USDC', 'FDUSD', 'TRY', 'EUR')
+# 报价货币的初始价格(USDT)和每秒对数收益率标准差
+ANCHOR_PRICES = {'USDT': 1.0, 'BTC': 80000.0, 'ETH': 1600.0, 'BNB': 550.0, 'USDC': 1.0,
+                 'FDUSD': 1.0, 'TRY': 0.026, 'EUR': 1.08}
+STABLE_CURRENCIES = ('USDT', 'USDC', 'FDUSD')
+CURRENCY_VOLATILITY = 2e-4
+STABLE_VOLATILITY = 1e-6
+# 交易对价格相对公允价格的噪声，远小于三腿手续费，不产生套利机会
+PAIR_NOISE = 5e-5
+# 下载器CSV的列顺序
+CSV_COLUMNS = list(CSV_COLUMN_MAP) + ['Ignore', 'datetime_utc']
+
+
+def synthetic_currencies(num_currencies: int) -> list:
+    """币种列表: 先取报价货币，不足时补充 SYN001 这样的合成币种"""
+    if num_currencies < 3:
+        raise ValueError("至少需要3个币种")
+    quotes = list(QUOTE_CURRENCIES[:min(num_currencies, len(QUOTE_CURRENCIES))])
+    return quotes + [f"SYN{i:03d}" for i in range(1, num_currencies - len(quotes) + 1)]
+
+
+def synthetic_pairs(num_currencies: int, num_pairs: int, seed: int = 0) -> list:
+    """生成连通的交易对集合
+
+    每个币种都有对USDT的交易对，其余交易对随机选取基础货币和报价货币，
+    同一对币种只出现一个方向。
+
+    Args:
+        num_currencies: 币种数
+        num_pairs: 交易对数，不少于 num_currencies - 1，超过可能的最大值时取最大值
+        seed: 随机种子
+
+    Returns:
+        list: 排序后的下划线格式交易对
+    """
+    rng = np.random.default_rng(seed)
+    currencies = synthetic_currencies(num_currencies)
+    quotes = [c for c in currencies if c in QUOTE_CURRENCIES]
+    rank = {c: i for i, c in enumerate(currencies)}
+
+    pairs = {(c, 'USDT') for c in currencies[1:]}
+    if num_pairs < len(pairs):
+        raise ValueError(f"交易对数至少为 {len(pairs)}")
+    # 基础货币可以是任意币种，报价货币只能是排在它前面的报价货币
+    candidates = [(base, quote) for base in currencies for quote in quotes
+                  if rank[quote] < rank[base] and (base, quote) not in pairs]
+    extra = min(num_pairs - len(pairs), len(candidates))
+    for i in rng.choice(len(candidates), size=extra, replace=False):
+        pairs.add(candidates[i])
+    return sorted(f"{base}_{quote}" for base, quote in pairs)
+
+
+def currency_prices(currencies: list, seconds: int, rng: np.random.Generator) -> dict:
+    """各币种以USDT计的价格路径"""
+    prices = {}
+    for currency in currencies:
+        start = ANCHOR_PRICES.get(currency)
+        if start is None:
+            start = 10 ** rng.uniform(-3, 3)
+        volatility = STABLE_VOLATILITY if currency in STABLE_CURRENCIES else CURRENCY_VOLATILITY
+        prices[currency] = start * np.exp(np.cumsum(rng.normal(0, volatility, seconds)))
+    prices['USDT'][:] = 1.0
+    return prices
+
+
+def arb_window_pairs(pairs: list) -> list:
+    """可以注入套利机会的交叉盘: 两个币种都有对USDT的交易对"""
+    usdt = {pair.split('_')[0] for pair in pairs if pair.endswith('_USDT')}
+    return [pair for pair in pairs
+            if not pair.endswith('_USDT') and all(c in usdt for c in pair.split('_'))]
+
+
+def generate_market(out_dir: str, pairs: list, seconds: int, seed: int = 0, start_date: str = '2025-04-07',
+                    arb_windows: int = 10, window_seconds: int = 5, arb_edge: float = 0.004,
+                    gap_rate: float = 0.0) -> dict:
+    """生成合成行情并写出CSV
+
+    Args:
+        out_dir: 输出目录
+        pairs: 交易对列表(下划线格式)
+        seconds: 秒数
+        seed: 随机种子
+        start_date: 起始日期(UTC)，回测配置的start_date/end_date应覆盖这段时间
+        arb_windows: 注入的套利窗口数
+        window_seconds: 每个套利窗口的秒数
+        arb_edge: 窗口内交叉盘价格的相对偏移，应大于三腿手续费
+        gap_rate: 每个交易对每秒缺失K线的概率
+
+    Returns:
+        dict: 行情描述，同时写入 out_dir/market.json
+    """
+    rng = np.random.default_rng(seed)
+    currencies = sorted({c for pair in pairs for c in pair.split('_')})
+    prices = currency_prices(currencies, seconds, rng)
+
+    start_ms = int(datetime.datetime.strptime(start_date, '%Y-%m-%d')
+                   .replace(tzinfo=datetime.timezone.utc).timestamp() * 1000)
+    timestamps = start_ms + np.arange(seconds, dtype=np.int64) * 1000
+
+    windows = []
+    window_pairs = arb_window_pairs(pairs)
+    if window_pairs and arb_windows:
+        starts = np.sort(rng.choice(max(seconds - window_seconds, 1), size=arb_windows, replace=False))
+        for start in starts.tolist():
+            windows.append({
+                'pair': window_pairs[rng.integers(len(window_pairs))],
+                'start': start,
+                'end': min(start + window_seconds, seconds),
+                'edge': float(arb_edge * rng.choice([-1, 1])),
+            })
+    edge_by_pair = {}
+    for window in windows:
+        edge = edge_by_pair.setdefault(window['pair'], np.zeros(seconds))
+        edge[window['start']:window['end']] = window['edge']
+
+    # 缺口使用独立的随机数序列，gap_rate为0时生成的行情与不带缺口时完全相同
+    gap_rng = np.random.default_rng([seed, 1])
+    os.makedirs(out_dir, exist_ok=True)
+    total_bytes = 0
+    for pair in pairs:
+        base, quote = pair.split('_')
+        close = prices[base] / prices[quote] * (1 + rng.normal(0, PAIR_NOISE, seconds))
+        if pair in edge_by_pair:
+            close *= 1 + edge_by_pair[pair]
+        open_ = np.concatenate([close[:1], close[:-1]])
+        spread = np.abs(rng.normal(0, PAIR_NOISE, seconds))
+        volume = rng.exponential(10.0, seconds)
+        df = {
+            'timestamp': timestamps,
+            'Open': open_,
+            'High': np.maximum(open_, close) * (1 + spread),
+            'Low': np.minimum(open_, close) * (1 - spread),
+            'Close': close,
+            'Volume': volume,
+            'close_timestamp': timestamps + 999,
+            'Quote Asset Volume': volume * close,
+            'Number of Trades': rng.poisson(20, seconds),
+            'Taker Buy Base Asset Volume': volume / 2,
+            'Taker Buy Quote Asset Volume': volume * close / 2,
+            'Ignore': 0,
+        }
+        frame = pd.DataFrame(df)
+        frame['datetime_utc'] = pd.to_datetime(frame['timestamp'], unit='ms')
+        if gap_rate > 0:
+            keep = gap_rng.random(seconds) >= gap_rate
+            keep[0] = True
+            frame = frame[keep]
+        file_path = os.path.join(out_dir, f"{pair}.csv")
+        frame[CSV_COLUMNS].to_csv(file_path, index=False)
+        total_bytes += os.path.getsize(file_path)
+
+    end_date = datetime.datetime.fromtimestamp((start_ms + (seconds - 1) * 1000) / 1000,
+                                               tz=datetime.timezone.utc).strftime('%Y-%m-%d')
+    market = {
+        'seed': seed,
+        'pairs': list(pairs),
+        'currencies': currencies,
+        'seconds': seconds,
+        'start_date': start_date,
+        'end_date': end_date,
+        'arb_edge': arb_edge,
+        'gap_rate': gap_rate,
+        'windows': windows,
+        'total_bytes': total_bytes,
+    }
+    with open(os.path.join(out_dir, 'market.json'), 'w', encoding='utf-8') as f:
+        json.dump(market, f, indent=2)
+    return market
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成合成行情CSV")
+    parser.add_argument('out_dir')
+    parser.add_argument('--currencies', type=int, default=12)
+    parser.add_argument('--pairs', type=int, default=30)
+    parser.add_argument('--seconds', type=int, default=3600)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--start-date', default='2025-04-07')
+    parser.add_argument('--windows', type=int, default=10, help="注入的套利窗口数")
+    parser.add_argument('--edge', type=float, default=0.004, help="套利窗口内交叉盘的价格偏移")
+    parser.add_argument('--gap-rate', type=float, default=0.0, help="每个交易对每秒缺失K线的概率")
+    args = parser.parse_args(argv)
+
+    pairs = synthetic_pairs(args.currencies, args.pairs, args.seed)
+    market = generate_market(args.out_dir, pairs, args.seconds, args.seed, args.start_date,
+                             arb_windows=args.windows, arb_edge=args.edge, gap_rate=args.gap_rate)
+    print(f"{len(market['pairs'])} 个交易对, {len(market['currencies'])} 个币种, {args.seconds} 秒, "
+          f"{len(market['windows'])} 个套利窗口, {market['total_bytes'] / 1e6:.1f} MB -> {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
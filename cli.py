@@ -0,0 +1,142 @@
+"""三角套利回测的统一命令行入口
+
+    python cli.py download            按配置下载数据
+    python cli.py select              流动性分析并计算套利所需的交易对
+    python cli.py backtest            单次回测
+    python cli.py batch               批量回测config.batch_test_dates中的日期
+    python cli.py analyze             参数扫描
+    python cli.py runs                查询回测结果目录，如 --group-by threshold --base USDT
+
+所有子命令支持 --config 指定JSON配置文件，--set 覆盖单个配置字段(值按JSON解析，
+解析失败时作为字符串)，如 --set engine=replay --set threshold=0.002。
+本模块只在子命令执行时才导入对应的模块，启动时不加载pandas、backtrader等重型依赖。
+"""
+import sys
+import json
+import argparse
+
+
+def load_config(args):
+    """按命令行参数创建ArbConfig"""
+    from configs.ArbConfig import ArbConfig
+    config = ArbConfig.from_file(args.config) if args.config else ArbConfig()
+    for item in args.set or []:
+        key, sep, value = item.partition('=')
+        if not sep or key not in ArbConfig.__annotations__:
+            raise SystemExit(f"无效的配置项: {item}")
+        try:
+            value = json.loads(value)
+        except ValueError:
+            pass
+        setattr(config, key, value)
+    return config
+
+
+def cmd_download(config, args):
+    from fetch_data_from_Binance import main
+    main(config)
+
+
+def cmd_select(config, args):
+    from data_process import main
+    main(config)
+
+
+def cmd_backtest(config, args):
+    from run_backtest import main
+    main(config)
+
+
+def cmd_batch(config, args):
+    from batch_backtest import main
+    main(config)
+
+
+def cmd_analyze(config, args):
+    from param_sweep import main
+    main(config)
+
+
+def cmd_runs(config, args):
+    import time
+    import pandas as pd
+    from results_catalog import ResultsCatalog
+
+    catalog = ResultsCatalog(args.db or config.results_catalog)
+    if args.reindex:
+        from backtest import RESULTS_DIR
+        print(f"已索引 {catalog.rebuild(RESULTS_DIR)} 个结果文件")
+
+    filters = dict(kind=args.kind, engine=args.engine, base_currency=args.base, fingerprint=args.fingerprint,
+                   threshold=args.threshold, taker_fee=args.taker_fee,
+                   start_date=args.start_date, end_date=args.end_date)
+    start = time.perf_counter()
+    if args.phases:
+        table = catalog.phases(args.phases)
+    elif args.trade_files:
+        table = catalog.trade_files(args.trade_files)
+    elif args.group_by:
+        table = catalog.aggregate(args.group_by.split(','), **filters)
+    else:
+        order_by = args.order_by if args.asc else f"-{args.order_by}"
+        table = catalog.runs(order_by=order_by, limit=args.limit, **filters)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    with pd.option_context('display.width', None, 'display.max_columns', None):
+        print(table.to_string(index=False) if len(table) else "没有符合条件的记录")
+    print(f"\n{len(table)} 行, 查询耗时 {elapsed_ms:.1f} 毫秒")
+
+
+def add_runs_arguments(parser):
+    parser.add_argument('--db', help="结果目录文件，默认为配置中的results_catalog")
+    parser.add_argument('--reindex', action='store_true', help="先把results目录中已有的结果JSON补充到目录")
+    parser.add_argument('--group-by', help="按逗号分隔的列分组汇总，如 threshold,taker_fee")
+    parser.add_argument('--kind', choices=['backtest', 'sweep'])
+    parser.add_argument('--engine')
+    parser.add_argument('--base', help="主基础货币")
+    parser.add_argument('--fingerprint', help="配置指纹")
+    parser.add_argument('--threshold', type=float)
+    parser.add_argument('--taker-fee', type=float)
+    parser.add_argument('--start-date', help="回测起始日期不早于此日期")
+    parser.add_argument('--end-date', help="回测结束日期不晚于此日期")
+    parser.add_argument('--order-by', default='run_id', help="排序列，默认降序")
+    parser.add_argument('--asc', action='store_true', help="按升序排列")
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--phases', type=int, nargs='+', metavar='RUN_ID', help="显示这些回测的分阶段耗时")
+    parser.add_argument('--trade-files', type=int, nargs='+', metavar='RUN_ID', help="显示这些回测的交易记录文件")
+
+
+COMMANDS = {
+    'download': (cmd_download, "按配置下载K线数据"),
+    'select': (cmd_select, "流动性分析并计算套利所需的交易对"),
+    'backtest': (cmd_backtest, "运行单次回测"),
+    'batch': (cmd_batch, "批量回测多个日期范围"),
+    'analyze': (cmd_analyze, "参数扫描分析"),
+    'runs': (cmd_runs, "查询回测结果目录"),
+}
+# 子命令专用的参数
+COMMAND_ARGUMENTS = {
+    'runs': add_runs_arguments,
+}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='cli.py', description="Binance三角套利回测工具")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name, (_, help_text) in COMMANDS.items():
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument('--config', help="JSON配置文件路径")
+        sub.add_argument('--set', action='append', metavar='KEY=VALUE', help="覆盖配置字段，可重复")
+        if name in COMMAND_ARGUMENTS:
+            COMMAND_ARGUMENTS[name](sub)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    command, _ = COMMANDS[args.command]
+    command(load_config(args), args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -8,6 +8,8 @@ class ArbConfig:
     """三角套利配置类，集中管理所有可配置参数"""
     # 基础配置
     base_currency: str = 'USDT'          # 基础货币
+    base_currencies: list = field(default_factory=list)  # 同一次回测中同时评估的多个基础货币，为空时只用base_currency
+    base_settings: dict = field(default_factory=dict)    # 基础货币 -> {'initial_cash': ..., 'trade_amount': ...}，未设置的使用全局值
     initial_cash: float = 1000            # 初始资金
     threshold: float = 0.005             # 套利阈值
     
@@ -35,10 +37,18 @@ class ArbConfig:
         ("2025-01-12", "2025-01-12"),  # 250112
         ("2025-03-18", "2025-03-18"),  # 250318
     ])
+    batch_workers: int = 1              # 批量回测进程数: 1 顺序执行, 0 使用全部CPU核
+    batch_worker_memory_gb: float = 6   # 每个回测进程的内存上限(GB)
 
     data_dir: str = './data_binance'    # 数据目录
     download_data: bool = True          # 是否下载数据
+    download_workers: int = 8           # 并发下载线程数
+    download_rate_limit: float = 0      # 每秒最多下载请求数，0 不限速
     specific_data_dir: str = './data_binance/1s_20250407_20250407'    # 指定的数据目录路径
+    data_format: str = 'csv'            # 数据格式: 'csv' 按日期范围的CSV目录, 'parquet' 列式存储
+    store_dir: str = './data_binance/store'    # 列式存储根目录，CSV模式下作为按天的下载缓存
+    data_feed: str = 'pandas'           # Backtrader数据源: 'pandas' 整体读入内存, 'stream' 分块读取(内存与数据长度无关，不支持绘图)
+    feed_chunk_rows: int = 4096         # 流式数据源每个交易对常驻内存的行数
     # selected_pairs: list = field(default_factory=lambda: ["BTC_USDT", "ETH_BTC", "ETH_USDT", 
     #                                                       "SOL_BTC", "SOL_USDT", "BNB_ETH", 
     #                                                       "BNB_USDT", "XRP_BTC", "XRP_USDT", 
@@ -53,6 +63,7 @@ class ArbConfig:
     liquidity_trades_weight: float = 0.3    # 交易次数权重
     liquidity_top_percent: float = 0.5      # 选取流动性最好的前50%交易对
     liquidity_min_pairs: int = 3            # 至少保留的交易对数量
+    liquidity_workers: int = 0              # 流动性分析并行线程数，0 使用全部CPU核
 
     # 策略配置
     trade_amount: float = 100           # 每次交易金额
@@ -60,11 +71,31 @@ class ArbConfig:
     skip_seconds: int = 3               # 执行交易后跳过的秒数
     commission_maker: float = 0.0005    # 挂单手续费率
     commission_taker: float = 0.0005    # 吃单手续费率
+    max_price_age: float = 0            # 价格年龄上限(秒)，任一腿的报价超过该秒数未更新时跳过该路径，0 不限制；loop评估方式下改用vectorized
+    max_path_legs: int = 3              # 套利路径最多腿数: 3 三角套利, 4/5 更长的环
+    cycle_detection: bool = False       # 每根K线先用Bellman-Ford检测币种图上是否存在超过阈值的套利环，没有时跳过路径评估(结果不变)
+    path_cache: bool = True             # 是否缓存套利路径(按交易对集合、基础货币和腿数的哈希)
+    eval_mode: str = 'vectorized'       # 路径评估方式: 'vectorized', 'incremental' 或 'loop'
+    engine: str = 'backtrader'          # 回测引擎: 'backtrader', 'replay' (不经过Cerebro的快速回放) 或 'daily' (按天分段回放，长区间内存不随天数增长)
+    matrix_cache: bool = True           # 回放引擎是否使用数据目录级的memmap价格矩阵缓存
+    checkpoint_dir: str = './results/checkpoints'  # daily引擎每完成一天写入的检查点目录
+    resume: bool = True                 # daily引擎是否从同一配置上次中断时最后完成的一天继续
     
+    # 交易记录配置
+    trade_format: str = 'parquet'       # 交易记录格式: 'parquet' 或 'csv'，流式写入trades目录
+    export_trades_excel: bool = False   # 回测结束后是否另存一份Excel(超过单表行数上限时分多个工作表)
+
     # 其他配置
     debug: bool = False                 # 调试模式
     plot: bool = False                  # 是否生成图表
+    profile_phases: bool = False        # 是否记录分阶段耗时和计数(数据加载、路径评估、交易执行、日志、导出)，写入结果JSON
+    profile_mode: str = ''              # 回测运行期间的剖析: '' 不剖析, 'cprofile' 或 'sampling'，剖析文件写入results/profiles
+    results_catalog: str = './results/catalog.sqlite'  # 回测结果目录(SQLite)，每次导出结果和参数扫描时写入，'' 不记录
     
+    def base_currency_list(self):
+        """回测的基础货币列表，第一个为主基础货币(与initial_cash和账户资金对应)"""
+        return list(self.base_currencies) or [self.base_currency]
+
     def to_dict(self):
         """转换为字典"""
         return asdict(self)
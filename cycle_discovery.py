@@ -0,0 +1,344 @@
+import logging
+from collections import deque
+from typing import List, Optional
+
+import numpy as np
+
+from path_set import PathSet
+
+cycle_logger = logging.getLogger('cycle_discovery')
+
+
+class CurrencyGraph:
+    """整数编号的币种交易图，邻接表以CSR格式存放
+
+    每个交易对 BASE_QUOTE 产生两条边: BASE→QUOTE (卖出, 方向1) 和
+    QUOTE→BASE (买入, 方向-1)。同一节点的出边保持交易对的输入顺序。
+    """
+
+    __slots__ = ('currencies', 'currency_ids', 'pairs', 'indptr', 'edge_dst', 'edge_pair', 'edge_dir', 'edge_src')
+
+    def __init__(self, currencies, pairs, edge_src, edge_dst, edge_pair, edge_dir):
+        """
+        Args:
+            currencies: 币种名称列表，下标即节点id
+            pairs: 交易对名称列表，下标即交易对id
+            edge_src/edge_dst/edge_pair/edge_dir: 边数组，已按起点稳定排序
+        """
+        self.currencies = list(currencies)
+        self.currency_ids = {currency: i for i, currency in enumerate(self.currencies)}
+        self.pairs = list(pairs)
+        self.edge_src = edge_src
+        self.edge_dst = edge_dst
+        self.edge_pair = edge_pair
+        self.edge_dir = edge_dir
+        self.indptr = np.searchsorted(edge_src, np.arange(len(self.currencies) + 1))
+
+    @classmethod
+    def from_pairs(cls, pairs) -> 'CurrencyGraph':
+        """由交易对列表构建图，无法解析的交易对被忽略
+
+        Args:
+            pairs: 交易对列表，下划线或斜杠格式
+
+        Returns:
+            CurrencyGraph: 币种图
+        """
+        currency_ids = {}
+        pair_ids = {}
+        src, dst, pair_col, dir_col = [], [], [], []
+        for pair in pairs:
+            pair = pair.replace('/', '_')
+            try:
+                base, quote = pair.split('_')
+            except ValueError:
+                cycle_logger.error(f"解析交易对 {pair} 出错")
+                continue
+            if pair in pair_ids:
+                continue
+            pair_id = pair_ids.setdefault(pair, len(pair_ids))
+            b = currency_ids.setdefault(base, len(currency_ids))
+            q = currency_ids.setdefault(quote, len(currency_ids))
+            src += [b, q]
+            dst += [q, b]
+            pair_col += [pair_id, pair_id]
+            dir_col += [1, -1]
+
+        src = np.asarray(src, dtype=np.int32)
+        order = np.argsort(src, kind='stable')
+        return cls(
+            list(currency_ids), list(pair_ids),
+            src[order],
+            np.asarray(dst, dtype=np.int32)[order],
+            np.asarray(pair_col, dtype=np.int32)[order],
+            np.asarray(dir_col, dtype=np.int8)[order],
+        )
+
+    @property
+    def num_nodes(self):
+        return len(self.currencies)
+
+    @property
+    def num_edges(self):
+        return len(self.edge_dst)
+
+    def hops_from(self, source: int) -> np.ndarray:
+        """BFS求各节点与source之间的最少腿数，不可达为一个大数
+
+        每个交易对都有正反两条边，图是对称的，所以到source的距离等于从source出发的距离。
+        """
+        unreachable = np.iinfo(np.int32).max
+        hops = np.full(self.num_nodes, unreachable, dtype=np.int32)
+        hops[source] = 0
+        queue = deque([source])
+        indptr, edge_dst = self.indptr, self.edge_dst
+        while queue:
+            node = queue.popleft()
+            for nxt in edge_dst[indptr[node]:indptr[node + 1]]:
+                if hops[nxt] == unreachable:
+                    hops[nxt] = hops[node] + 1
+                    queue.append(nxt)
+        return hops
+
+    def edges_to_path(self, edges) -> list:
+        """边id序列转换为 [(交易对, 方向), ...] 形式的路径"""
+        return [(self.pairs[self.edge_pair[e]], int(self.edge_dir[e])) for e in edges]
+
+
+def find_cycles(graph: CurrencyGraph, base_currency: str, max_legs: int = 3, min_legs: int = 3,
+                max_paths: Optional[int] = None) -> List[List[int]]:
+    """有界深度DFS查找从基础货币出发并回到基础货币的简单环
+
+    路径中间不重复经过同一币种。起点固定为基础货币，每个环只会以一种
+    方向和起点被枚举一次，正反两个方向是不同的交易，各算一条路径。
+    到基础货币的剩余腿数不足的分支会被剪掉，搜索量只与能闭合的环有关。
+
+    Args:
+        graph: 币种图
+        base_currency: 基础货币
+        max_legs: 最多腿数
+        min_legs: 最少腿数(2腿的 A→B→A 没有套利意义)
+        max_paths: 可选，最多返回的路径数
+
+    Returns:
+        list: 每条路径的边id列表
+    """
+    base = graph.currency_ids.get(base_currency)
+    if base is None:
+        cycle_logger.warning(f"警告: 基础货币 {base_currency} 不在交易图中!")
+        return []
+
+    hops = graph.hops_from(base).tolist()
+    indptr = graph.indptr.tolist()
+    edge_dst = graph.edge_dst.tolist()
+    on_path = [False] * graph.num_nodes
+    on_path[base] = True
+    cycles = []
+    edges = []
+
+    def extend(node, depth):
+        for e in range(indptr[node], indptr[node + 1]):
+            if max_paths is not None and len(cycles) >= max_paths:
+                return
+            nxt = edge_dst[e]
+            if nxt == base:
+                if depth + 1 >= min_legs:
+                    cycles.append(edges + [e])
+                continue
+            # 走到nxt之后至少还需要hops[nxt]条腿才能回到基础货币
+            if on_path[nxt] or depth + 1 + hops[nxt] > max_legs:
+                continue
+            on_path[nxt] = True
+            edges.append(e)
+            extend(nxt, depth + 1)
+            edges.pop()
+            on_path[nxt] = False
+
+    extend(base, 0)
+    return cycles
+
+
+def cycles_to_path_set(graph: CurrencyGraph, cycles: List[List[int]], base_currency: str) -> PathSet:
+    """把边id形式的环直接转换为PathSet，不经过逐条货币链校验
+
+    PathSet中只保留路径实际用到的交易对，编号按首次出现的顺序。
+    """
+    max_legs = max((len(cycle) for cycle in cycles), default=0)
+    edge_ids = np.full((len(cycles), max_legs), -1, dtype=np.int64)
+    num_legs = np.zeros(len(cycles), dtype=np.int8)
+    for i, cycle in enumerate(cycles):
+        edge_ids[i, :len(cycle)] = cycle
+        num_legs[i] = len(cycle)
+
+    padded = edge_ids < 0
+    graph_pair = np.where(padded, -1, graph.edge_pair[np.maximum(edge_ids, 0)])
+    leg_dir = np.where(padded, 0, graph.edge_dir[np.maximum(edge_ids, 0)]).astype(np.int8)
+
+    # 按首次出现顺序重新编号交易对
+    flat = graph_pair.ravel()
+    used, first_index = np.unique(flat[flat >= 0], return_index=True)
+    used = used[np.argsort(first_index)]
+    remap = np.full(len(graph.pairs) + 1, -1, dtype=np.int32)
+    remap[used] = np.arange(len(used), dtype=np.int32)
+    leg_pair = remap[graph_pair]
+
+    return PathSet(base_currency, [graph.pairs[p] for p in used], leg_pair, leg_dir, num_legs)
+
+
+def find_arb_paths(pairs, base_currency: str, max_legs: int = 3, max_paths: Optional[int] = None) -> PathSet:
+    """查找以基础货币为起点和终点、3到max_legs腿的套利路径
+
+    Args:
+        pairs: 交易对列表，或已构建的CurrencyGraph(多个基础货币共享一张图)
+        base_currency: 基础货币
+        max_legs: 最多腿数
+        max_paths: 可选，最多返回的路径数
+
+    Returns:
+        PathSet: 路径集合
+    """
+    if isinstance(pairs, CurrencyGraph):
+        graph = pairs
+    else:
+        graph = CurrencyGraph.from_pairs(pairs)
+        cycle_logger.info(f"币种图构建完成: {graph.num_nodes} 个节点, {graph.num_edges} 条边")
+    cycles = find_cycles(graph, base_currency, max_legs=max_legs, max_paths=max_paths)
+    cycle_logger.info(f"找到 {len(cycles)} 条以 {base_currency} 为起点和终点的 3-{max_legs} 腿套利路径")
+    return cycles_to_path_set(graph, cycles, base_currency)
+
+
+def edge_log_rates(graph: CurrencyGraph, prices: np.ndarray, fee: float) -> np.ndarray:
+    """计算每条边扣除手续费后的对数汇率
+
+    Args:
+        graph: 币种图
+        prices: 按graph.pairs顺序排列的价格向量
+        fee: 每条腿的手续费率
+
+    Returns:
+        np.ndarray: 每条边的对数汇率，价格无效的边为-inf
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    bad = ~(prices > 0)
+    log_prices = np.log(np.where(bad, 1.0, prices))
+    rates = log_prices[graph.edge_pair] * graph.edge_dir + np.log1p(-fee)
+    rates[bad[graph.edge_pair]] = -np.inf
+    return rates
+
+
+def _predecessor_cycle_node(graph: CurrencyGraph, pred: np.ndarray, start: int) -> Optional[int]:
+    """从start沿前驱回退，返回前驱图中环上的一个节点，走到没有前驱的节点时返回None"""
+    seen = set()
+    node = start
+    while node not in seen:
+        seen.add(node)
+        edge = pred[node]
+        if edge < 0:
+            return None
+        node = int(graph.edge_src[edge])
+    return node
+
+
+def find_negative_cycle(graph: CurrencyGraph, log_rates: np.ndarray, tolerance: float = 1e-12) -> Optional[list]:
+    """Bellman-Ford检测对数汇率图上的套利环
+
+    以 -对数汇率 为边权，负权环即乘积大于1的套利环。所有节点同时作为起点
+    (虚拟源点到各点距离为0)，每轮对全部边做一次向量化松弛。每轮之后沿本轮更新的节点
+    回退前驱，前驱图中出现环时它一定是负权环，可以提前返回，不必做满num_nodes轮。
+
+    Args:
+        graph: 币种图
+        log_rates: edge_log_rates的结果
+        tolerance: 小于该值的改进视为浮点误差
+
+    Returns:
+        list: [(交易对, 方向), ...] 形式的套利环，不存在时返回None
+    """
+    weights = -log_rates
+    finite = np.isfinite(weights)
+    src, dst, weights = graph.edge_src[finite], graph.edge_dst[finite], weights[finite]
+    edge_ids = np.flatnonzero(finite)
+
+    dist = np.zeros(graph.num_nodes)
+    pred = np.full(graph.num_nodes, -1, dtype=np.int64)
+    updated = None
+    node = None
+    for _ in range(graph.num_nodes):
+        candidate = dist[src] + weights
+        improving = np.flatnonzero(candidate < dist[dst] - tolerance)
+        if len(improving) == 0:
+            return None
+        # 同一终点有多条改进边时保留最小的: 按候选值降序写入，最后写入的生效
+        improving = improving[np.argsort(-candidate[improving], kind='stable')]
+        dist[dst[improving]] = candidate[improving]
+        pred[dst[improving]] = edge_ids[improving]
+        updated = int(dst[improving[-1]])
+        node = _predecessor_cycle_node(graph, pred, updated)
+        if node is not None:
+            break
+
+    if node is None:
+        # 经过num_nodes轮仍能松弛，沿前驱回退num_nodes步必然落在环上
+        node = updated
+        for _ in range(graph.num_nodes):
+            node = int(graph.edge_src[pred[node]])
+    cycle_edges = []
+    current = node
+    while True:
+        edge = int(pred[current])
+        cycle_edges.append(edge)
+        current = int(graph.edge_src[edge])
+        if current == node:
+            break
+    cycle_edges.reverse()
+    return graph.edges_to_path(cycle_edges)
+
+
+class NegativeCycleDetector:
+    """每根K线检测币种图上是否存在扣费后收益超过阈值的套利环
+
+    检测到的环不一定经过基础货币，也可能超过路径的腿数，所以这只是路径成交的必要条件:
+    检测不到时没有任何路径能超过阈值，策略直接跳过这根K线的路径评估；检测到时照常评估，
+    回测结果与不检测时完全相同。阈值按最长路径的腿数均摊到每条边，不超过该腿数且收益
+    超过阈值的路径减去均摊量后仍是正收益环，一定能被检测到。
+    """
+
+    # 从阈值中预留的对数余量，使收益恰好超过阈值的路径对应的负权环也大于find_negative_cycle的容差
+    MARGIN = 1e-9
+
+    def __init__(self, pairs, feed_names, fee: float, threshold: float, max_legs: int):
+        """
+        Args:
+            pairs: 参与回测的交易对，构成检测用的币种图
+            feed_names: 数据源名称列表，顺序与价格向量一致
+            fee: 每条腿的手续费率
+            threshold: 收益阈值
+            max_legs: 路径最多腿数
+        """
+        feed_pos = {name: i for i, name in enumerate(feed_names)}
+        self.graph = CurrencyGraph.from_pairs([pair for pair in pairs if pair in feed_pos])
+        self.columns = np.array([feed_pos[pair] for pair in self.graph.pairs], dtype=np.int64)
+        self.fee = fee
+        self.edge_bonus = (np.log1p(threshold) - self.MARGIN) / max(max_legs, 1)
+        self.checks = 0
+        self.hits = 0
+
+    def find(self, prices) -> Optional[list]:
+        """在当前价格上查找套利环
+
+        Args:
+            prices: 与feed_names顺序一致的价格向量，无效或过期的价格为NaN
+
+        Returns:
+            list: [(交易对, 方向), ...] 形式的环，不存在时返回None
+        """
+        rates = edge_log_rates(self.graph, np.asarray(prices)[self.columns], self.fee) - self.edge_bonus
+        cycle = find_negative_cycle(self.graph, rates)
+        self.checks += 1
+        self.hits += cycle is not None
+        return cycle
+
+    def summary(self) -> str:
+        """检测统计"""
+        share = self.hits / self.checks * 100 if self.checks else 0.0
+        return f"负权环检测 {self.checks} 次, 其中 {self.hits} 次({share:.2f}%)存在套利环"
@@ -1,62 +1,129 @@
 import os
 import glob
-import pandas as pd
-import random
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.compute as pc
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Dict, Tuple, Optional
 
 from configs.ArbConfig import ArbConfig
+from market_store import MarketStore
 from tri_arb import calculate_arb_paths
 
+# 流动性评分使用的列: (CSV列名, 列式存储列名)
+LIQUIDITY_COLUMNS = [('Volume', 'volume'), ('Number of Trades', 'num_trades')]
+
+
+def csv_liquidity_stats(file_path: str) -> Tuple[float, float]:
+    """精确计算单个CSV文件的平均成交量和平均交易次数
+
+    只解析成交量和交易次数两列，缺少的列按0计。
+
+    Args:
+        file_path: 交易对CSV文件路径
+
+    Returns:
+        tuple: (平均成交量, 平均交易次数)
+    """
+    columns = [csv_name for csv_name, _ in LIQUIDITY_COLUMNS]
+    table = pa_csv.read_csv(
+        file_path,
+        # 文件之间已经并行，单个文件内不再开线程
+        read_options=pa_csv.ReadOptions(use_threads=False),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=columns,
+            include_missing_columns=True,
+            column_types={name: pa.float64() for name in columns}
+        )
+    )
+    return tuple(pc.mean(table[name]).as_py() or 0.0 for name in columns)
+
+
+def store_liquidity_stats(store: MarketStore, pair: str, start_date: str, end_date: str) -> Tuple[float, float]:
+    """精确计算列式存储中交易对在日期范围内的平均成交量和平均交易次数"""
+    columns = [column for _, column in LIQUIDITY_COLUMNS]
+    df = store.read(pair, start_date, end_date, columns=columns)
+    if df is None or df.empty:
+        return 0.0, 0.0
+    return tuple(float(df[column].mean()) for column in columns)
+
+
+def collect_liquidity_stats(config: ArbConfig) -> Dict[str, Tuple[float, float]]:
+    """并行统计数据源中每个交易对的平均成交量和平均交易次数
+
+    列式存储模式下优先使用入库时写入的逐日统计索引，只有索引没有完整覆盖
+    日期范围的交易对才读取数据。
+
+    Args:
+        config: 配置，data_format为'parquet'时读取列式存储，否则读取specific_data_dir下的CSV
+
+    Returns:
+        dict: 交易对 -> (平均成交量, 平均交易次数)
+    """
+    pair_stats = {}
+    if config.data_format == 'parquet':
+        store = MarketStore(config.store_dir, config.interval)
+        pairs = [pair for pair in store.pairs() if '_' in pair]
+        summary = store.stats.pair_summary(config.start_date, config.end_date, pairs)
+        date_list = MarketStore.date_range(config.start_date, config.end_date)
+        for pair in summary.index:
+            if summary.at[pair, 'days'] == sum(store.has_day(pair, day) for day in date_list):
+                pair_stats[pair] = (float(summary.at[pair, 'avg_volume']), float(summary.at[pair, 'avg_trades']))
+        pairs = [pair for pair in pairs if pair not in pair_stats]
+        def stats_of(pair):
+            return store_liquidity_stats(store, pair, config.start_date, config.end_date)
+    else:
+        data_files = {
+            os.path.splitext(os.path.basename(file_path))[0]: file_path
+            for file_path in glob.glob(os.path.join(config.specific_data_dir, "*.csv"))
+        }
+        pairs = [pair for pair in data_files if '_' in pair]
+        def stats_of(pair):
+            return csv_liquidity_stats(data_files[pair])
+
+    workers = config.liquidity_workers or os.cpu_count()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(stats_of, pair): pair for pair in pairs}
+        for future in as_completed(futures):
+            pair = futures[future]
+            try:
+                pair_stats[pair] = future.result()
+            except Exception as e:
+                print(f"分析交易对 {pair} 时出错: {str(e)}")
+    return pair_stats
+
+
 def analyze_liquidity(config: ArbConfig) -> List[str]:
     """分析指定目录下所有交易对的流动性，返回流动性最好的前X%交易对"""
-    data_files = glob.glob(os.path.join(config.specific_data_dir, "*.csv"))
-    if not data_files:
+    if config.data_format != 'parquet' and not glob.glob(os.path.join(config.specific_data_dir, "*.csv")):
         print(f"在指定目录 {config.specific_data_dir} 中未找到CSV文件")
         return False
     
-    # 从文件名提取交易对并分析流动性
-    all_available_pairs = []
-    pair_liquidity = {}  # 存储交易对和对应的流动性指标
-    
-    print(f"开始分析 {len(data_files)} 个交易对的流动性...")
+    print("开始分析交易对的流动性...")
     print(f"流动性评分权重: 成交量 {config.liquidity_volume_weight:.2f}, 交易次数 {config.liquidity_trades_weight:.2f}")
     
-    sample_size = 5000
-    sample_indices = None
-    read_indices = None
-
-    for i, file_path in enumerate(data_files):
-        file_name = os.path.basename(file_path)
-        file_name_without_ext = os.path.splitext(file_name)[0]
-        if '_' in file_name_without_ext:
-            pair = file_name_without_ext
-            # 只读取部分数据以提高性能
-            if i == 0 or  sample_indices is None:
-                with open(file_path, 'r') as f:
-                    total_rows = sum(1 for _ in f) - 1  # 减去标题行
-                sample_indices = sorted(random.sample(range(1, total_rows + 1), sample_size))
-                read_indices = [0] + sample_indices
-            df = pd.read_csv(file_path, skiprows=lambda x: x not in read_indices)
-            avg_volume = df['Volume'].mean()
-            avg_trades = df['Number of Trades'].mean() if 'Number of Trades' in df.columns else 0
-            liquidity_score = (config.liquidity_volume_weight * avg_volume) + \
-                                (config.liquidity_trades_weight * avg_trades)
-            pair_liquidity[pair] = liquidity_score
-            all_available_pairs.append(pair)
+    # 每个文件的全部行都参与计算，得到精确的平均值
+    pair_liquidity = {}  # 存储交易对和对应的流动性指标
+    for pair, (avg_volume, avg_trades) in collect_liquidity_stats(config).items():
+        pair_liquidity[pair] = (config.liquidity_volume_weight * avg_volume) + \
+                               (config.liquidity_trades_weight * avg_trades)
+    all_available_pairs = sorted(pair_liquidity)
                 
     if not all_available_pairs:
         print("未能从数据目录提取任何交易对")
         return []
     print(f"共分析了 {len(all_available_pairs)} 个交易对的流动性")
-    sorted_pairs = sorted(pair_liquidity.items(), key=lambda x: x[1], reverse=True)
+    sorted_pairs = sorted(pair_liquidity.items(), key=lambda x: (-x[1], x[0]))
     top_count = max(config.liquidity_min_pairs, int(len(sorted_pairs) * config.liquidity_top_percent))
     top_pairs = [pair for pair, _ in sorted_pairs[:top_count]]
     print(f"筛选出流动性最好的前{config.liquidity_top_percent*100:.0f}%交易对，共 {len(top_pairs)} 个")
-    print(f"计算三角套利路径，基础货币: {config.base_currency}")
+    print(f"计算三角套利路径，基础货币: {', '.join(config.base_currency_list())}")
     _, _, required_pairs = calculate_arb_paths(
         top_pairs, 
-        config.base_currency, 
-        save_to_file=True
+        config.base_currency_list(), 
+        save_to_file=True,
+        max_legs=config.max_path_legs,
+        use_cache=config.path_cache
     )
     if not required_pairs:
         print("未能计算出任何套利路径")
@@ -65,9 +132,9 @@ def analyze_liquidity(config: ArbConfig) -> List[str]:
     print(f"计算得到 {len(selected_pairs)} 个三角套利所需的交易对")
     return selected_pairs
 
-def main():
+def main(config=None):
     # 加载配置
-    config = ArbConfig()
+    config = config or ArbConfig()
     selected_pairs = analyze_liquidity(config)
     if selected_pairs:
         print(f"数据处理完成，得到 {len(selected_pairs)} 个交易对")
@@ -0,0 +1,315 @@
+import os
+import json
+import hashlib
+import logging
+import datetime
+import traceback
+import numpy as np
+from typing import Iterator, Dict, Optional
+
+from fast_backtest import FastReplayBacktest
+from price_matrix import PriceMatrix
+from market_store import MarketStore, DAY_MS
+from latency import LatencyHistogram
+from phase_profiler import run_profile
+from trade_sink import TradeSink
+from tri_arb import TRADES_DIR, export_trade_records
+from results_catalog import NON_RESULT_FIELDS
+
+# 检查点格式版本，结构变化时递增以使旧检查点失效
+CHECKPOINT_VERSION = 2
+CHECKPOINT_FILE = 'checkpoint.json'
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def run_key(config, pairs) -> str:
+    """由影响回测结果的配置和实际交易对计算运行键，同一运行键的检查点可以继续"""
+    settings = {k: v for k, v in config.to_dict().items() if k not in NON_RESULT_FIELDS}
+    content = json.dumps([CHECKPOINT_VERSION, settings, sorted(pairs)], sort_keys=True, default=str)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]
+
+
+def day_start_ms(day: str) -> int:
+    """YYYY-MM-DD当天零点(UTC)的毫秒时间戳"""
+    return int((datetime.datetime.strptime(day, '%Y-%m-%d') - _EPOCH) / datetime.timedelta(milliseconds=1))
+
+
+def _to_json_array(values: np.ndarray) -> list:
+    return [None if np.isnan(v) else v for v in values.tolist()]
+
+
+def _from_json_array(values: list) -> np.ndarray:
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+
+class DayChunkReader:
+    """把交易对按时间排序的分块迭代器切分为连续的时间段
+
+    内存中只保留当前块未取走的部分，每次取出一个时间段的数据。
+    """
+
+    def __init__(self, chunks: Iterator[Dict[str, np.ndarray]]):
+        """
+        Args:
+            chunks: stream_feed格式的块迭代器，包含timestamp、close、volume列
+        """
+        self._chunks = chunks
+        self._pending = None
+
+    def take_until(self, end_ts: int):
+        """取出时间戳早于end_ts的全部K线
+
+        Returns:
+            tuple: (时间戳, 收盘价, 成交量)
+        """
+        parts = []
+        while True:
+            chunk = self._pending
+            self._pending = None
+            if chunk is None:
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    break
+            ts = chunk['timestamp']
+            n = int(np.searchsorted(ts, end_ts, side='left'))
+            if n < len(ts):
+                self._pending = {name: chunk[name][n:] for name in ('timestamp', 'close', 'volume')}
+                parts.append((ts[:n], chunk['close'][:n], chunk['volume'][:n]))
+                break
+            parts.append((ts, chunk['close'], chunk['volume']))
+        if not parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)
+        return tuple(np.concatenate([part[i] for part in parts]) for i in range(3))
+
+
+class DayPartitionedBacktest(FastReplayBacktest):
+    """按天分段的长区间回放回测
+
+    数据按交易对分块流式读取，每次只对齐一天的价格矩阵，前一天末尾的价格向前填充到
+    下一天，与整段一次性对齐的回放结果一致，内存占用与回测天数无关。
+    账本(资金、跳过时间、交易计数)和耗时统计跨天延续，每个基础货币的交易记录按天写成
+    一个文件。每完成一天写一次检查点，中断后以相同配置再次运行时从最后完成的一天继续。
+    """
+
+    def __init__(self, config=None):
+        """初始化回测环境"""
+        super().__init__(config)
+        self.run_key = None
+        self.checkpoint_path = None
+        self.days = []
+        self.carry = None
+
+    def prepare_data(self):
+        """检查数据源，不读取数据
+
+        Returns:
+            bool: 数据准备是否成功
+        """
+        if not self.selected_pairs:
+            logging.error("未设置交易对，请先调用setup方法")
+            return False
+
+        if self.config.specific_data_dir:
+            self.data_manager.data_dir = self.config.specific_data_dir
+        sources = self.data_manager.chunk_sources(self.selected_pairs)
+        self.data_loaded = bool(sources) and self.data_manager.check_loaded()
+
+        if self.data_loaded:
+            self.data_count = len(self.data_manager.loaded_pairs)
+            self.final_pairs = list(self.data_manager.loaded_pairs)
+            self.days = [day.strftime('%Y-%m-%d')
+                         for day in MarketStore.date_range(self.config.start_date, self.config.end_date)]
+            self.run_key = run_key(self.config, self.final_pairs)
+            self.checkpoint_path = os.path.join(self.config.checkpoint_dir, self.run_key, CHECKPOINT_FILE)
+            logging.info(f"加载成功，最终可用交易对: {self.data_count} 个，共 {len(self.days)} 天")
+        else:
+            logging.error("数据加载失败")
+
+        return self.data_loaded
+
+    def trade_part_path(self, base_currency: str, day: str) -> str:
+        """基础货币某一天的交易记录文件，同一运行的各天放在同一目录"""
+        threshold_info = f"thresh{self.config.threshold*100:.2f}"
+        run_dir = f"arb_trades_{base_currency}_{threshold_info}_{self.run_key}"
+        return os.path.join(TRADES_DIR, run_dir, f"{day}.{self.config.trade_format}")
+
+    def run(self):
+        """运行回测"""
+        if not self.data_loaded:
+            logging.error("数据未加载，无法运行回测")
+            return None
+        maker_fee = self.commission_info.p.maker
+        taker_fee = self.commission_info.p.taker
+        try:
+            logging.info(f"开始按天回放回测 - "
+                        f"基础货币: {', '.join(self.config.base_currency_list())}, "
+                        f"手续费: 挂单 {maker_fee*100:.4f}%, 吃单 {taker_fee*100:.4f}%, "
+                        f"套利阈值: {self.config.threshold*100:.4f}%")
+
+            start_time = datetime.datetime.now()
+            with run_profile(self.config.profile_mode, self.profile_result):
+                self.replay_days()
+
+            duration = (datetime.datetime.now() - start_time).total_seconds()
+            logging.info(f"回测完成，耗时: {duration:.2f} 秒")
+
+            self.print_results(self.strategy)
+            self.export_results(self.strategy)
+            if self.config.plot:
+                logging.warning("回放引擎不支持Backtrader绘图，已跳过")
+            self.log_phases()
+
+            # 结果已导出，下次以相同配置运行时从头开始
+            if os.path.exists(self.checkpoint_path):
+                os.remove(self.checkpoint_path)
+                os.rmdir(os.path.dirname(self.checkpoint_path))
+            return self.strategy
+        except Exception as e:
+            logging.error(f"回测执行错误: {str(e)}")
+            logging.error(f"已完成的天数保存在检查点 {self.checkpoint_path}，以相同配置再次运行即可继续")
+            traceback.print_exc()
+            return None
+
+    def replay_days(self):
+        """逐天读取、对齐并回放，每天结束后写检查点"""
+        num_pairs = len(self.final_pairs)
+        self.carry = (np.full(num_pairs, np.nan), np.full(num_pairs, np.nan))
+
+        with self.profiler.phase('engine.run'):
+            # 交易记录按天写出，由replay_days管理
+            self.strategy = self.create_strategy(self.empty_matrix(), trade_format=None, export_excel=False)
+
+        completed = self.load_checkpoint() if self.config.resume else []
+        remaining = self.days[len(completed):]
+        if completed:
+            logging.info(f"从检查点继续: 已完成 {completed[0]} 到 {completed[-1]}，剩余 {len(remaining)} 天")
+
+        sources = self.data_manager.chunk_sources(self.final_pairs, remaining[0] if remaining else None)
+        readers = [DayChunkReader(sources[pair]()) for pair in self.final_pairs]
+        if remaining:
+            # CSV数据源总是从头读取，跳过已完成的天
+            for reader in readers:
+                reader.take_until(day_start_ms(remaining[0]))
+
+        for day in remaining:
+            day_end = day_start_ms(day) + DAY_MS
+            with self.profiler.phase('data.load'):
+                columns = [reader.take_until(day_end) for reader in readers]
+                matrix = PriceMatrix.from_columns(self.final_pairs, *(list(column) for column in zip(*columns)))
+                del columns
+                matrix.carry_in(*self.carry)
+            self.profiler.count('data.rows', len(matrix))
+
+            if self.config.trade_format:
+                for ledger in self.strategy.ledgers:
+                    path = self.trade_part_path(ledger.base_currency, day)
+                    if os.path.exists(path):
+                        os.remove(path)  # 中断的那一天留下的不完整记录
+                    ledger.trade_sink = TradeSink(path, self.config.trade_format, ledger.arb_paths)
+
+            if len(matrix):
+                with self.profiler.phase('engine.run'):
+                    self.strategy.matrix = matrix
+                    self.strategy.current_row = 0
+                    self.strategy.replay()
+            else:
+                logging.warning(f"{day} 没有任何交易对的数据")
+
+            export_trade_records(self.strategy.ledgers, self.config.export_trades_excel, self.strategy.log)
+            for ledger in self.strategy.ledgers:
+                ledger.trade_sink = None
+            if len(matrix):
+                self.carry = matrix.last_bars()
+            completed.append(day)
+            self.save_checkpoint(completed)
+            logging.info(f"{day} 完成: {len(matrix)} 个时间点, 累计套利 {self.strategy.num_trades} 次")
+
+        if not remaining:
+            # 所有天在上次运行中已完成，用检查点中的收盘价结算
+            self.strategy.matrix = self.carry_matrix()
+            self.strategy.current_row = 0
+
+        with self.profiler.phase('engine.run'):
+            self.strategy.stop()
+
+    def empty_matrix(self) -> PriceMatrix:
+        """没有任何行的价格矩阵，列为回测的交易对"""
+        num_pairs = len(self.final_pairs)
+        return PriceMatrix.from_columns(self.final_pairs, [np.zeros(0, dtype=np.int64)] * num_pairs,
+                                        [np.zeros(0)] * num_pairs, [np.zeros(0)] * num_pairs)
+
+    def carry_matrix(self) -> PriceMatrix:
+        """只有一行的价格矩阵，内容为最后一天末尾的价格"""
+        close, last_ts = self.carry
+        num_pairs = len(self.final_pairs)
+        if np.isnan(last_ts).all():
+            return self.empty_matrix()
+        timestamp = int(np.nanmax(last_ts))
+        return PriceMatrix(np.array([timestamp], dtype=np.int64), self.final_pairs, close[None, :].copy(),
+                           np.zeros((1, num_pairs)), ((timestamp - last_ts) / 1000).astype(np.float32)[None, :])
+
+    def save_checkpoint(self, completed: list):
+        """写入检查点: 已完成的天、各账本状态(含已写出的交易记录文件)、向前填充的价格和耗时直方图"""
+        strategy = self.strategy
+        checkpoint = {
+            'version': CHECKPOINT_VERSION,
+            'run_key': self.run_key,
+            'completed_days': completed,
+            'pairs': self.final_pairs,
+            'ledgers': [{
+                'base_currency': ledger.base_currency,
+                'cash': ledger.cash,
+                'num_trades': ledger.num_trades,
+                'total_profit': ledger.total_profit,
+                'skip_until': ledger.skip_until,
+                'last_trade_time': ledger.last_trade_time,
+                'trade_files': ledger.trade_files,
+            } for ledger in strategy.ledgers],
+            'carry': {'close': _to_json_array(self.carry[0]), 'timestamp': _to_json_array(self.carry[1])},
+            'latency': strategy.latency.to_dict(),
+        }
+        os.makedirs(os.path.dirname(self.checkpoint_path), exist_ok=True)
+        # 先写临时文件再改名，避免中断后留下损坏的检查点
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def load_checkpoint(self) -> list:
+        """读取检查点并恢复策略状态
+
+        Returns:
+            list: 已完成的天，没有可用的检查点时为空
+        """
+        checkpoint = read_checkpoint(self.checkpoint_path)
+        if checkpoint is None:
+            return []
+        completed = checkpoint['completed_days']
+        if (checkpoint.get('version') != CHECKPOINT_VERSION or checkpoint.get('run_key') != self.run_key
+                or completed != self.days[:len(completed)]):
+            logging.warning(f"检查点 {self.checkpoint_path} 与当前配置不一致，从头开始")
+            return []
+
+        ledgers = {ledger.base_currency: ledger for ledger in self.strategy.ledgers}
+        for state in checkpoint['ledgers']:
+            ledger = ledgers[state['base_currency']]
+            ledger.cash = state['cash']
+            ledger.num_trades = state['num_trades']
+            ledger.total_profit = state['total_profit']
+            ledger.skip_until = state['skip_until']
+            ledger.last_trade_time = state['last_trade_time']
+            ledger.trade_files = list(state['trade_files'])
+        self.strategy.latency = LatencyHistogram.from_dict(checkpoint['latency'])
+        self.carry = (_from_json_array(checkpoint['carry']['close']),
+                      _from_json_array(checkpoint['carry']['timestamp']))
+        return list(completed)
+
+
+def read_checkpoint(path: str) -> Optional[dict]:
+    """读取检查点，不存在或损坏时返回None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,352 @@
+import time
+import logging
+import datetime
+import traceback
+import numpy as np
+from types import SimpleNamespace
+
+from DataManager import DataManager
+from backtest import TriangleArbBacktest
+from price_matrix import PriceMatrix
+from latency import LatencyHistogram
+from phase_profiler import PhaseProfiler, run_profile
+from path_engine import mask_stale
+from tri_arb import (arb_logger, build_ledgers, build_cycle_detector, summarize_ledgers, format_trade_log,
+                     export_trade_records)
+
+
+class ReplayArbStrategy:
+    """不依赖Backtrader的三角套利策略回放
+
+    直接逐行遍历对齐好的 时间 × 交易对 价格矩阵，阈值、最大持仓、跳过秒数、
+    交易记录、多基础货币账本等语义与TriangularArbStrategy保持一致。矩阵可以包含多于
+    available_pairs的列(如整个数据目录的缓存)，多出的列不参与计算。
+    """
+    params = dict(
+        fee=0.0005,            # 交易手续费
+        base_currency='USDT',  # 基础货币，或多个基础货币的列表
+        trade_amount=0.1,      # 每次固定交易0.1个基础货币
+        threshold=0.001,       # 收益阈值 (0.1%)，超过此值才执行交易
+        max_positions=5,       # 每个基础货币最大同时持有的套利路径数
+        skip_seconds=3,        # 跳过的秒数
+        max_age=0,             # 价格年龄上限(秒)，任一腿超过该秒数没有新K线时跳过该路径，0表示不限制
+        debug=False,           # 是否开启调试模式
+        paths_file=None,       # 套利路径文件路径，多基础货币时可为 基础货币 -> 文件 的字典
+        save_paths=True,       # 是否保存计算的路径到文件
+        available_pairs=None,  # 可用的交易对列表
+        eval_mode='vectorized',  # 路径评估方式: 'vectorized' 或 'incremental'
+        max_legs=3,            # 套利路径最多腿数，3为三角套利
+        cycle_detection=False,  # 每根K线先用Bellman-Ford检测是否存在超过阈值的套利环，没有时跳过路径评估
+        base_settings=None,    # 可选，基础货币 -> {'initial_cash', 'trade_amount'}
+        path_cache=True,       # 是否使用按交易对集合哈希的路径缓存
+        trade_format='parquet',  # 交易记录格式: 'parquet' 或 'csv'，None表示不记录
+        export_excel=False,    # 回测结束后是否把交易记录另存为Excel
+        profiler=None,         # 可选，PhaseProfiler，记录路径评估、交易执行、日志等阶段的耗时
+    )
+
+    def __init__(self, matrix: PriceMatrix, cash: float, **kwargs):
+        """初始化策略
+
+        Args:
+            matrix: 对齐后的价格矩阵
+            cash: 初始资金(主基础货币)
+            **kwargs: 覆盖params中的默认参数
+        """
+        unknown = set(kwargs) - set(self.params)
+        if unknown:
+            raise TypeError(f"未知的策略参数: {sorted(unknown)}")
+        self.p = self.params = SimpleNamespace(**{**ReplayArbStrategy.params, **kwargs})
+        self.profiler = self.p.profiler or PhaseProfiler(enabled=False)
+        init_start = self.profiler.start()
+        if self.p.eval_mode not in ('vectorized', 'incremental'):
+            arb_logger.warning(f"回放引擎不支持评估方式 {self.p.eval_mode}，改用 vectorized")
+            self.p.eval_mode = 'vectorized'
+
+        self.matrix = matrix
+        self.latency = LatencyHistogram()  # 每行的处理耗时(纳秒)
+        self.summary = None
+        self.current_row = 0
+
+        # 交易对名称 -> 矩阵列号
+        self.column_of = {pair: j for j, pair in enumerate(matrix.pairs)}
+        self.pairs = self.p.available_pairs or list(matrix.pairs)
+        self.log(f"使用 {len(self.pairs)} 个交易对")
+
+        self.ledgers = build_ledgers(self.p, self.pairs, matrix.pairs, cash, self.log)
+        self.arb_paths = self.ledgers[0].arb_paths
+        self.cycle_detector = build_cycle_detector(self.p, self.pairs, matrix.pairs, self.ledgers)
+        self.profiler.stop('strategy.init', init_start)
+
+    @property
+    def cash(self):
+        """主基础货币的资金"""
+        return self.ledgers[0].cash
+
+    @property
+    def num_trades(self):
+        """所有基础货币的套利次数合计"""
+        return sum(ledger.num_trades for ledger in self.ledgers)
+
+    @property
+    def total_profit(self):
+        """套利理论收益，多基础货币时为折算成主基础货币的合计"""
+        if self.summary is not None:
+            return self.summary['combined']['total_arb_profit']
+        return self.ledgers[0].total_profit
+
+    def run(self):
+        """回放整个价格矩阵"""
+        self.replay()
+        self.stop()
+
+    def replay(self):
+        """逐行回放当前价格矩阵，不做结束处理
+
+        按天分段回测时每段替换matrix后再次调用，账本、跳过时间和耗时统计在各段之间延续。
+        """
+        columns = self.matrix.columns_of(self.pairs)
+        start_row = self.matrix.first_complete_row(columns)
+        if start_row >= len(self.matrix):
+            self.log("没有所有交易对都有价格的时间点，无法回放")
+        elif self.p.max_age and columns:
+            share = self.matrix.stale_share(self.p.max_age, columns)
+            worst = int(np.argmax(share))
+            self.log(f"价格年龄超过 {self.p.max_age} 秒的时间点占比: 平均 {share.mean()*100:.2f}%, "
+                     f"最高 {self.matrix.pairs[columns[worst]]} {share[worst]*100:.2f}%")
+        # 缓存矩阵的时间轴可能包含只有其他交易对有K线的时间点，跳过这些行
+        for row in self.matrix.bar_rows(columns, start_row).tolist():
+            self.current_row = row
+            self.next()
+
+    def next(self):
+        """主策略逻辑"""
+        start_time = time.perf_counter_ns()
+        current_ts = int(self.matrix.timestamps[self.current_row])
+        prices = None
+        no_cycle = False
+        evaluated = False
+
+        for ledger in self.ledgers:
+            if ledger.evaluator is None:
+                continue
+            # 检查是否需要跳过当前时间点
+            if ledger.skip_until and current_ts < ledger.skip_until:
+                continue
+
+            # 获取可用资金和可执行交易数量
+            max_possible_trades = ledger.max_trades(self.p.max_positions)
+            if max_possible_trades <= 0:
+                continue
+
+            # 所有基础货币共享同一行价格
+            eval_start = self.profiler.start()
+            if prices is None:
+                prices = np.asarray(self.matrix.close[self.current_row])
+                if self.p.max_age:
+                    prices = mask_stale(prices, self.matrix.age[self.current_row], self.p.max_age)
+                # 整张币种图上都没有超过阈值的环时，任何路径都不会成交
+                no_cycle = self.cycle_detector is not None and self.cycle_detector.find(prices) is None
+            if no_cycle:
+                candidates = []
+            else:
+                candidates = ledger.evaluator.best_paths(
+                    prices, self.p.threshold, max_possible_trades, exclude=ledger.active_trades
+                )
+            self.profiler.stop('strategy.evaluate', eval_start)
+            evaluated = True
+            for path_id, profit in candidates:
+                ledger.active_trades.add(path_id)
+                self._execute_trade(ledger, path_id, profit, prices)
+
+            if candidates:
+                ledger.last_trade_time = current_ts
+                ledger.skip_until = current_ts + self.p.skip_seconds * 1000
+
+        elapsed = time.perf_counter_ns() - start_time
+        if evaluated:
+            self.latency.record(elapsed)
+        self.profiler.add('strategy.next', elapsed)
+
+    def _execute_trade(self, ledger, path_id, profit, prices):
+        """执行套利交易
+
+        Args:
+            ledger: 基础货币账本
+            path_id: 路径在PathSet中的id
+            profit: 预期收益率
+            prices: 当前行的价格向量
+        """
+        execute_start = self.profiler.start()
+        path = ledger.arb_paths[path_id]
+        leg_prices = [float(prices[self.column_of[pair]]) for pair, _ in path]
+
+        try:
+            profit_rate, final_amount = ledger.settle(
+                path_id, leg_prices, self.p.fee, int(self.matrix.timestamps[self.current_row])
+            )
+            log_start = self.profiler.start()
+            self.log(format_trade_log(path, leg_prices, profit_rate, final_amount))
+            self.profiler.stop('strategy.log', log_start)
+
+        except Exception as e:
+            self.log(f"执行套利交易失败: {str(e)}")
+        finally:
+            ledger.active_trades.remove(path_id)
+            self.profiler.stop('strategy.execute', execute_start)
+
+    def getprice(self, pair_name):
+        """获取交易对在当前行的价格"""
+        column = self.column_of.get(pair_name)
+        if column is None or not len(self.matrix):
+            return None
+        return float(self.matrix.close[self.current_row, column])
+
+    def log(self, txt, dt=None):
+        """日志记录"""
+        if dt is None and len(self.matrix):
+            dt = self.matrix.datetime_at(self.current_row)
+        prefix = dt.isoformat() if dt else ''
+        arb_logger.info(f"{prefix} {txt}")
+
+    def stop(self):
+        """回放结束时执行 - 输出性能统计和总结"""
+        stop_start = self.profiler.start()
+        self.summary = summarize_ledgers(self.ledgers, self.getprice)
+        if self.latency.count:
+            for ledger in self.ledgers:
+                self.log(f"策略完成: {ledger.base_currency} 共检查{len(ledger.arb_paths)}条路径, "
+                        f"执行{ledger.num_trades}次套利, 总收益:{ledger.total_profit:.4f}")
+            self.log(f"性能统计: 每轮耗时 {self.latency.format_summary()}")
+        else:
+            self.log("策略执行完成，但未进行任何套利交易。")
+        if self.cycle_detector is not None:
+            self.log(self.cycle_detector.summary())
+        export_trade_records(self.ledgers, self.p.export_excel, self.log)
+        self.profiler.stop('strategy.stop', stop_start)
+
+
+class FastReplayBacktest(TriangleArbBacktest):
+    """不经过Cerebro的快速回放回测
+
+    数据一次性对齐为价格矩阵后由ReplayArbStrategy逐行回放，
+    对外接口与TriangleArbBacktest相同。
+    """
+
+    def __init__(self, config=None):
+        """初始化回测环境"""
+        from configs.ArbConfig import ArbConfig
+
+        self.config = config or ArbConfig()
+        self.commission_info = self.setup_commission()
+        self.profiler = PhaseProfiler(enabled=self.config.profile_phases)
+        self.profile_result = {}
+        self.data_manager = DataManager(self.config, self.profiler)
+
+        # 数据加载状态
+        self.data_loaded = False
+        self.data_count = 0
+        self.selected_pairs = None
+        self.final_pairs = None
+        self.matrix = None
+        self.strategy = None
+
+    def prepare_data(self):
+        """加载数据并对齐为价格矩阵
+
+        Returns:
+            bool: 数据准备是否成功
+        """
+        if not self.selected_pairs:
+            logging.error("未设置交易对，请先调用setup方法")
+            return False
+
+        with self.profiler.phase('data.load'):
+            if self.config.matrix_cache:
+                # 整个数据目录共享一份memmap缓存
+                self.matrix = self.data_manager.load_price_matrix(self.selected_pairs, self.config.specific_data_dir)
+            else:
+                frames = self.data_manager.load_frames(self.selected_pairs, self.config.specific_data_dir)
+                self.matrix = PriceMatrix.from_frames(frames)
+        if self.matrix is not None:
+            self.profiler.count('data.rows', len(self.matrix))
+        self.data_loaded = self.matrix is not None and self.data_manager.check_loaded()
+
+        if self.data_loaded:
+            self.data_count = len(self.data_manager.loaded_pairs)
+            self.final_pairs = self.data_manager.loaded_pairs
+            logging.info(f"加载成功，最终可用交易对: {self.data_count} 个")
+        else:
+            logging.error("数据加载失败")
+
+        return self.data_loaded
+
+    def run(self):
+        """运行回测"""
+        if not self.data_loaded:
+            logging.error("数据未加载，无法运行回测")
+            return None
+        maker_fee = self.commission_info.p.maker
+        taker_fee = self.commission_info.p.taker
+        try:
+            logging.info(f"开始回放回测 - "
+                        f"基础货币: {', '.join(self.config.base_currency_list())}, "
+                        f"手续费: 挂单 {maker_fee*100:.4f}%, 吃单 {taker_fee*100:.4f}%, "
+                        f"套利阈值: {self.config.threshold*100:.4f}%")
+
+            start_time = datetime.datetime.now()
+
+            # 与Backtrader一致，策略初始化(路径计算)计入引擎运行阶段
+            with run_profile(self.config.profile_mode, self.profile_result), self.profiler.phase('engine.run'):
+                self.strategy = self.create_strategy(self.matrix)
+                self.strategy.run()
+
+            duration = (datetime.datetime.now() - start_time).total_seconds()
+            logging.info(f"回测完成，耗时: {duration:.2f} 秒")
+
+            self.print_results(self.strategy)
+            self.export_results(self.strategy)
+            if self.config.plot:
+                logging.warning("回放引擎不支持Backtrader绘图，已跳过")
+            self.log_phases()
+
+            return self.strategy
+        except Exception as e:
+            logging.error(f"回测执行错误: {str(e)}")
+            traceback.print_exc()
+            return None
+
+    def create_strategy(self, matrix, **overrides):
+        """按配置创建回放策略
+
+        Args:
+            matrix: 价格矩阵
+            **overrides: 覆盖由配置得到的策略参数
+        """
+        params = dict(
+            fee=self.commission_info.p.taker,
+            base_currency=self.config.base_currency_list(),
+            trade_amount=self.config.trade_amount,
+            threshold=self.config.threshold,
+            max_positions=self.config.max_positions,
+            skip_seconds=self.config.skip_seconds,
+            max_age=self.config.max_price_age,
+            debug=self.config.debug,
+            paths_file=None,
+            available_pairs=self.final_pairs,
+            eval_mode=self.config.eval_mode,
+            max_legs=self.config.max_path_legs,
+            cycle_detection=self.config.cycle_detection,
+            base_settings=self.config.base_settings,
+            path_cache=self.config.path_cache,
+            trade_format=self.config.trade_format,
+            export_excel=self.config.export_trades_excel,
+            profiler=self.profiler
+        )
+        params.update(overrides)
+        return ReplayArbStrategy(matrix, self.config.initial_cash, **params)
+
+    def get_final_value(self):
+        """回测结束时的账户价值"""
+        if self.strategy is None:
+            return self.config.initial_cash
+        return self.strategy.cash
@@ -1,21 +1,268 @@
 import os
+import hashlib
 import requests
-import zipfile
 import pandas as pd
-from io import BytesIO
 from datetime import datetime, timedelta
 import pytz
 from tqdm import tqdm
 import logging
-import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+
+from market_store import MarketStore, CSV_COLUMN_MAP, KLINE_SCHEMA, read_kline_archive
 
-# 配置日志
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def download_kline_data(symbol, interval='1s', start_date=None, end_date=None, output_dir='./data'):
+BINANCE_DATA_URL = 'https://data.binance.vision'
+HTTP_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+}
+# 日数据通常在次日发布；早于这个天数仍返回404的日期视为该交易对当天没有数据
+PUBLISH_LAG_DAYS = 2
+# 列式存储列名 -> 旧版CSV列名
+CSV_OUTPUT_COLUMNS = {column: csv_name for csv_name, column in CSV_COLUMN_MAP.items()}
+
+
+class RateLimiter:
+    """线程安全的全局限速器，保证所有线程的请求间隔不小于 1/rate 秒"""
+
+    def __init__(self, rate=None):
+        """
+        Args:
+            rate: 每秒最多请求数，None或0表示不限速
+        """
+        self.interval = 1.0 / rate if rate else 0.0
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def wait(self):
+        """阻塞到下一个可用的请求时间片"""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_time)
+            self._next_time = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def create_session(pool_size=16):
+    """创建带连接池的共享会话，所有下载线程复用keep-alive连接
+
+    参数:
+        pool_size (int): 连接池大小，应不小于并发线程数
+
+    返回:
+        requests.Session: 会话对象
+    """
+    session = requests.Session()
+    session.trust_env = False
+    session.headers.update(HTTP_HEADERS)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def fetch_archive(session, url, limiter=None, retries=3, backoff=1.0):
+    """下载一个压缩包，遇到网络错误、限流或服务端错误时指数退避重试
+
+    参数:
+        session (requests.Session): 共享会话
+        url (str): 压缩包地址
+        limiter (RateLimiter): 可选，全局限速器
+        retries (int): 最大重试次数
+        backoff (float): 首次重试前等待的秒数，之后每次翻倍
+
+    返回:
+        bytes: 压缩包内容；文件不存在(404)时返回b''，重试耗尽时返回None
+    """
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            limiter.wait()
+        try:
+            response = session.get(url, timeout=30)
+            if response.status_code == 200:
+                return response.content
+            if response.status_code == 404:
+                logger.warning(f'下载失败: {url}, 状态码: 404')
+                return b''
+            logger.warning(f'下载失败: {url}, 状态码: {response.status_code}')
+        except requests.RequestException as e:
+            logger.warning(f"下载 {url} 时出错: {str(e)}")
+        if attempt < retries:
+            time.sleep(backoff * (2 ** attempt))
+    logger.error(f"下载 {url} 重试 {retries} 次后仍失败")
+    return None
+
+
+def fetch_checksum(session, url, limiter=None):
+    """下载压缩包对应的 .CHECKSUM 文件
+
+    参数:
+        session (requests.Session): 共享会话
+        url (str): 压缩包地址
+        limiter (RateLimiter): 可选，全局限速器
+
+    返回:
+        str: 十六进制SHA256；没有校验文件时返回None
+    """
+    content = fetch_archive(session, url + '.CHECKSUM', limiter, retries=1)
+    if not content:
+        return None
+    # 格式为 "<sha256>  <文件名>"
+    return content.decode('ascii', errors='ignore').split()[0].lower()
+
+
+def append_csv_day(df, file_path):
+    """把一天的数据以旧版CSV格式追加到文件末尾，文件不存在时先写表头
+
+    参数:
+        df (pd.DataFrame): read_kline_archive解析出的单日数据
+        file_path (str): CSV文件路径
     """
-    从Binance下载K线数据并处理（直接按天下载并拼接）
+    out = df.rename(columns=CSV_OUTPUT_COLUMNS)
+    out['Ignore'] = 0
+    # 添加datetime_utc列便于查看
+    out['datetime_utc'] = pd.to_datetime(out['timestamp'], unit='ms')
+    out.to_csv(file_path, mode='a', header=not os.path.exists(file_path), index=False)
+
+
+class DayCsvWriter:
+    """按日期顺序把逐天下载的数据增量追加到一个CSV文件
+
+    数据先写入 {output_file}.tmp，全部日期完成后再改名为正式文件。
+    并发下载时先到达的后面日期暂存在内存中，轮到它时再写出，
+    因此内存中最多只保留乱序到达的几天数据。
+    """
+
+    def __init__(self, output_file, date_list):
+        """
+        参数:
+            output_file (str): 最终CSV文件路径
+            date_list (list): 按顺序排列的全部日期
+        """
+        self.output_file = output_file
+        self.tmp_file = output_file + '.tmp'
+        self.date_list = date_list
+        self.next_index = 0
+        self.pending = {}
+        self.rows = 0
+        self.first_ts = None
+        self.last_ts = None
+        if os.path.exists(self.tmp_file):
+            os.remove(self.tmp_file)
+
+    @property
+    def done(self):
+        """是否所有日期都已处理"""
+        return self.next_index >= len(self.date_list)
+
+    def add(self, date, df):
+        """提交某一天的数据，df为None表示该天没有数据"""
+        self.pending[date] = df
+        while not self.done and self.date_list[self.next_index] in self.pending:
+            day_df = self.pending.pop(self.date_list[self.next_index])
+            self.next_index += 1
+            if day_df is None or len(day_df) == 0:
+                continue
+            append_csv_day(day_df, self.tmp_file)
+            self.rows += len(day_df)
+            if self.first_ts is None:
+                self.first_ts = int(day_df['timestamp'].iloc[0])
+            self.last_ts = int(day_df['timestamp'].iloc[-1])
+
+    def finish(self):
+        """完成写入
+
+        返回:
+            bool: 是否写出了任何数据
+        """
+        if self.rows:
+            os.replace(self.tmp_file, self.output_file)
+            return True
+        if os.path.exists(self.tmp_file):
+            os.remove(self.tmp_file)
+        return False
+
+
+def export_csv_range(store, symbol, date_list, output_file):
+    """从按天缓存的存储中拼出一个日期范围的CSV文件，每次只读入一天
+
+    参数:
+        store (MarketStore): 下载缓存
+        symbol (str): 交易对(带下划线)
+        date_list (list): 日期列表
+        output_file (str): CSV文件路径
+
+    返回:
+        DayCsvWriter: 已完成的写入器，rows为0表示缓存中没有任何数据
+    """
+    writer = DayCsvWriter(output_file, date_list)
+    for day in date_list:
+        writer.add(day, store.read(symbol, day, day) if store.has_day(symbol, day) else None)
+    writer.finish()
+    return writer
+
+
+def csv_up_to_date(store, symbol, date_list, output_file):
+    """CSV文件是否存在且不早于日期范围内的任何一天的缓存
+
+    参数:
+        store (MarketStore): 下载缓存
+        symbol (str): 交易对(带下划线)
+        date_list (list): 日期列表，每一天都应已在缓存中
+        output_file (str): CSV文件路径
+
+    返回:
+        bool: CSV无需重新导出
+    """
+    if not os.path.exists(output_file):
+        return False
+    newest = max(os.path.getmtime(store.day_path(symbol, day)) for day in date_list)
+    return os.path.getmtime(output_file) >= newest
+
+
+def download_days_concurrently(tasks, interval, workers=8, session=None, limiter=None, base_url=BINANCE_DATA_URL,
+                               verify_checksum=True):
+    """用线程池并发下载多个 (交易对, 日期) 的日数据
+
+    参数:
+        tasks (list): [(交易对(带下划线), 日期), ...]
+        interval (str): 时间间隔
+        workers (int): 并发线程数
+        session (requests.Session): 可选，共享会话，None时按workers创建
+        limiter (RateLimiter): 可选，全局限速器
+        base_url (str): 数据站地址，可指向本地测试服务器
+        verify_checksum (bool): 是否校验压缩包
+
+    返回:
+        generator: 按完成顺序产出 (交易对, 日期, DataFrame或None)
+    """
+    session = session or create_session(workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(download_daily_data, symbol.replace('_', ''), interval, date,
+                            session, limiter, base_url, verify_checksum): (symbol, date)
+            for symbol, date in tasks
+        }
+        for future in as_completed(futures):
+            symbol, date = futures[future]
+            try:
+                df = future.result()
+            except Exception as e:
+                logger.error(f"下载 {symbol} {date.strftime('%Y-%m-%d')} 时出错: {str(e)}")
+                df = None
+            yield symbol, date, df
+
+
+def download_kline_data(symbol, interval='1s', start_date=None, end_date=None, output_dir='./data', store=None,
+                        session=None):
+    """
+    从Binance下载K线数据并处理（按天下载并增量写出）
     
     参数:
         symbol (str): 币对名称，如'BTC_USDT'（带下划线）
@@ -23,9 +270,11 @@ def download_kline_data(symbol, interval='1s', start_date=None, end_date=None, o
         start_date (datetime或str): 起始日期，如果是字符串格式为'YYYY-MM-DD'
         end_date (datetime或str): 结束日期，如果是字符串格式为'YYYY-MM-DD'
         output_dir (str): 输出目录
+        store (MarketStore): 可选，提供时每天的数据直接写入列式存储，不再拼接CSV
+        session (requests.Session): 可选，复用的连接池会话
     
     返回:
-        str: 输出文件路径
+        str: 输出文件路径；写入列式存储时为该交易对的分区目录
     """
     # 处理带下划线的交易对格式 - 转换为Binance API格式
     binance_symbol = symbol.replace('_', '')
@@ -51,127 +300,98 @@ def download_kline_data(symbol, interval='1s', start_date=None, end_date=None, o
     # 创建工作目录
     os.makedirs(output_dir, exist_ok=True)
     
-    # 创建临时下载目录
-    temp_dir = f'{output_dir}/temp_{symbol}_{interval}'
-    os.makedirs(temp_dir, exist_ok=True)
-    
     logger.info(f"开始下载 {symbol} {interval} 数据")
     logger.info(f"下载日期范围: {start_date.strftime('%Y-%m-%d')} 到 {end_date.strftime('%Y-%m-%d')}")
     
-    # 生成待下载的日期列表
-    all_dfs = []
-    date_list = []
-    
     # 确保生成的日期列表包含所有指定的天
-    current_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
-    while current_date <= end_date:
-        date_list.append(current_date)
-        current_date = current_date + timedelta(days=1)
+    date_list = MarketStore.date_range(start_date, end_date)
+    
+    # 导出数据 - 使用原始symbol（保留下划线）
+    interval_str = interval.replace('s', 'sec').replace('m', 'min').replace('h', 'hour').replace('d', 'day')
+    output_file = f'{output_dir}/{symbol}_{interval_str}_{start_date.strftime("%Y%m%d")}_{end_date.strftime("%Y%m%d")}.csv'
+    writer = DayCsvWriter(output_file, date_list) if store is None else None
     
-    # 下载每天的数据
+    # 下载每天的数据，每天处理完即写出，不在内存中累积
+    session = session or create_session(1)
+    stored_days = 0
     for date in tqdm(date_list, desc=f"下载 {symbol} {interval} 数据"):
-        df = download_daily_data(binance_symbol, interval, date, temp_dir)  # 使用转换后的symbol
+        if store is not None and store.has_day(symbol, date):
+            stored_days += 1
+            continue
+        df = download_daily_data(binance_symbol, interval, date, session)  # 使用转换后的symbol
         if df is not None:
             logger.info(f"成功下载 {date.strftime('%Y-%m-%d')} 的数据，记录数: {len(df)}")
-            all_dfs.append(df)
+            if store is not None:
+                store.write_day(symbol, date, df)
+                stored_days += 1
         else:
             logger.warning(f"未能获取 {date.strftime('%Y-%m-%d')} 的数据")
-    
-    if not all_dfs:
-        logger.warning(f"未找到 {symbol} {interval} 的数据")
-        # 清理临时目录
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
-        return None
-    
-    # 合并数据
-    logger.info("合并数据并处理时间格式...")
-    merged_df = pd.concat(all_dfs, ignore_index=True)
-    
-    # 添加列名
-    merged_df.columns = [
-        "timestamp", "Open", "High", "Low", "Close", "Volume",
-        "close_timestamp", "Quote Asset Volume", "Number of Trades",
-        "Taker Buy Base Asset Volume", "Taker Buy Quote Asset Volume", "Ignore"
-    ]
-
-    # 将数值列转换为适当的类型
-    for col in ["Open", "High", "Low", "Close", "Volume"]:
-        merged_df[col] = pd.to_numeric(merged_df[col])
-    
-    # 添加datetime_utc列便于查看
-    merged_df["datetime_utc"] = pd.to_datetime(merged_df["timestamp"], unit='ms')
-    
-    # 排序数据
-    merged_df = merged_df.sort_values("timestamp")
-    
-    # 导出数据 - 使用原始symbol（保留下划线）
-    interval_str = interval.replace('s', 'sec').replace('m', 'min').replace('h', 'hour').replace('d', 'day')
-    output_file = f'{output_dir}/{symbol}_{interval_str}_{start_date.strftime("%Y%m%d")}_{end_date.strftime("%Y%m%d")}.csv'
-    
-    merged_df.to_csv(output_file, index=False)
-    
-    # logger.info(f"数据处理完成: {output_file}")
-    # logger.info(f"数据范围: {merged_df['datetime_utc'].min()} 至 {merged_df['datetime_utc'].max()}")
-    # logger.info(f"数据条数: {len(merged_df)}")
-    
-    # 清理临时目录
-    if os.path.exists(temp_dir):
-        shutil.rmtree(temp_dir)
-    
-    return output_file
+        if writer is not None:
+            writer.add(date, df)
+    
+    if store is not None:
+        if stored_days:
+            return os.path.join(store.base_dir, symbol)
+    elif writer.finish():
+        return output_file
+
+    logger.warning(f"未找到 {symbol} {interval} 的数据")
+    return None
+
+def download_daily_data(symbol, interval, date, session=None, limiter=None, base_url=BINANCE_DATA_URL,
+                        verify_checksum=True):
+    """下载每日数据，压缩包在内存中解压并直接解析
+
+    参数:
+        symbol (str): Binance格式的交易对，如'BTCUSDT'
+        interval (str): 时间间隔
+        date (datetime): 日期
+        session (requests.Session): 可选，共享会话，None时临时创建
+        limiter (RateLimiter): 可选，全局限速器
+        base_url (str): 数据站地址
+        verify_checksum (bool): 是否用Binance的 .CHECKSUM 文件校验压缩包，校验失败时重新下载一次
 
-def download_daily_data(symbol, interval, date, output_dir):
-    """下载每日数据"""
+    返回:
+        pd.DataFrame: 列名和类型符合KLINE_SCHEMA的单日数据；发布时间已过PUBLISH_LAG_DAYS天仍不存在(404)的日期
+            返回空表，下载或校验失败、或者近期的日期尚未发布时返回None
+    """
     filename = f'{symbol}-{interval}-{date.strftime("%Y-%m-%d")}'
-    url = f'https://data.binance.vision/data/spot/daily/klines/{symbol}/{interval}/{filename}.zip'
-    file_path = os.path.join(output_dir, filename + '.csv')
-    
-    if os.path.exists(file_path):
-        try:
-            return pd.read_csv(file_path, header=None)
-        except Exception as e:
-            logger.warning(f"读取本地文件失败，将重新下载: {str(e)}")
-            os.remove(file_path)
+    url = f'{base_url}/data/spot/daily/klines/{symbol}/{interval}/{filename}.zip'
+    session = session or create_session(1)
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        }
-        session = requests.Session()
-        session.trust_env = False
-        
-        response = session.get(url, headers=headers, timeout=30)
-
-        if response.status_code != 200:
-            logger.warning(f'下载失败: {url}, 状态码: {response.status_code}')
+        expected = fetch_checksum(session, url, limiter) if verify_checksum else None
+        for attempt in range(2):
+            content = fetch_archive(session, url, limiter)
+            if content is None:
+                return None
+            if not content:
+                if datetime.now(pytz.utc).replace(tzinfo=None) - date >= timedelta(days=PUBLISH_LAG_DAYS):
+                    logger.info(f"{filename} 不存在，记为没有数据")
+                    return KLINE_SCHEMA.empty_table().to_pandas()
+                return None
+            if expected is None or hashlib.sha256(content).hexdigest() == expected:
+                break
+            logger.warning(f"{filename} 校验失败，重新下载")
+        else:
+            logger.error(f"{filename} 两次下载均未通过校验，已放弃")
             return None
         
-        with zipfile.ZipFile(BytesIO(response.content)) as z:
-            z.extractall(output_dir)
+        df = read_kline_archive(content)
         
-        if os.path.exists(file_path):
-            df = pd.read_csv(file_path, header=None)
+        # 显示下载数据的时间范围
+        if len(df) > 0:
+            min_time = pd.to_datetime(df['timestamp'].min(), unit='ms')
+            max_time = pd.to_datetime(df['timestamp'].max(), unit='ms')
+            logger.debug(f"{filename} 时间范围: {min_time} 到 {max_time}")
             
-            # 处理可能的微秒级时间戳
-            if len(df) > 0 and df[0].max() > 1e13:
-                df[0] = df[0] // 1000  # 转换为毫秒
-                df[6] = df[6] // 1000  # Close time也要转换
-                
-            # 显示下载数据的时间范围
-            if len(df) > 0:
-                min_time = pd.to_datetime(df[0].min(), unit='ms')
-                max_time = pd.to_datetime(df[0].max(), unit='ms')
-                logger.debug(f"{filename} 时间范围: {min_time} 到 {max_time}")
-                
-            return df
-        else:
-            logger.warning(f"解压后未找到文件: {file_path}")
+        return df
     except Exception as e:
         logger.error(f"下载 {url} 时出错: {str(e)}")
     
     return None
 
-def batch_download_symbols(symbols, interval='1m', start_date=None, end_date=None, base_dir='./data', output_subdir=None):
+def batch_download_symbols(symbols, interval='1m', start_date=None, end_date=None, base_dir='./data', output_subdir=None, store_dir=None,
+                           workers=8, rate_limit=None, base_url=BINANCE_DATA_URL, cache_dir=None, verify_checksum=True):
     """
     批量下载多个交易对的K线数据
     
@@ -182,6 +402,13 @@ def batch_download_symbols(symbols, interval='1m', start_date=None, end_date=Non
         end_date (str/datetime): 结束日期
         base_dir (str): 基础数据目录
         output_subdir (str): 自定义输出子目录名，如果为None则使用默认命名格式
+        store_dir (str): 可选，列式存储根目录，提供时数据按 交易对/天 写入Parquet而不是CSV
+        workers (int): 并发下载线程数
+        rate_limit (float): 每秒最多请求数，None或0表示不限速
+        base_url (str): 数据站地址，可指向本地测试服务器
+        cache_dir (str): CSV模式下按 交易对/天 缓存下载数据的目录，默认为 {base_dir}/cache；
+            不同日期范围共享该缓存，只下载缓存中没有的日期，中断后重新运行即可续传
+        verify_checksum (bool): 是否用Binance的 .CHECKSUM 文件校验压缩包
     
     返回:
         tuple: (成功列表, 失败列表, 输出目录)
@@ -202,8 +429,14 @@ def batch_download_symbols(symbols, interval='1m', start_date=None, end_date=Non
         end_date_obj = end_date
         end_date = end_date_obj.strftime('%Y-%m-%d')
     
+    # 列式存储模式直接写入存储；CSV模式先把每天的数据写入按天缓存，再拼出日期范围的CSV
+    csv_output = not store_dir
+    store = MarketStore(store_dir or cache_dir or os.path.join(base_dir, 'cache'), interval)
+    
     # 创建输出目录
-    if output_subdir:
+    if not csv_output:
+        dir_name = store.base_dir
+    elif output_subdir:
         # 使用自定义子目录名
         dir_name = f"{base_dir}/{output_subdir}"
     else:
@@ -221,53 +454,79 @@ def batch_download_symbols(symbols, interval='1m', start_date=None, end_date=Non
     failed_symbols = []
     skipped_symbols = []
     
-    # 创建临时下载目录
-    temp_dir = os.path.join(base_dir, 'temp_download')
-    os.makedirs(temp_dir, exist_ok=True)
-    
-    # 批量下载每个交易对的数据
-    for symbol in tqdm(converted_symbols, desc="批量下载进度"):
+    # 确定每个交易对需要下载的日期，逐天按缓存判断，已缓存(包括确认没有数据)的日期不再下载
+    date_list = MarketStore.date_range(start_date_obj, end_date_obj)
+    pending_days = {}
+    for symbol in converted_symbols:
+        missing_days = [day for day in date_list if not store.has_day(symbol, day)]
+        if missing_days:
+            pending_days[symbol] = missing_days
+
+    # 所有 (交易对, 日期) 任务共用一个线程池和连接池
+    tasks = [(symbol, day) for symbol, days in pending_days.items() for day in days]
+    failed_days = {symbol: 0 for symbol in converted_symbols}
+    limiter = RateLimiter(rate_limit)
+    session = create_session(workers)
+    downloads = download_days_concurrently(tasks, interval, workers, session, limiter, base_url, verify_checksum)
+
+    progress = tqdm(total=len(tasks), desc="批量下载进度")
+    for symbol, date, df in downloads:
+        progress.update(1)
         try:
-            # 设置输出文件路径，文件名保留原始格式（带下划线）
-            output_file = os.path.join(dir_name, f"{symbol}.csv")
-            
-            if os.path.exists(output_file):
-                # 如果文件已存在，跳过下载
-                skipped_symbols.append(symbol)
-                success_symbols.append(symbol)
-                logger.info(f"{symbol} 数据已存在，跳过下载")
-                continue
-            
-            # 调用下载函数，但需要自定义输出文件
-            temp_file = download_kline_data(
-                symbol=symbol,  # 保持原始带下划线格式
-                interval=interval,
-                start_date=start_date_obj,
-                end_date=end_date_obj,
-                output_dir=temp_dir  # 临时目录
-            )
-            
-            # 如果下载成功，移动文件到最终位置
-            if temp_file and os.path.exists(temp_file):
-                # 读取数据
-                df = pd.read_csv(temp_file)
-                # 保存到目标位置
-                df.to_csv(output_file, index=False)
-                # 删除临时文件
-                os.remove(temp_file)
-                success_symbols.append(symbol)
-                
-                # 记录数据统计
-                logger.info(f"{symbol}: 成功下载 {len(df)}条记录，时间范围 {df['datetime_utc'].min()} 至 {df['datetime_utc'].max()}")
+            if df is None:
+                logger.warning(f"未能获取 {symbol} {date.strftime('%Y-%m-%d')} 的数据")
+                failed_days[symbol] += 1
             else:
+                # 每天下载完成即落盘，中断后已完成的日期不会重复下载；空表也写入，记录该天没有数据
+                store.write_day(symbol, date, df)
+        except Exception as e:
+            logger.error(f"保存 {symbol} {date.strftime('%Y-%m-%d')} 数据时出错: {str(e)}")
+            failed_days[symbol] += 1
+    progress.close()
+    session.close()
+
+    # 只有所有日期都已入库的交易对才算完成，CSV也只在此时拼出，缺失的日期下次运行时补齐
+    # 统计索引覆盖全部日期且总行数为0的交易对在范围内没有任何数据
+    summary = store.stats.pair_summary(start_date, end_date, converted_symbols)
+    empty_symbols = set(summary.index[(summary['days'] >= len(date_list)) & (summary['rows'] == 0)])
+    for symbol in converted_symbols:
+        if failed_days[symbol]:
+            logger.warning(f"{symbol} 有 {failed_days[symbol]} 天未能下载，重新运行将只下载这些日期")
+            failed_symbols.append(symbol)
+            continue
+        if symbol in empty_symbols:
+            logger.warning(f"{symbol} 在 {start_date} 至 {end_date} 没有任何数据")
+            failed_symbols.append(symbol)
+            continue
+        if not csv_output:
+            success_symbols.append(symbol)
+            continue
+
+        # 设置输出文件路径，文件名保留原始格式（带下划线）
+        output_file = os.path.join(dir_name, f"{symbol}.csv")
+        if symbol not in pending_days and csv_up_to_date(store, symbol, date_list, output_file):
+            skipped_symbols.append(symbol)
+            success_symbols.append(symbol)
+            logger.info(f"{symbol} 数据已存在，跳过下载")
+            continue
+        try:
+            writer = export_csv_range(store, symbol, date_list, output_file)
+            if not writer.rows:
                 failed_symbols.append(symbol)
+                continue
+            success_symbols.append(symbol)
+
+            # 记录数据统计
+            logger.info(f"{symbol}: 成功下载 {writer.rows}条记录，时间范围 "
+                        f"{pd.to_datetime(writer.first_ts, unit='ms')} 至 {pd.to_datetime(writer.last_ts, unit='ms')}")
         except Exception as e:
-            logger.error(f"下载 {symbol} 数据时出错: {str(e)}")
+            logger.error(f"导出 {symbol} 数据时出错: {str(e)}")
             failed_symbols.append(symbol)
-    
-    # 清理临时目录
-    if os.path.exists(temp_dir):
-        shutil.rmtree(temp_dir)
+
+    # 按输入顺序输出结果
+    succeeded, failed = set(success_symbols), set(failed_symbols)
+    success_symbols = [symbol for symbol in converted_symbols if symbol in succeeded]
+    failed_symbols = [symbol for symbol in converted_symbols if symbol in failed]
     
     # 输出下载结果摘要
     print("\n===== 下载完成 =====")
@@ -288,11 +547,14 @@ def batch_download_symbols(symbols, interval='1m', start_date=None, end_date=Non
     # 如果有成功下载的数据，显示第一个作为示例
     if success_symbols:
         example_symbol = success_symbols[0]
-        example_file = os.path.join(dir_name, f"{example_symbol}.csv")
         
         print(f"\n示例数据 ({example_symbol}):")
-        df = pd.read_csv(example_file)
-        df['datetime_utc'] = pd.to_datetime(df['datetime_utc'])
+        if not csv_output:
+            df = store.read(example_symbol, start_date_obj, end_date_obj, columns=['timestamp'])
+            df['datetime_utc'] = pd.to_datetime(df['timestamp'], unit='ms')
+        else:
+            df = pd.read_csv(os.path.join(dir_name, f"{example_symbol}.csv"))
+            df['datetime_utc'] = pd.to_datetime(df['datetime_utc'])
         
         # 显示每天的数据数量
         print("\n每日数据统计:")
@@ -306,13 +568,21 @@ def batch_download_symbols(symbols, interval='1m', start_date=None, end_date=Non
     return success_symbols, failed_symbols, dir_name
 
 
-###使用示例###
-if __name__ == "__main__":
-    from configs.ArbConfig import ArbConfig
-    config = ArbConfig()
+def main(config=None):
+    """按配置下载回测所需的全部数据
+
+    Args:
+        config: ArbConfig，None时使用默认配置
+    """
+    if config is None:
+        from configs.ArbConfig import ArbConfig
+        config = ArbConfig()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
     # 定义需要下载的交易对（带下划线格式）
     symbols = [pair for pair in config.selected_pairs]
+    # 使用列式存储时直接写入Parquet
+    store_dir = config.store_dir if config.data_format == 'parquet' else None
     
     # 从配置中获取批量日期并下载
     if hasattr(config, 'batch_test_dates') and config.batch_test_dates:
@@ -327,7 +597,11 @@ if __name__ == "__main__":
                 start_date=start_date,
                 end_date=end_date,
                 base_dir=config.data_dir,
-                output_subdir=f"{config.interval}_{start_date.replace('-', '')}_{end_date.replace('-', '')}"
+                output_subdir=f"{config.interval}_{start_date.replace('-', '')}_{end_date.replace('-', '')}",
+                store_dir=store_dir,
+                workers=config.download_workers,
+                rate_limit=config.download_rate_limit,
+                cache_dir=config.store_dir
             )
             
             if success:
@@ -341,5 +615,13 @@ if __name__ == "__main__":
             interval=config.interval,
             start_date=config.start_date,
             end_date=config.end_date,
-            base_dir=config.data_dir
-        )
\ No newline at end of file
+            base_dir=config.data_dir,
+            store_dir=store_dir,
+            workers=config.download_workers,
+            rate_limit=config.download_rate_limit,
+            cache_dir=config.store_dir
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import numpy as np
+from typing import Iterable, Optional
+
+# 每个2的幂区间细分的桶数(2^SUB_BITS)，相对误差不超过 1/2^SUB_BITS (约0.8%)
+SUB_BITS = 7
+SUB_COUNT = 1 << SUB_BITS
+# 可记录的最大移位，2^(MAX_SHIFT+SUB_BITS+1)纳秒约为9.8小时，更大的值记入最后一个桶
+MAX_SHIFT = 38
+NUM_BUCKETS = (MAX_SHIFT + 2) * SUB_COUNT
+# 默认报告的分位数
+REPORT_PERCENTILES = (50, 90, 99, 99.9)
+
+
+def bucket_index(value: int) -> int:
+    """纳秒值所在的桶
+
+    小于 2*SUB_COUNT 的值每个整数一个桶；更大的值按最高 SUB_BITS+1 位分桶，
+    即每个2的幂区间等分为SUB_COUNT个桶(对数-线性分桶，同HdrHistogram)。
+    """
+    if value < 2 * SUB_COUNT:
+        return max(value, 0)
+    shift = value.bit_length() - SUB_BITS - 1
+    if shift > MAX_SHIFT:
+        return NUM_BUCKETS - 1
+    return shift * SUB_COUNT + (value >> shift)
+
+
+def bucket_bounds(index: np.ndarray):
+    """桶的取值范围 [下界, 上界]，纳秒"""
+    index = np.asarray(index, dtype=np.int64)
+    shift = np.maximum(index // SUB_COUNT - 1, 0)
+    top = index - shift * SUB_COUNT
+    lower = top << shift
+    upper = ((top + 1) << shift) - 1
+    return lower, upper
+
+
+class LatencyHistogram:
+    """固定内存的延迟直方图
+
+    记录纳秒耗时，桶数固定(NUM_BUCKETS)，与记录次数无关。只在单个线程中
+    记录，不加锁；不同进程的直方图通过to_dict/from_dict传递后用merge合并。
+    """
+
+    __slots__ = ('counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.counts = [0] * NUM_BUCKETS
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def record(self, value: int):
+        """记录一次耗时(纳秒)"""
+        self.counts[bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: 'LatencyHistogram') -> 'LatencyHistogram':
+        """把另一个直方图的记录合并进来"""
+        for i, n in enumerate(other.counts):
+            if n:
+                self.counts[i] += n
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+        return self
+
+    def percentile(self, q: float) -> Optional[int]:
+        """第q百分位的耗时(纳秒)，取所在桶的上界，不超过记录到的最大值"""
+        if not self.count:
+            return None
+        counts = np.asarray(self.counts, dtype=np.int64)
+        rank = max(int(np.ceil(q / 100 * self.count)), 1)
+        index = int(np.searchsorted(np.cumsum(counts), rank))
+        if index == NUM_BUCKETS - 1:
+            # 溢出桶没有上界
+            return self.max
+        _, upper = bucket_bounds(index)
+        return int(min(upper, self.max))
+
+    def summary(self, percentiles: Iterable[float] = REPORT_PERCENTILES) -> dict:
+        """以毫秒为单位的统计摘要: count、mean_ms、min_ms、max_ms 和 p50_ms 等分位数"""
+        if not self.count:
+            return {'count': 0}
+        result = {
+            'count': self.count,
+            'mean_ms': self.total / self.count / 1e6,
+            'min_ms': self.min / 1e6,
+            'max_ms': self.max / 1e6,
+        }
+        for q in percentiles:
+            result[f"p{q:g}_ms"] = self.percentile(q) / 1e6
+        return result
+
+    def format_summary(self) -> str:
+        """用于日志的单行描述"""
+        summary = self.summary()
+        if not summary['count']:
+            return "无记录"
+        quantiles = ", ".join(f"{key[:-3]}={value:.3f}ms" for key, value in summary.items()
+                              if key.startswith('p'))
+        return (f"{summary['count']}次, 平均={summary['mean_ms']:.3f}ms, {quantiles}, "
+                f"最长={summary['max_ms']:.3f}ms")
+
+    def to_dict(self) -> dict:
+        """可JSON序列化、可跨进程传递的稀疏表示"""
+        return {
+            'sub_bits': SUB_BITS,
+            'count': self.count,
+            'total_ns': self.total,
+            'min_ns': self.min,
+            'max_ns': self.max,
+            'buckets': {str(i): n for i, n in enumerate(self.counts) if n},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'LatencyHistogram':
+        """由to_dict的结果还原"""
+        if data.get('sub_bits') != SUB_BITS:
+            raise ValueError(f"直方图精度不一致: {data.get('sub_bits')} != {SUB_BITS}")
+        histogram = cls()
+        for i, n in data['buckets'].items():
+            histogram.counts[int(i)] = n
+        histogram.count = data['count']
+        histogram.total = data['total_ns']
+        histogram.min = data['min_ns']
+        histogram.max = data['max_ns']
+        return histogram
@@ -0,0 +1,282 @@
+import os
+import glob
+import logging
+import zipfile
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from io import BytesIO
+
+from pair_stats import PairStatsIndex, STATS_DB, compute_day_stats, interval_to_ms
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+store_logger = logging.getLogger('market_store')
+
+DAY_MS = 86_400_000
+
+# 列式存储的K线字段及类型，顺序与Binance原始K线文件一致
+KLINE_SCHEMA = pa.schema([
+    ('timestamp', pa.int64()),
+    ('open', pa.float64()),
+    ('high', pa.float64()),
+    ('low', pa.float64()),
+    ('close', pa.float64()),
+    ('volume', pa.float64()),
+    ('close_timestamp', pa.int64()),
+    ('quote_volume', pa.float64()),
+    ('num_trades', pa.int64()),
+    ('taker_buy_base_volume', pa.float64()),
+    ('taker_buy_quote_volume', pa.float64()),
+])
+KLINE_COLUMNS = KLINE_SCHEMA.names
+# Binance原始K线文件的最后一列为保留字段
+ARCHIVE_COLUMNS = KLINE_COLUMNS + ['ignore']
+# 大于该值的时间戳为微秒
+MICROSECOND_THRESHOLD = 10 ** 13
+
+# 旧版CSV列名 -> 列式存储列名
+CSV_COLUMN_MAP = {
+    'timestamp': 'timestamp',
+    'Open': 'open',
+    'High': 'high',
+    'Low': 'low',
+    'Close': 'close',
+    'Volume': 'volume',
+    'close_timestamp': 'close_timestamp',
+    'Quote Asset Volume': 'quote_volume',
+    'Number of Trades': 'num_trades',
+    'Taker Buy Base Asset Volume': 'taker_buy_base_volume',
+    'Taker Buy Quote Asset Volume': 'taker_buy_quote_volume',
+}
+
+
+def normalize_klines(df: pd.DataFrame) -> pd.DataFrame:
+    """将原始K线数据整理为存储格式
+
+    Args:
+        df: 无表头的Binance原始K线(12列)、旧版CSV格式或已是存储列名的DataFrame
+
+    Returns:
+        pd.DataFrame: 列名和类型符合KLINE_SCHEMA、按时间排序的DataFrame
+    """
+    if 'Open' in df.columns:
+        df = df.rename(columns=CSV_COLUMN_MAP)
+    elif 'open' not in df.columns:
+        df = df.iloc[:, :len(KLINE_COLUMNS)].copy()
+        df.columns = KLINE_COLUMNS
+    df = df[KLINE_COLUMNS]
+    df = df.astype({field.name: field.type.to_pandas_dtype() for field in KLINE_SCHEMA})
+    return df.sort_values('timestamp', kind='stable').reset_index(drop=True)
+
+
+def read_kline_archive(source) -> pd.DataFrame:
+    """在内存中解压Binance日K线压缩包并直接解析为存储格式
+
+    压缩包成员以流的方式交给Arrow的CSV解析器，按KLINE_SCHEMA直接解析为
+    定长类型数组，微秒时间戳在同一遍中转换为毫秒，不落地临时文件。
+
+    Args:
+        source: 压缩包内容(bytes)或可读的文件对象
+
+    Returns:
+        pd.DataFrame: 列名和类型符合KLINE_SCHEMA的DataFrame
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = BytesIO(source)
+    with zipfile.ZipFile(source) as archive:
+        with archive.open(archive.namelist()[0]) as member:
+            table = pa_csv.read_csv(
+                member,
+                read_options=pa_csv.ReadOptions(column_names=ARCHIVE_COLUMNS),
+                convert_options=pa_csv.ConvertOptions(column_types=KLINE_SCHEMA, include_columns=KLINE_COLUMNS)
+            )
+
+    # 新版数据的时间戳为微秒，统一转换为毫秒
+    if table.num_rows and pc.max(table['timestamp']).as_py() > MICROSECOND_THRESHOLD:
+        for name in ('timestamp', 'close_timestamp'):
+            index = table.schema.get_field_index(name)
+            table = table.set_column(index, name, pc.divide(table[name], 1000))
+    return table.to_pandas()
+
+
+def _to_day(day) -> datetime:
+    """把字符串或datetime转换为当天零点"""
+    if isinstance(day, str):
+        day = datetime.strptime(day, '%Y-%m-%d')
+    return day.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+
+
+class MarketStore:
+    """按 交易对/天 分区的Parquet K线存储
+
+    目录结构为 {root}/{interval}/{交易对}/{YYYY-MM-DD}.parquet，
+    时间戳为int64毫秒，价格和成交量为float64，读取时只解码需要的列。
+    每写入一天同时更新 {root}/{interval}/_stats.sqlite 中的逐日统计。
+    """
+
+    def __init__(self, root: str, interval: str = '1s'):
+        """
+        Args:
+            root: 存储根目录
+            interval: K线间隔
+        """
+        self.root = root
+        self.interval = interval
+        self.base_dir = os.path.join(root, interval)
+        self.stats = PairStatsIndex(os.path.join(self.base_dir, STATS_DB))
+
+    def day_path(self, pair: str, day) -> str:
+        """交易对某一天的分区文件路径"""
+        return os.path.join(self.base_dir, pair, f"{_to_day(day).strftime('%Y-%m-%d')}.parquet")
+
+    def has_day(self, pair: str, day) -> bool:
+        """分区文件是否存在"""
+        return os.path.exists(self.day_path(pair, day))
+
+    def has_range(self, pair: str, start_date, end_date) -> bool:
+        """日期范围内的每一天是否都已入库"""
+        return all(self.has_day(pair, day) for day in self.date_range(start_date, end_date))
+
+    @staticmethod
+    def date_range(start_date, end_date) -> List[datetime]:
+        """闭区间内的每一天"""
+        current = _to_day(start_date)
+        end = _to_day(end_date)
+        days = []
+        while current <= end:
+            days.append(current)
+            current += timedelta(days=1)
+        return days
+
+    def pairs(self) -> List[str]:
+        """存储中已有的交易对"""
+        if not os.path.isdir(self.base_dir):
+            return []
+        return sorted(name for name in os.listdir(self.base_dir)
+                      if os.path.isdir(os.path.join(self.base_dir, name)))
+
+    def days(self, pair: str) -> List[str]:
+        """交易对已入库的日期(YYYY-MM-DD)"""
+        files = glob.glob(os.path.join(self.base_dir, pair, "*.parquet"))
+        return sorted(os.path.splitext(os.path.basename(f))[0] for f in files)
+
+    def write_day(self, pair: str, day, df: pd.DataFrame) -> str:
+        """写入交易对某一天的数据，已存在时覆盖
+
+        Args:
+            pair: 交易对(下划线格式)
+            day: 日期
+            df: normalize_klines整理后的DataFrame
+
+        Returns:
+            str: 分区文件路径
+        """
+        path = self.day_path(pair, day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        table = pa.Table.from_pandas(df, schema=KLINE_SCHEMA, preserve_index=False)
+        # 先写临时文件再改名，避免中断后留下损坏的分区
+        tmp_path = path + '.tmp'
+        pq.write_table(table, tmp_path, compression='zstd')
+        os.replace(tmp_path, path)
+        self.stats.record(pair, _to_day(day).strftime('%Y-%m-%d'), compute_day_stats(df, interval_to_ms(self.interval)))
+        return path
+
+    def write_frame(self, pair: str, df: pd.DataFrame) -> List[str]:
+        """按UTC日期拆分数据并逐天写入
+
+        Args:
+            pair: 交易对(下划线格式)
+            df: normalize_klines整理后的DataFrame，可跨多天
+
+        Returns:
+            list: 写入的分区文件路径
+        """
+        paths = []
+        day_index = df['timestamp'].to_numpy() // DAY_MS
+        for day_number in np.unique(day_index):
+            day = datetime(1970, 1, 1) + timedelta(days=int(day_number))
+            paths.append(self.write_day(pair, day, df[day_index == day_number]))
+        return paths
+
+    def read(self, pair: str, start_date, end_date, columns: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
+        """读取交易对在日期范围内的数据
+
+        Args:
+            pair: 交易对(下划线格式)
+            start_date: 起始日期
+            end_date: 结束日期(包含)
+            columns: 需要读取的列，None表示全部
+
+        Returns:
+            pd.DataFrame: 按时间排序的数据，范围内没有任何数据时返回None
+        """
+        tables = []
+        for day in self.date_range(start_date, end_date):
+            path = self.day_path(pair, day)
+            if os.path.exists(path):
+                tables.append(pq.read_table(path, columns=columns))
+            else:
+                store_logger.debug(f"{pair} 缺少 {day.strftime('%Y-%m-%d')} 的数据")
+        if not tables:
+            return None
+        return pa.concat_tables(tables).to_pandas()
+
+    def iter_batches(self, pair: str, start_date, end_date, columns: Optional[List[str]] = None,
+                     batch_rows: int = 65536):
+        """按时间顺序逐块读取交易对在日期范围内的数据，不把整个范围读入内存
+
+        Args:
+            pair: 交易对(下划线格式)
+            start_date: 起始日期
+            end_date: 结束日期(包含)
+            columns: 需要读取的列，None表示全部
+            batch_rows: 每块最多行数
+
+        Yields:
+            pa.RecordBatch: 数据块
+        """
+        for day in self.date_range(start_date, end_date):
+            path = self.day_path(pair, day)
+            if not os.path.exists(path):
+                store_logger.debug(f"{pair} 缺少 {day.strftime('%Y-%m-%d')} 的数据")
+                continue
+            yield from pq.ParquetFile(path).iter_batches(batch_size=batch_rows, columns=columns)
+
+
+def convert_csv_dir(csv_dir: str, store: MarketStore) -> List[str]:
+    """将旧版按日期范围存放的CSV目录迁移到列式存储
+
+    Args:
+        csv_dir: 包含 {交易对}.csv 的目录，如 ./data_binance/1s_20250407_20250407
+        store: 目标存储
+
+    Returns:
+        list: 成功迁移的交易对
+    """
+    converted = []
+    for file_path in sorted(glob.glob(os.path.join(csv_dir, "*.csv"))):
+        pair = os.path.splitext(os.path.basename(file_path))[0]
+        try:
+            df = pd.read_csv(file_path, usecols=list(CSV_COLUMN_MAP))
+            store.write_frame(pair, normalize_klines(df))
+            converted.append(pair)
+            store_logger.info(f"已迁移 {pair}: {len(df)} 条记录")
+        except Exception as e:
+            store_logger.error(f"迁移 {file_path} 时出错: {str(e)}")
+    return converted
+
+
+if __name__ == "__main__":
+    from configs.ArbConfig import ArbConfig
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    config = ArbConfig()
+    store = MarketStore(config.store_dir, config.interval)
+
+    for csv_dir in sorted(glob.glob(os.path.join(config.data_dir, f"{config.interval}_*"))):
+        if os.path.isdir(csv_dir):
+            pairs = convert_csv_dir(csv_dir, store)
+            print(f"{csv_dir}: 迁移 {len(pairs)} 个交易对")
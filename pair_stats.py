@@ -0,0 +1,184 @@
+import os
+import sqlite3
+import logging
+import numpy as np
+import pandas as pd
+from contextlib import closing
+from typing import List, Optional
+
+stats_logger = logging.getLogger('pair_stats')
+
+STATS_DB = '_stats.sqlite'
+
+# 每个交易对每天一行的统计
+DAY_STATS_COLUMNS = [
+    'pair', 'day', 'rows', 'first_ts', 'last_ts', 'missing_bars', 'max_gap_ms',
+    'volume', 'quote_volume', 'num_trades', 'high', 'low',
+]
+
+_CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS day_stats (
+    pair TEXT NOT NULL,
+    day TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    first_ts INTEGER,
+    last_ts INTEGER,
+    missing_bars INTEGER NOT NULL,
+    max_gap_ms INTEGER NOT NULL,
+    volume REAL NOT NULL,
+    quote_volume REAL NOT NULL,
+    num_trades INTEGER NOT NULL,
+    high REAL,
+    low REAL,
+    PRIMARY KEY (pair, day)
+)
+"""
+
+
+def interval_to_ms(interval: str) -> int:
+    """K线间隔字符串转换为毫秒，如 '1s' -> 1000, '15m' -> 900000"""
+    units = {'s': 1000, 'm': 60_000, 'h': 3_600_000, 'd': 86_400_000}
+    return int(interval[:-1]) * units[interval[-1]]
+
+
+def compute_day_stats(df: pd.DataFrame, interval_ms: int) -> dict:
+    """计算单日K线的统计
+
+    Args:
+        df: 列名符合KLINE_SCHEMA、按时间排序的单日数据
+        interval_ms: K线间隔(毫秒)，用于统计缺失的K线
+
+    Returns:
+        dict: DAY_STATS_COLUMNS中除pair/day以外的字段
+    """
+    if len(df) == 0:
+        return dict(rows=0, first_ts=None, last_ts=None, missing_bars=0, max_gap_ms=0,
+                    volume=0.0, quote_volume=0.0, num_trades=0, high=None, low=None)
+
+    ts = df['timestamp'].to_numpy(dtype=np.int64)
+    gaps = np.diff(ts)
+    return dict(
+        rows=int(len(df)),
+        first_ts=int(ts[0]),
+        last_ts=int(ts[-1]),
+        missing_bars=int(np.maximum(gaps // interval_ms - 1, 0).sum()) if len(gaps) else 0,
+        max_gap_ms=int(gaps.max()) if len(gaps) else 0,
+        volume=float(df['volume'].sum()),
+        quote_volume=float(df['quote_volume'].sum()) if 'quote_volume' in df.columns else 0.0,
+        num_trades=int(df['num_trades'].sum()) if 'num_trades' in df.columns else 0,
+        high=float(df['high'].max()),
+        low=float(df['low'].min()),
+    )
+
+
+class PairStatsIndex:
+    """按 交易对/天 的统计索引，保存在存储目录下的SQLite文件中
+
+    数据入库时由MarketStore.write_day同步写入，选币、数据完整性检查和
+    流动性评分只查询这张小表，不需要打开Parquet分区。
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path: SQLite文件路径
+        """
+        self.db_path = db_path
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute(_CREATE_TABLE)
+        return conn
+
+    def record(self, pair: str, day: str, stats: dict):
+        """写入或覆盖交易对某一天的统计
+
+        Args:
+            pair: 交易对(下划线格式)
+            day: 日期(YYYY-MM-DD)
+            stats: compute_day_stats的结果
+        """
+        row = {'pair': pair, 'day': day, **stats}
+        placeholders = ', '.join('?' for _ in DAY_STATS_COLUMNS)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO day_stats ({', '.join(DAY_STATS_COLUMNS)}) VALUES ({placeholders})",
+                [row[column] for column in DAY_STATS_COLUMNS]
+            )
+
+    def day_stats(self, start_date: str, end_date: str, pairs: Optional[List[str]] = None) -> pd.DataFrame:
+        """查询日期范围(含两端)内的逐日统计
+
+        Args:
+            start_date: 起始日期(YYYY-MM-DD)
+            end_date: 结束日期(YYYY-MM-DD)
+            pairs: 只查询这些交易对，None表示全部
+
+        Returns:
+            pd.DataFrame: 列为DAY_STATS_COLUMNS
+        """
+        if not os.path.exists(self.db_path):
+            return pd.DataFrame(columns=DAY_STATS_COLUMNS)
+        with closing(self._connect()) as conn:
+            df = pd.read_sql_query(
+                "SELECT * FROM day_stats WHERE day >= ? AND day <= ? ORDER BY pair, day",
+                conn, params=(start_date, end_date)
+            )
+        if pairs is not None:
+            df = df[df['pair'].isin(set(pairs))]
+        return df
+
+    def pair_summary(self, start_date: str, end_date: str, pairs: Optional[List[str]] = None) -> pd.DataFrame:
+        """按交易对汇总日期范围内的统计
+
+        Returns:
+            pd.DataFrame: 以交易对为索引，包含 days、rows、first_ts、last_ts、missing_bars、
+                max_gap_ms、volume、quote_volume、num_trades、high、low、avg_volume、avg_trades
+        """
+        df = self.day_stats(start_date, end_date, pairs)
+        summary = df.groupby('pair').agg(
+            days=('day', 'count'),
+            rows=('rows', 'sum'),
+            first_ts=('first_ts', 'min'),
+            last_ts=('last_ts', 'max'),
+            missing_bars=('missing_bars', 'sum'),
+            max_gap_ms=('max_gap_ms', 'max'),
+            volume=('volume', 'sum'),
+            quote_volume=('quote_volume', 'sum'),
+            num_trades=('num_trades', 'sum'),
+            high=('high', 'max'),
+            low=('low', 'min'),
+        )
+        rows = summary['rows'].where(summary['rows'] > 0)
+        summary['avg_volume'] = (summary['volume'] / rows).fillna(0.0)
+        summary['avg_trades'] = (summary['num_trades'] / rows).fillna(0.0)
+        return summary
+
+    def rebuild(self, store) -> int:
+        """扫描存储中已有的全部分区，重建统计索引
+
+        Args:
+            store: MarketStore
+
+        Returns:
+            int: 写入的 交易对/天 数
+        """
+        interval_ms = interval_to_ms(store.interval)
+        count = 0
+        for pair in store.pairs():
+            for day in store.days(pair):
+                df = store.read(pair, day, day)
+                self.record(pair, day, compute_day_stats(df, interval_ms))
+                count += 1
+            stats_logger.info(f"已索引 {pair}")
+        return count
+
+
+if __name__ == "__main__":
+    from configs.ArbConfig import ArbConfig
+    from market_store import MarketStore
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    config = ArbConfig()
+    store = MarketStore(config.store_dir, config.interval)
+    print(f"{store.base_dir}: 索引 {store.stats.rebuild(store)} 个交易对/天")
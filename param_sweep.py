@@ -0,0 +1,252 @@
+import os
+import logging
+import datetime
+import itertools
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+
+from DataManager import DataManager
+from price_matrix import PriceMatrix
+from tri_arb import calculate_arb_paths
+from results_catalog import ResultsCatalog
+
+RESULTS_DIR = './results'
+
+# 可扫描的参数，名称与ArbConfig字段一致
+SWEEP_PARAMS = ('threshold', 'commission_taker', 'trade_amount', 'max_positions', 'skip_seconds')
+# 每块gross rate及其临时数组(行数 × 路径数)占用内存的上限，块的行数由路径数决定
+SWEEP_CHUNK_BYTES = 256 << 20
+# 每条路径每行占用的字节: gross、逐腿累加的临时数组(float64)和无效标记(bool)
+_PATH_ROW_BYTES = 18
+
+
+def parameter_grid(**axes) -> List[Dict]:
+    """生成参数网格的笛卡尔积
+
+    Args:
+        **axes: 参数名 -> 取值列表，如 threshold=[0.001, 0.002]
+
+    Returns:
+        list: 参数字典列表
+    """
+    unknown = set(axes) - set(SWEEP_PARAMS)
+    if unknown:
+        raise ValueError(f"不支持扫描的参数: {sorted(unknown)}")
+    names = list(axes)
+    return [dict(zip(names, values)) for values in itertools.product(*(axes[name] for name in names))]
+
+
+class ParameterSweep:
+    """单次遍历的参数扫描
+
+    每根K线只计算一次各路径不含手续费的对数汇率(gross rate)，再对所有
+    参数组同时向量化地应用手续费、阈值、最大持仓和跳过秒数规则。
+    没有任何参数组可能成交的K线直接跳过，不进入逐K线循环。与回放引擎一样，
+    只遍历参与回测的交易对有K线的行，价格年龄超过max_age的腿与无效价格同样处理。
+    """
+
+    def __init__(self, matrix: PriceMatrix, path_set, pairs: Optional[List[str]] = None, max_age: float = 0):
+        """
+        Args:
+            matrix: 对齐后的价格矩阵
+            path_set: 套利路径集合
+            pairs: 参与回测的交易对，用于确定遍历的行，None表示矩阵的全部列
+            max_age: 价格年龄上限(秒)，0表示不限制，与ArbConfig.max_price_age一致
+        """
+        self.matrix = matrix
+        self.path_set = path_set
+        self.max_age = max_age
+        num_feeds = len(matrix.pairs)
+        columns = matrix.columns_of(pairs or matrix.pairs)
+        self.rows = matrix.bar_rows(columns, matrix.first_complete_row(columns))
+        self.leg_idx = path_set.feed_index(matrix.pairs, missing=num_feeds)
+        self.leg_sign = path_set.leg_dir.astype(np.float64)
+        self.num_legs = path_set.num_legs.astype(np.float64)
+        self.valid = ((self.leg_idx < num_feeds) | (path_set.leg_pair < 0)).all(axis=1)
+
+    def gross_rates(self, rows) -> np.ndarray:
+        """计算若干行上各路径不含手续费的对数汇率
+
+        Args:
+            rows: 行切片或行号数组
+
+        Returns:
+            np.ndarray: (行数, 路径数)，含无效或过期价格的路径为-inf
+        """
+        close = np.asarray(self.matrix.close[rows])
+        bad = ~(close > 0)
+        if self.max_age:
+            bad |= np.asarray(self.matrix.age[rows]) > self.max_age
+        log_prices = np.zeros((close.shape[0], close.shape[1] + 1))
+        log_prices[:, :-1] = np.log(np.where(bad, 1.0, close))
+        bad_ext = np.zeros(log_prices.shape, dtype=bool)
+        bad_ext[:, :-1] = bad
+
+        # 逐腿累加，临时数组只有 (行数, 路径数)，不随腿数增长
+        gross = np.zeros((close.shape[0], len(self.valid)))
+        invalid = np.broadcast_to(~self.valid, gross.shape).copy()
+        for leg in range(self.leg_idx.shape[1]):
+            gross += log_prices[:, self.leg_idx[:, leg]] * self.leg_sign[:, leg]
+            invalid |= bad_ext[:, self.leg_idx[:, leg]]
+        gross[invalid] = -np.inf
+        return gross
+
+    def chunk_rows(self, max_rows: int = 4096) -> int:
+        """每次计算gross rate的行数，使每块的内存不超过SWEEP_CHUNK_BYTES"""
+        return int(np.clip(SWEEP_CHUNK_BYTES // (max(len(self.valid), 1) * _PATH_ROW_BYTES), 1, max_rows))
+
+    def run(self, param_sets: List[Dict], initial_cash: float, chunk_rows: Optional[int] = None) -> pd.DataFrame:
+        """对所有参数组同时回放
+
+        Args:
+            param_sets: 参数字典列表，键为SWEEP_PARAMS中的字段
+            initial_cash: 初始资金
+            chunk_rows: 每次计算gross rate的行数，None时按路径数由chunk_rows()决定
+
+        Returns:
+            pd.DataFrame: 每个参数组一行的结果表
+        """
+        params = pd.DataFrame(param_sets)
+        missing = set(SWEEP_PARAMS) - set(params.columns)
+        if missing:
+            raise ValueError(f"参数组缺少字段: {sorted(missing)}")
+
+        threshold = params['threshold'].to_numpy(dtype=np.float64)
+        fee = params['commission_taker'].to_numpy(dtype=np.float64)
+        amount = params['trade_amount'].to_numpy(dtype=np.float64)
+        max_positions = params['max_positions'].to_numpy(dtype=np.int64)
+        skip_ms = params['skip_seconds'].to_numpy(dtype=np.int64) * 1000
+
+        num_sets = len(params)
+        cash = np.full(num_sets, float(initial_cash))
+        total_profit = np.zeros(num_sets)
+        num_trades = np.zeros(num_sets, dtype=np.int64)
+        skip_until = np.full(num_sets, np.iinfo(np.int64).min)
+
+        # 按手续费分组，每组的路径手续费项只算一次
+        fee_groups = []
+        for fee_value in np.unique(fee):
+            members = np.flatnonzero(fee == fee_value)
+            fee_groups.append((members, self.num_legs * np.log1p(-fee_value), threshold[members].min()))
+
+        # 任何参数组都不会成交的K线: gross rate低于最宽松的阈值和手续费组合
+        hot_floor = np.log1p(threshold.min()) - self.num_legs * np.log1p(-fee.min())
+
+        timestamps = self.matrix.timestamps
+        chunk_rows = chunk_rows or self.chunk_rows()
+        for chunk_start in range(0, len(self.rows), chunk_rows):
+            rows = self.rows[chunk_start:chunk_start + chunk_rows]
+            gross = self.gross_rates(rows)
+            for i in np.flatnonzero((gross > hot_floor).any(axis=1)):
+                ts = int(timestamps[rows[i]])
+                active = ts >= skip_until
+                if not active.any():
+                    continue
+
+                capacity = np.minimum(max_positions, np.floor(cash / amount)).astype(np.int64)
+                capacity[~active] = 0
+                executed = np.zeros(num_sets, dtype=np.int64)
+
+                for members, log_fee, group_min_threshold in fee_groups:
+                    profits = np.expm1(gross[i] + log_fee)
+                    candidates = profits[profits > group_min_threshold]
+                    if len(candidates) == 0:
+                        continue
+                    # 降序排列后的前缀和即执行前n条路径的收益率之和
+                    descending = np.sort(candidates)[::-1]
+                    prefix = np.concatenate(([0.0], np.cumsum(descending)))
+                    above = np.searchsorted(-descending, -threshold[members], side='left')
+                    n = np.minimum(capacity[members], above)
+                    gain = amount[members] * prefix[n]
+                    cash[members] += gain
+                    total_profit[members] += gain
+                    num_trades[members] += n
+                    executed[members] = n
+
+                traded = executed > 0
+                skip_until[traded] = ts + skip_ms[traded]
+
+        results = params.copy()
+        results['final_value'] = cash
+        results['absolute_profit'] = cash - initial_cash
+        results['percent_profit'] = (cash / initial_cash - 1) * 100
+        results['triangle_arb_trades'] = num_trades
+        results['total_arb_profit'] = total_profit
+        return results
+
+
+def run_sweep(config, grid: Dict[str, list], save: bool = True) -> Optional[pd.DataFrame]:
+    """加载一次数据并扫描参数网格
+
+    Args:
+        config: ArbConfig，提供数据目录、交易对、基础货币以及未扫描参数的取值
+        grid: 参数名 -> 取值列表，未出现的参数使用config中的值
+        save: 是否把结果表保存到results目录
+
+    Returns:
+        pd.DataFrame: 结果表，按收益率降序；数据加载失败时返回None
+    """
+    axes = {name: [getattr(config, name)] for name in SWEEP_PARAMS}
+    axes.update(grid)
+    param_sets = parameter_grid(**axes)
+
+    data_manager = DataManager(config)
+    pairs = config.selected_pairs
+    if config.matrix_cache:
+        matrix = data_manager.load_price_matrix(pairs, config.specific_data_dir)
+    else:
+        matrix = PriceMatrix.from_frames(data_manager.load_frames(pairs, config.specific_data_dir))
+    if matrix is None or not data_manager.check_loaded():
+        logging.error("数据加载失败，无法进行参数扫描")
+        return None
+
+    # 参数扫描只评估主基础货币的路径
+    base_currency = config.base_currency_list()[0]
+    if len(config.base_currency_list()) > 1:
+        logging.warning(f"参数扫描只支持单一基础货币，只扫描主基础货币 {base_currency}")
+    path_set, _, _ = calculate_arb_paths(data_manager.loaded_pairs, base_currency, save_to_file=False,
+                                         max_legs=config.max_path_legs, use_cache=config.path_cache)
+    logging.info(f"开始参数扫描: {len(param_sets)} 组参数, {len(path_set)} 条路径, {len(matrix)} 个时间点")
+
+    start_time = datetime.datetime.now()
+    sweep = ParameterSweep(matrix, path_set, data_manager.loaded_pairs, config.max_price_age)
+    results = sweep.run(param_sets, config.initial_cash)
+    results = results.sort_values('percent_profit', ascending=False).reset_index(drop=True)
+    logging.info(f"参数扫描完成，耗时: {(datetime.datetime.now() - start_time).total_seconds():.2f} 秒")
+
+    if save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        filepath = os.path.join(RESULTS_DIR, f"arb_sweep_{base_currency}_{timestamp}_{os.getpid()}.csv")
+        results.to_csv(filepath, index=False)
+        logging.info(f"参数扫描结果已导出到: {filepath}")
+        if config.results_catalog:
+            ResultsCatalog(config.results_catalog).record_sweep(config.to_dict(), results, filepath)
+    return results
+
+
+def main(config=None):
+    """按默认网格扫描参数并打印收益最高的组合
+
+    Args:
+        config: ArbConfig，None时使用默认配置
+    """
+    if config is None:
+        from configs.ArbConfig import ArbConfig
+        config = ArbConfig()
+    from utils import setup_logging
+    setup_logging(config.start_date.replace('-', '') + '_sweep')
+
+    results = run_sweep(config, {
+        'threshold': [0.001, 0.002, 0.003, 0.005, 0.0075, 0.01],
+        'commission_taker': [0.0005, 0.00075, 0.001],
+        'max_positions': [1, 3, 5],
+        'skip_seconds': [1, 3, 5],
+    })
+    if results is not None:
+        print(results.head(20).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import os
+import json
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+from path_set import PathSet
+
+cache_logger = logging.getLogger('path_cache')
+
+# 路径缓存目录，与路径文本文件放在一起
+PATH_CACHE_DIR = os.path.join('arb_paths', 'cache')
+# 缓存格式版本，路径搜索规则或存储结构变化时递增以使旧缓存失效
+PATH_CACHE_VERSION = 1
+# 磁盘上最多保留的缓存文件数，超出时删除最久未使用的
+PATH_CACHE_MAX_FILES = 256
+# 进程内最多保留的路径集合数
+PATH_CACHE_MAX_MEMORY = 32
+
+
+def canonical_pairs(pairs) -> list:
+    """交易对列表转换为去重、排序后的下划线格式，路径计算和缓存键都以此为准"""
+    return sorted({pair.replace('/', '_') for pair in pairs})
+
+
+def path_cache_key(pairs, base_currency: str, max_legs: int) -> str:
+    """由交易对集合、基础货币和最多腿数计算缓存键
+
+    Args:
+        pairs: 交易对列表，顺序和重复不影响结果
+        base_currency: 基础货币
+        max_legs: 最多腿数
+
+    Returns:
+        str: 十六进制哈希
+    """
+    content = json.dumps([PATH_CACHE_VERSION, base_currency, int(max_legs), canonical_pairs(pairs)])
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:32]
+
+
+class PathCache:
+    """按内容寻址的套利路径缓存
+
+    同一组交易对、基础货币和最多腿数的路径只计算一次: 进程内按LRU保留
+    PathSet对象，磁盘上以npz格式保存(含倒排索引)，按文件修改时间做LRU淘汰。
+    """
+
+    def __init__(self, cache_dir: str = PATH_CACHE_DIR, max_files: int = PATH_CACHE_MAX_FILES,
+                 max_memory: int = PATH_CACHE_MAX_MEMORY):
+        """
+        Args:
+            cache_dir: 缓存目录
+            max_files: 磁盘上最多保留的缓存文件数
+            max_memory: 进程内最多保留的路径集合数
+        """
+        self.cache_dir = cache_dir
+        self.max_files = max_files
+        self.max_memory = max_memory
+        self._memory = OrderedDict()
+
+    def file_path(self, key: str) -> str:
+        """缓存键对应的npz文件路径"""
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def get(self, key: str) -> Optional[PathSet]:
+        """读取缓存，未命中或文件损坏时返回None"""
+        path_set = self._memory.get(key)
+        if path_set is not None:
+            self._memory.move_to_end(key)
+            return path_set
+
+        file_path = self.file_path(key)
+        if not os.path.exists(file_path):
+            return None
+        try:
+            path_set = PathSet.load(file_path)
+        except Exception as e:
+            cache_logger.warning(f"路径缓存 {file_path} 损坏，将重新计算: {str(e)}")
+            return None
+        # 更新修改时间，磁盘淘汰按最近使用排序
+        os.utime(file_path)
+        self._remember(key, path_set)
+        return path_set
+
+    def put(self, key: str, path_set: PathSet):
+        """写入缓存，先写临时文件再替换，并发写入同一个键是安全的"""
+        self._remember(key, path_set)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        file_path = self.file_path(key)
+        tmp_path = f"{file_path}.tmp{os.getpid()}"
+        with open(tmp_path, 'wb') as f:
+            path_set.save(f)
+        os.replace(tmp_path, file_path)
+        self.evict()
+
+    def _remember(self, key: str, path_set: PathSet):
+        self._memory[key] = path_set
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory:
+            self._memory.popitem(last=False)
+
+    def evict(self) -> int:
+        """删除超出max_files的最久未使用的缓存文件
+
+        Returns:
+            int: 删除的文件数
+        """
+        try:
+            entries = [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith('.npz')]
+        except FileNotFoundError:
+            return 0
+        if len(entries) <= self.max_files:
+            return 0
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        removed = 0
+        for entry in entries[:len(entries) - self.max_files]:
+            try:
+                os.remove(entry.path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        cache_logger.info(f"路径缓存淘汰了 {removed} 个文件")
+        return removed
+
+
+_default_cache = None
+
+
+def default_path_cache() -> PathCache:
+    """进程内共享的路径缓存"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = PathCache()
+    return _default_cache
@@ -0,0 +1,293 @@
+import heapq
+import logging
+import numpy as np
+
+engine_logger = logging.getLogger('path_engine')
+
+
+def mask_stale(prices, ages, max_age):
+    """把年龄超过max_age秒的价格置为NaN，评估时涉及这些价格的路径视为无效
+
+    Args:
+        prices: 价格向量
+        ages: 与prices对应的年龄向量(秒)
+        max_age: 价格年龄上限(秒)
+
+    Returns:
+        np.ndarray: 新的价格向量
+    """
+    return np.where(ages > max_age, np.nan, prices)
+
+
+def feed_date_nums(datas):
+    """收集当前K线各数据源的时间(Backtrader日期数值)
+
+    数据源在没有K线的秒上停留在最近一根K线，其中最新的时间才是当前K线的时间。
+
+    Args:
+        datas: 数据源列表
+
+    Returns:
+        np.ndarray: 日期数值向量
+    """
+    return np.fromiter((d.datetime[0] for d in datas), dtype=np.float64, count=len(datas))
+
+
+def date_num_ages(date_nums):
+    """各数据源收盘价的年龄: 其时间与所有数据源中最新时间的差
+
+    Args:
+        date_nums: feed_date_nums返回的日期数值向量
+
+    Returns:
+        np.ndarray: 年龄向量(秒)，精确到毫秒
+    """
+    return np.rint((date_nums.max() - date_nums) * 86_400_000) / 1000
+
+
+class VectorizedPathEvaluator:
+    """向量化路径收益计算器
+
+    在初始化时把套利路径编译为腿索引矩阵和方向矩阵，之后每根K线只需
+    收集一次价格向量，即可在对数空间内一次性算出所有路径的扣费收益率。
+    """
+
+    def __init__(self, path_set, feed_names, fee):
+        """编译路径
+
+        Args:
+            path_set: PathSet路径集合，货币链已在构建时校验
+            feed_names: 数据源名称列表，顺序与价格向量一致
+            fee: 每条腿的手续费率
+        """
+        self.num_paths = len(path_set)
+        self.num_feeds = len(feed_names)
+
+        # 空位和缺失数据源的腿指向哨兵列，哨兵列的对数价格恒为0
+        self.leg_idx = path_set.feed_index(feed_names, missing=self.num_feeds)
+        self.leg_sign = path_set.leg_dir.astype(np.float64)
+        self.valid = ((self.leg_idx < self.num_feeds) | (path_set.leg_pair < 0)).all(axis=1)
+
+        self.log_fee = path_set.num_legs.astype(np.float64) * np.log1p(-fee)
+        self._log_prices = np.zeros(self.num_feeds + 1, dtype=np.float64)
+        self._bad_prices = np.zeros(self.num_feeds + 1, dtype=bool)
+
+        engine_logger.info(f"路径编译完成: {int(self.valid.sum())}/{self.num_paths} 条有效, 最长 {path_set.max_legs} 腿")
+
+    def gather_prices(self, datas):
+        """收集当前K线各数据源的收盘价
+
+        Args:
+            datas: 与feed_names顺序一致的数据源列表
+
+        Returns:
+            np.ndarray: 价格向量
+        """
+        return np.fromiter((d.close[0] for d in datas), dtype=np.float64, count=self.num_feeds)
+
+    def _update_log_prices(self, prices):
+        """刷新对数价格缓存，返回无效价格掩码"""
+        bad = ~(prices > 0)  # 同时覆盖0、负数和NaN
+        self._bad_prices[:-1] = bad
+        self._log_prices[:-1] = np.log(np.where(bad, 1.0, prices))
+        return bad
+
+    def _evaluate_rows(self, rows, any_bad):
+        """基于当前对数价格缓存计算指定路径的收益率
+
+        Args:
+            rows: 路径下标数组，None表示全部路径
+            any_bad: 当前价格向量中是否存在无效价格
+
+        Returns:
+            np.ndarray: 对应路径的收益率，无效路径为-1
+        """
+        if rows is None:
+            leg_idx, leg_sign, log_fee, valid = self.leg_idx, self.leg_sign, self.log_fee, self.valid
+        else:
+            leg_idx, leg_sign, log_fee, valid = self.leg_idx[rows], self.leg_sign[rows], self.log_fee[rows], self.valid[rows]
+
+        log_rates = (self._log_prices[leg_idx] * leg_sign).sum(axis=1) + log_fee
+        profits = np.expm1(log_rates)
+
+        invalid = ~valid
+        if any_bad:
+            invalid |= self._bad_prices[leg_idx].any(axis=1)
+        profits[invalid] = -1
+        return profits
+
+    def evaluate(self, prices):
+        """计算所有路径的理论收益率
+
+        Args:
+            prices: 价格向量
+
+        Returns:
+            np.ndarray: 每条路径的收益率，无效路径为-1
+        """
+        bad = self._update_log_prices(prices)
+        return self._evaluate_rows(None, bad.any())
+
+    def best_paths(self, prices, threshold, k, exclude=None):
+        """计算当前K线的收益率并返回最优的可执行路径
+
+        Args:
+            prices: 价格向量
+            threshold: 收益阈值
+            k: 最多返回的路径数
+            exclude: 需要跳过的路径索引集合
+
+        Returns:
+            list: 按收益率降序排列的(路径索引, 收益率)列表
+        """
+        return self.top_candidates(self.evaluate(prices), threshold, k, exclude)
+
+    @staticmethod
+    def top_candidates(profits, threshold, k, exclude=None):
+        """选出收益率超过阈值的前k条路径
+
+        Args:
+            profits: 路径收益率数组
+            threshold: 收益阈值
+            k: 最多返回的路径数
+            exclude: 需要跳过的路径索引集合
+
+        Returns:
+            list: 按收益率降序排列的(路径索引, 收益率)列表
+        """
+        if k <= 0:
+            return []
+        candidates = np.flatnonzero(profits > threshold)
+        if exclude:
+            candidates = candidates[~np.isin(candidates, list(exclude))]
+        if len(candidates) == 0:
+            return []
+        if len(candidates) > k:
+            top = np.argpartition(-profits[candidates], k - 1)[:k]
+            candidates = candidates[top]
+        order = np.argsort(-profits[candidates], kind='stable')
+        candidates = candidates[order]
+        return [(int(i), float(profits[i])) for i in candidates]
+
+
+class IncrementalPathEvaluator(VectorizedPathEvaluator):
+    """增量路径收益计算器
+
+    记录上一根K线的价格向量，只重新计算收盘价发生变化的数据源所涉及的路径
+    (通过PathSet的交易对->路径倒排索引查找)，并用带惰性删除的最大堆维护
+    当前收益率高于floor的路径。行情平静的秒内几乎没有计算量。
+    """
+
+    def __init__(self, path_set, feed_names, fee, floor=-1.0):
+        """
+        Args:
+            path_set: PathSet路径集合
+            feed_names: 数据源名称列表，顺序与价格向量一致
+            fee: 每条腿的手续费率
+            floor: 只有收益率高于此值的路径才进入堆，通常取策略阈值
+        """
+        super().__init__(path_set, feed_names, fee)
+        self.floor = floor
+        self.profits = np.full(self.num_paths, -1.0)
+        self._last_prices = None
+        self._version = [0] * self.num_paths
+        self._heap = []
+        self._dirty = np.zeros(self.num_paths, dtype=bool)
+
+        # 数据源 -> 涉及的路径id
+        feed_pos = {name: i for i, name in enumerate(feed_names)}
+        empty = path_set.pair_path_ids[:0]
+        self._feed_paths = [empty] * self.num_feeds
+        for pair in path_set.pairs:
+            if pair in feed_pos:
+                self._feed_paths[feed_pos[pair]] = path_set.paths_for_pair(pair)
+
+    def _changed_feeds(self, prices):
+        """与上一根K线相比收盘价发生变化的数据源下标"""
+        last = self._last_prices
+        same = (prices == last) | (np.isnan(prices) & np.isnan(last))
+        return np.flatnonzero(~same)
+
+    def _push(self, rows, profits):
+        """更新路径收益率并把高于floor的路径压入堆"""
+        self.profits[rows] = profits
+        version = self._version
+        heap = self._heap
+        for path_id, profit in zip(rows.tolist(), profits.tolist()):
+            version[path_id] += 1
+            if profit > self.floor:
+                heapq.heappush(heap, (-profit, path_id, version[path_id]))
+
+        # 过期条目过多时重建堆
+        if len(heap) > 2 * self.num_paths + 1024:
+            live = np.flatnonzero(self.profits > self.floor)
+            self._heap = [(-self.profits[i], i, version[i]) for i in live.tolist()]
+            heapq.heapify(self._heap)
+
+    def update(self, prices):
+        """根据新的价格向量增量刷新路径收益率
+
+        Args:
+            prices: 价格向量
+
+        Returns:
+            int: 本次重新计算的路径数
+        """
+        if self._last_prices is None:
+            bad = self._update_log_prices(prices)
+            rows = np.arange(self.num_paths)
+            self._push(rows, self._evaluate_rows(None, bad.any()))
+            self._last_prices = prices.copy()
+            return self.num_paths
+
+        changed = self._changed_feeds(prices)
+        if len(changed) == 0:
+            return 0
+
+        for f in changed.tolist():
+            self._dirty[self._feed_paths[f]] = True
+        rows = np.flatnonzero(self._dirty)
+        self._dirty[rows] = False
+
+        bad = self._update_log_prices(prices)
+        self._last_prices[changed] = prices[changed]
+        if len(rows):
+            self._push(rows, self._evaluate_rows(rows, bad.any()))
+        return len(rows)
+
+    def top(self, threshold, k, exclude=None):
+        """从堆中取出收益率超过阈值的前k条路径
+
+        Args:
+            threshold: 收益阈值，不低于floor时结果才完整
+            k: 最多返回的路径数
+            exclude: 需要跳过的路径索引集合
+
+        Returns:
+            list: 按收益率降序排列的(路径索引, 收益率)列表
+        """
+        result = []
+        popped = []
+        heap = self._heap
+        version = self._version
+        while heap and len(result) < k:
+            neg_profit, path_id, ver = heap[0]
+            if ver != version[path_id]:
+                heapq.heappop(heap)  # 过期条目
+                continue
+            if -neg_profit <= threshold:
+                break
+            popped.append(heapq.heappop(heap))
+            if exclude and path_id in exclude:
+                continue
+            result.append((path_id, -neg_profit))
+        for entry in popped:
+            heapq.heappush(heap, entry)
+        return result
+
+    def best_paths(self, prices, threshold, k, exclude=None):
+        """增量刷新后返回最优的可执行路径，参数同VectorizedPathEvaluator.best_paths"""
+        if k <= 0:
+            return []
+        self.update(prices)
+        return self.top(threshold, k, exclude)
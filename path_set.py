@@ -0,0 +1,211 @@
+import logging
+import numpy as np
+
+path_logger = logging.getLogger('path_set')
+
+
+def validate_path_chain(path, base_currency):
+    """校验路径的货币链是否首尾相接
+
+    Args:
+        path: [(交易对, 方向), ...] 形式的路径
+        base_currency: 基础货币
+
+    Returns:
+        bool: 路径能否从基础货币出发并回到基础货币
+    """
+    current_currency = base_currency
+    for pair, direction in path:
+        try:
+            base, quote = pair.split('_')
+        except ValueError:
+            return False
+        if direction == 1:
+            if current_currency != base:
+                return False
+            current_currency = quote
+        else:
+            if current_currency != quote:
+                return False
+            current_currency = base
+    return current_currency == base_currency
+
+
+class PathSet:
+    """紧凑的套利路径集合
+
+    交易对被编号为整数id，每条路径按行存放在腿矩阵中，行号即稳定的路径id。
+    货币链在构建时校验一次，之后的逐K线计算只使用整数数组。
+    构建时同时生成交易对->路径的倒排索引(CSR格式)，用于增量评估。
+    兼容旧代码的列表用法: len()、迭代和下标访问都返回[(交易对, 方向), ...]。
+    """
+
+    __slots__ = ('base_currency', 'pairs', 'pair_ids', 'leg_pair', 'leg_dir', 'num_legs',
+                 'pair_path_ptr', 'pair_path_ids')
+
+    def __init__(self, base_currency, pairs, leg_pair, leg_dir, num_legs, pair_index=None):
+        """
+        Args:
+            base_currency: 基础货币
+            pairs: 交易对名称元组，下标即交易对id
+            leg_pair: (路径数, 最大腿数) 的交易对id矩阵，空位为-1
+            leg_dir: 与leg_pair同形的方向矩阵 (1 卖出 / -1 买入 / 0 空位)
+            num_legs: 每条路径的腿数
+            pair_index: 可选，已计算好的 (indptr, 路径id数组) 倒排索引
+        """
+        self.base_currency = base_currency
+        self.pairs = tuple(pairs)
+        self.pair_ids = {pair: i for i, pair in enumerate(self.pairs)}
+        self.leg_pair = leg_pair
+        self.leg_dir = leg_dir
+        self.num_legs = num_legs
+        if pair_index is None:
+            pair_index = self._build_pair_index()
+        self.pair_path_ptr, self.pair_path_ids = pair_index
+
+    def _build_pair_index(self):
+        """构建交易对->路径的倒排索引
+
+        Returns:
+            tuple: (indptr, 路径id数组)，交易对p涉及的路径为 ids[indptr[p]:indptr[p+1]]
+        """
+        flat_pairs = self.leg_pair.ravel()
+        flat_paths = np.repeat(np.arange(len(self.num_legs), dtype=np.int32), self.leg_pair.shape[1])
+        mask = flat_pairs >= 0
+        flat_pairs = flat_pairs[mask]
+        flat_paths = flat_paths[mask]
+
+        order = np.lexsort((flat_paths, flat_pairs))
+        flat_pairs = flat_pairs[order]
+        flat_paths = flat_paths[order]
+
+        # 同一路径多次经过同一交易对时只保留一次
+        keep = np.ones(len(flat_pairs), dtype=bool)
+        keep[1:] = (flat_pairs[1:] != flat_pairs[:-1]) | (flat_paths[1:] != flat_paths[:-1])
+        flat_pairs = flat_pairs[keep]
+        flat_paths = flat_paths[keep]
+
+        indptr = np.searchsorted(flat_pairs, np.arange(len(self.pairs) + 1))
+        return indptr, flat_paths
+
+    @classmethod
+    def from_paths(cls, paths, base_currency):
+        """由路径列表构建PathSet，货币链不连贯的路径会被丢弃
+
+        Args:
+            paths: 套利路径列表
+            base_currency: 基础货币
+
+        Returns:
+            PathSet: 路径集合
+        """
+        if isinstance(paths, PathSet):
+            return paths
+
+        valid_paths = []
+        for path in paths:
+            if validate_path_chain(path, base_currency):
+                valid_paths.append(path)
+            else:
+                path_logger.warning(f"路径 {path} 货币链不连贯，已忽略")
+
+        pair_ids = {}
+        max_legs = max((len(path) for path in valid_paths), default=0)
+        leg_pair = np.full((len(valid_paths), max_legs), -1, dtype=np.int32)
+        leg_dir = np.zeros((len(valid_paths), max_legs), dtype=np.int8)
+        num_legs = np.zeros(len(valid_paths), dtype=np.int8)
+
+        for i, path in enumerate(valid_paths):
+            for j, (pair, direction) in enumerate(path):
+                leg_pair[i, j] = pair_ids.setdefault(pair, len(pair_ids))
+                leg_dir[i, j] = 1 if direction == 1 else -1
+            num_legs[i] = len(path)
+
+        return cls(base_currency, list(pair_ids), leg_pair, leg_dir, num_legs)
+
+    def save(self, file):
+        """以npz格式保存，包含倒排索引，加载时无需重新计算
+
+        Args:
+            file: 文件路径或可写的文件对象
+        """
+        np.savez(
+            file,
+            base_currency=np.array(self.base_currency),
+            pairs=np.array(self.pairs, dtype=str),
+            leg_pair=self.leg_pair,
+            leg_dir=self.leg_dir,
+            num_legs=self.num_legs,
+            pair_path_ptr=self.pair_path_ptr,
+            pair_path_ids=self.pair_path_ids,
+        )
+
+    @classmethod
+    def load(cls, file):
+        """加载save写出的npz文件
+
+        Args:
+            file: 文件路径或可读的文件对象
+
+        Returns:
+            PathSet: 路径集合
+        """
+        with np.load(file, allow_pickle=False) as data:
+            return cls(
+                str(data['base_currency']),
+                data['pairs'].tolist(),
+                data['leg_pair'],
+                data['leg_dir'],
+                data['num_legs'],
+                pair_index=(data['pair_path_ptr'], data['pair_path_ids']),
+            )
+
+    def __len__(self):
+        return len(self.num_legs)
+
+    def __iter__(self):
+        for path_id in range(len(self)):
+            yield self[path_id]
+
+    def __getitem__(self, path_id):
+        n = self.num_legs[path_id]
+        return [(self.pairs[p], int(d)) for p, d in zip(self.leg_pair[path_id, :n], self.leg_dir[path_id, :n])]
+
+    @property
+    def max_legs(self):
+        """最长路径的腿数"""
+        return self.leg_pair.shape[1]
+
+    def path_str(self, path_id):
+        """路径的可读描述，如 BTC_USDT(-) → ETH_BTC(-) → ETH_USDT(+)"""
+        return " → ".join([f"{pair}({'+' if dir==1 else '-'})" for pair, dir in self[path_id]])
+
+    def paths_for_pair(self, pair):
+        """交易对涉及的路径id数组"""
+        pair_id = self.pair_ids.get(pair)
+        if pair_id is None:
+            return self.pair_path_ids[:0]
+        return self.pair_path_ids[self.pair_path_ptr[pair_id]:self.pair_path_ptr[pair_id + 1]]
+
+    def required_pairs(self):
+        """路径涉及的全部交易对"""
+        return list(self.pairs)
+
+    def to_list(self):
+        """转换为可JSON序列化的路径列表"""
+        return [self[path_id] for path_id in range(len(self))]
+
+    def feed_index(self, feed_names, missing=-1):
+        """将每条腿映射到数据源下标
+
+        Args:
+            feed_names: 数据源名称列表
+            missing: 没有对应数据源的交易对及空位使用的下标
+
+        Returns:
+            np.ndarray: 与leg_pair同形的数据源下标矩阵
+        """
+        feed_pos = {name: i for i, name in enumerate(feed_names)}
+        # 多出的最后一格对应leg_pair中的-1
+        lookup = np.array([feed_pos.get(pair, missing) for pair in self.pairs] + [missing], dtype=np.intp)
+        return lookup[self.leg_pair]
@@ -0,0 +1,230 @@
+import os
+import sys
+import time
+import datetime
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Optional
+
+# 性能剖析文件目录，首次写入时创建
+PROFILES_DIR = os.path.join('results', 'profiles')
+# 运行级剖析方式: cProfile 确定性剖析，sampling 由后台线程定时采样主线程调用栈
+PROFILE_MODES = ('cprofile', 'sampling')
+# 采样间隔(秒)
+SAMPLE_INTERVAL = 0.005
+# 结果JSON中保留的热点函数数
+PROFILE_TOP_N = 20
+
+
+class _Phase:
+    """PhaseProfiler.phase返回的计时上下文"""
+
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler: 'PhaseProfiler', name: str):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.stop(self.name, self.start)
+        return False
+
+
+class _NullPhase:
+    """关闭计时时使用的空上下文"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class PhaseProfiler:
+    """分阶段计时和计数的注册表
+
+    阶段以名称区分，累计耗时(纳秒)和调用次数；计数器累计任意事件数。
+    关闭时start返回0、stop和count直接返回、phase返回共享的空上下文，
+    热路径上只剩一次方法调用。只在单个线程中使用，不加锁。
+    """
+
+    __slots__ = ('enabled', 'times', 'calls', 'counters')
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.times = {}
+        self.calls = {}
+        self.counters = {}
+
+    def start(self) -> int:
+        """开始计时，返回传给stop的起始时间"""
+        return time.perf_counter_ns() if self.enabled else 0
+
+    def stop(self, name: str, start: int):
+        """结束一次计时，累计到阶段name"""
+        if not self.enabled:
+            return
+        elapsed = time.perf_counter_ns() - start
+        self.times[name] = self.times.get(name, 0) + elapsed
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def add(self, name: str, elapsed_ns: int, calls: int = 1):
+        """累计已经测得的耗时"""
+        if not self.enabled:
+            return
+        self.times[name] = self.times.get(name, 0) + elapsed_ns
+        self.calls[name] = self.calls.get(name, 0) + calls
+
+    def phase(self, name: str):
+        """计时上下文: with profiler.phase('data.load'): ..."""
+        return _Phase(self, name) if self.enabled else _NULL_PHASE
+
+    def count(self, name: str, n: int = 1):
+        """累计计数器"""
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self) -> Optional[dict]:
+        """各阶段的耗时(毫秒)、调用次数和计数器，关闭时返回None"""
+        if not self.enabled:
+            return None
+        return {
+            'phases': {name: {'total_ms': ns / 1e6, 'calls': self.calls[name]}
+                       for name, ns in self.times.items()},
+            'counters': dict(self.counters),
+        }
+
+    def format_lines(self) -> list:
+        """用于日志的阶段耗时表，按耗时降序"""
+        lines = []
+        for name, ns in sorted(self.times.items(), key=lambda item: -item[1]):
+            calls = self.calls[name]
+            lines.append(f"{name}: {ns / 1e6:.1f}ms, {calls}次, 平均{ns / calls / 1e3:.1f}us")
+        if self.counters:
+            lines.append(", ".join(f"{name}={n}" for name, n in self.counters.items()))
+        return lines
+
+
+class SamplingProfiler:
+    """定时采样指定线程调用栈的轻量剖析器
+
+    后台线程每隔interval秒读取一次目标线程的栈帧，按完整调用栈计数，
+    输出为flamegraph.pl/speedscope可读的折叠栈格式。不依赖第三方库，
+    对被测线程只有GIL切换的开销。
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._thread_id = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """开始采样调用此方法的线程"""
+        self._thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling_profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write(self, file_path: str):
+        """写出折叠栈文件，每行为 "栈;...;栈顶 次数" """
+        with open(file_path, 'w', encoding='utf-8') as f:
+            for stack, n in self.stacks.most_common():
+                f.write(f"{stack} {n}\n")
+
+    def top(self, n: int = PROFILE_TOP_N) -> list:
+        """栈顶采样次数最多的函数"""
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        return [{'function': name, 'samples': count, 'share': count / max(self.samples, 1)}
+                for name, count in leaves.most_common(n)]
+
+
+def profile_file_path(mode: str) -> str:
+    """剖析文件路径，同一进程内和并行进程间都不会重名"""
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    suffix = 'prof' if mode == 'cprofile' else 'collapsed'
+    return os.path.join(PROFILES_DIR, f"arb_profile_{timestamp}_{os.getpid()}.{suffix}")
+
+
+def _cprofile_top(profiler, n: int = PROFILE_TOP_N) -> list:
+    """按自身耗时排序的热点函数"""
+    import pstats
+
+    stats = pstats.Stats(profiler).stats
+    rows = sorted(stats.items(), key=lambda item: -item[1][2])[:n]
+    return [{'function': f"{func} ({os.path.basename(file)}:{line})", 'calls': nc,
+             'self_ms': tt * 1000, 'cumulative_ms': ct * 1000}
+            for (file, line, func), (_, nc, tt, ct, _) in rows]
+
+
+@contextmanager
+def run_profile(mode: Optional[str], result: dict):
+    """按mode剖析with块，结束后写出剖析文件并把文件路径和热点函数填入result
+
+    Args:
+        mode: 'cprofile'、'sampling'，None或空字符串时不剖析
+        result: 输出字典，填入 mode、file、top
+    """
+    if not mode:
+        yield
+        return
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"不支持的剖析方式: {mode}")
+
+    if mode == 'cprofile':
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    else:
+        profiler = SamplingProfiler()
+        profiler.start()
+    try:
+        yield
+    finally:
+        if mode == 'cprofile':
+            profiler.disable()
+        else:
+            profiler.stop()
+        file_path = profile_file_path(mode)
+        os.makedirs(PROFILES_DIR, exist_ok=True)
+        if mode == 'cprofile':
+            profiler.dump_stats(file_path)
+            top = _cprofile_top(profiler)
+        else:
+            profiler.write(file_path)
+            top = profiler.top()
+        result.update(mode=mode, file=file_path, top=top)
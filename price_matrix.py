@@ -0,0 +1,336 @@
+import os
+import json
+import shutil
+import logging
+import numpy as np
+import pandas as pd
+from typing import Callable, Dict, List, Optional
+
+matrix_logger = logging.getLogger('price_matrix')
+
+# 磁盘缓存格式版本，结构变化时递增以使旧缓存失效
+CACHE_VERSION = 2
+CACHE_HEADER = 'header.json'
+
+
+def frame_timestamps(df: pd.DataFrame) -> np.ndarray:
+    """取出DataFrame的毫秒时间戳列
+
+    Args:
+        df: DataManager加载的单个交易对数据
+
+    Returns:
+        np.ndarray: int64毫秒时间戳
+    """
+    if 'timestamp' in df.columns:
+        return df['timestamp'].to_numpy(dtype=np.int64)
+    return df['datetime'].to_numpy(dtype='datetime64[ms]').astype(np.int64)
+
+
+def align_pair(timestamps: np.ndarray, ts: np.ndarray, close: np.ndarray, volume: np.ndarray):
+    """把单个交易对的K线对齐到统一时间轴
+
+    Args:
+        timestamps: 统一时间轴(已排序)
+        ts: 该交易对的时间戳
+        close: 该交易对的收盘价
+        volume: 该交易对的成交量
+
+    Returns:
+        tuple: (向前填充的收盘价列, 成交量列, 价格年龄列)，开始前的收盘价和年龄为NaN，
+            没有K线的秒成交量为0，年龄为距最近一根K线的秒数(有K线的秒为0)
+    """
+    aligned_close = np.full(len(timestamps), np.nan)
+    aligned_volume = np.zeros(len(timestamps))
+    aligned_age = np.full(len(timestamps), np.nan, dtype=np.float32)
+    if len(ts) == 0:
+        return aligned_close, aligned_volume, aligned_age
+
+    order = np.argsort(ts, kind='stable')
+    ts = ts[order]
+    close = close[order]
+    volume = volume[order]
+
+    # 每个时间点取不晚于它的最近一根K线，实现向前填充
+    pos = np.searchsorted(ts, timestamps, side='right') - 1
+    started = pos >= 0
+    aligned_close[started] = close[pos[started]]
+    exact = started & (ts[np.maximum(pos, 0)] == timestamps)
+    aligned_volume[exact] = volume[pos[exact]]
+    aligned_age[started] = (timestamps[started] - ts[pos[started]]) / 1000
+    return aligned_close, aligned_volume, aligned_age
+
+
+class PriceMatrix:
+    """时间 × 交易对 对齐的价格矩阵
+
+    时间轴为所有交易对时间戳的并集，每个交易对在缺失的秒上沿用最近一根K线
+    的收盘价，与Backtrader多数据源同步后 close[0] 的取值一致；同时记录每个价格
+    的年龄(距该交易对最近一根K线的秒数)，策略据此跳过含过期报价的路径。
+    矩阵按行(时间)连续存放，可以整体缓存为np.memmap文件供多个进程只读共享。
+    """
+
+    def __init__(self, timestamps: np.ndarray, pairs: List[str], close: np.ndarray, volume: np.ndarray,
+                 age: np.ndarray):
+        """
+        Args:
+            timestamps: int64毫秒时间戳，长度T
+            pairs: 交易对名称列表，长度P
+            close: (T, P) 收盘价矩阵，交易对开始前为NaN
+            volume: (T, P) 成交量矩阵，没有K线的秒为0
+            age: (T, P) float32价格年龄(秒)，交易对开始前为NaN
+        """
+        self.timestamps = timestamps
+        self.pairs = list(pairs)
+        self.close = close
+        self.volume = volume
+        self.age = age
+
+    @classmethod
+    def from_frames(cls, frames: Dict[str, pd.DataFrame]) -> 'PriceMatrix':
+        """由DataManager.load_frames的结果构建对齐矩阵
+
+        Args:
+            frames: 交易对 -> DataFrame
+
+        Returns:
+            PriceMatrix: 对齐后的价格矩阵
+        """
+        pairs = list(frames)
+        return cls.from_columns(
+            pairs,
+            [frame_timestamps(frames[pair]) for pair in pairs],
+            [frames[pair]['close'].to_numpy(dtype=np.float64) for pair in pairs],
+            [frames[pair]['volume'].to_numpy(dtype=np.float64) for pair in pairs]
+        )
+
+    @classmethod
+    def from_columns(cls, pairs: List[str], pair_ts: List[np.ndarray], pair_close: List[np.ndarray],
+                     pair_volume: List[np.ndarray]) -> 'PriceMatrix':
+        """由各交易对的时间戳、收盘价和成交量数组构建对齐矩阵
+
+        Args:
+            pairs: 交易对列表，顺序即列顺序
+            pair_ts: 每个交易对的毫秒时间戳
+            pair_close: 每个交易对的收盘价
+            pair_volume: 每个交易对的成交量
+
+        Returns:
+            PriceMatrix: 对齐后的价格矩阵
+        """
+        timestamps = np.unique(np.concatenate(pair_ts)) if pair_ts else np.zeros(0, dtype=np.int64)
+
+        close = np.full((len(timestamps), len(pairs)), np.nan)
+        volume = np.zeros((len(timestamps), len(pairs)))
+        age = np.full((len(timestamps), len(pairs)), np.nan, dtype=np.float32)
+        for j in range(len(pairs)):
+            close[:, j], volume[:, j], age[:, j] = align_pair(timestamps, pair_ts[j], pair_close[j], pair_volume[j])
+
+        matrix_logger.info(f"价格矩阵对齐完成: {len(timestamps)} 个时间点 × {len(pairs)} 个交易对")
+        return cls(timestamps, pairs, close, volume, age)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def columns_of(self, pairs: List[str]) -> List[int]:
+        """交易对对应的列号，不存在的交易对被忽略"""
+        column_of = {pair: j for j, pair in enumerate(self.pairs)}
+        return [column_of[pair] for pair in pairs if pair in column_of]
+
+    def first_complete_row(self, columns: Optional[List[int]] = None) -> int:
+        """指定列都已有价格的第一行，对应Backtrader开始调用next()的位置
+
+        Args:
+            columns: 需要检查的列号，None表示全部列
+        """
+        if len(self.timestamps) == 0:
+            return 0
+        close = self.close if columns is None else self.close[:, columns]
+        complete = ~np.isnan(close).any(axis=1)
+        if not complete.any():
+            return len(self.timestamps)
+        return int(np.argmax(complete))
+
+    def bar_rows(self, columns: Optional[List[int]] = None, start: int = 0) -> np.ndarray:
+        """从start行起指定列中至少一列在该时间点有K线(年龄为0)的行号
+
+        矩阵的时间轴可能包含其他交易对的时间点(如整个数据目录的缓存)，
+        Backtrader只在所选交易对有K线的时间点调用next()。
+
+        Args:
+            columns: 需要检查的列号，None表示全部列
+            start: 起始行
+        """
+        if columns is None or len(set(columns)) == len(self.pairs):
+            # 时间轴是这些列时间戳的并集，每行都有K线
+            return np.arange(start, len(self.timestamps))
+        has_bar = (self.age[start:, columns] == 0).any(axis=1)
+        return start + np.flatnonzero(has_bar)
+
+    def last_bars(self):
+        """最后一行的收盘价和各列最近一根K线的时间戳，供下一段时间轴向前填充
+
+        Returns:
+            tuple: (收盘价, 毫秒时间戳)，均为float64数组，没有价格的列为NaN
+        """
+        if len(self.timestamps) == 0:
+            empty = np.full(len(self.pairs), np.nan)
+            return empty, empty.copy()
+        close = np.array(self.close[-1], dtype=np.float64)
+        last_ts = self.timestamps[-1] - np.rint(np.asarray(self.age[-1], dtype=np.float64) * 1000)
+        return close, last_ts
+
+    def carry_in(self, close: np.ndarray, last_ts: np.ndarray):
+        """用上一段时间轴末尾的价格填充各列在本段第一根K线之前的行
+
+        按天分段构建矩阵时，填充后与整段一次性对齐的结果一致。
+
+        Args:
+            close: 上一段的last_bars收盘价，NaN表示没有价格
+            last_ts: 上一段各列最近一根K线的毫秒时间戳
+        """
+        for j in np.flatnonzero(~np.isnan(close)).tolist():
+            head = np.isnan(self.age[:, j])
+            self.close[head, j] = close[j]
+            self.age[head, j] = (self.timestamps[head] - last_ts[j]) / 1000
+
+    def stale_share(self, max_age: float, columns: Optional[List[int]] = None) -> np.ndarray:
+        """各列价格年龄超过max_age秒的行所占比例，交易对开始前的行不计入
+
+        Args:
+            max_age: 价格年龄上限(秒)
+            columns: 需要统计的列号，None表示全部列
+
+        Returns:
+            np.ndarray: 每列的过期比例，没有价格的列为0
+        """
+        age = self.age if columns is None else self.age[:, columns]
+        started = (~np.isnan(age)).sum(axis=0)
+        stale = (age > max_age).sum(axis=0)
+        return stale / np.maximum(started, 1)
+
+    def datetime_at(self, row: int):
+        """第row行对应的UTC时间(naive datetime)"""
+        return pd.Timestamp(int(self.timestamps[row]), unit='ms').to_pydatetime()
+
+    @classmethod
+    def open_cache(cls, cache_dir: str) -> 'PriceMatrix':
+        """以只读memmap方式打开缓存，不复制数据
+
+        Args:
+            cache_dir: build_cache写出的目录
+
+        Returns:
+            PriceMatrix: 矩阵数组均为只读np.memmap
+        """
+        header = read_cache_header(cache_dir)
+        shape = (header['num_rows'], len(header['pairs']))
+        if shape[0] == 0:
+            return cls(np.zeros(0, dtype=np.int64), header['pairs'], np.zeros(shape), np.zeros(shape),
+                       np.zeros(shape, dtype=np.float32))
+        timestamps = np.memmap(os.path.join(cache_dir, 'timestamps.i64'), dtype=np.int64, mode='r', shape=(shape[0],))
+        close = np.memmap(os.path.join(cache_dir, 'close.f64'), dtype=np.float64, mode='r', shape=shape)
+        volume = np.memmap(os.path.join(cache_dir, 'volume.f64'), dtype=np.float64, mode='r', shape=shape)
+        age = np.memmap(os.path.join(cache_dir, 'age.f32'), dtype=np.float32, mode='r', shape=shape)
+        return cls(timestamps, header['pairs'], close, volume, age)
+
+    @classmethod
+    def build_cache(cls, cache_dir: str, pairs: List[str], read_pair: Callable,
+                    fingerprint: Optional[list] = None) -> 'PriceMatrix':
+        """逐个交易对流式构建memmap缓存，内存中同时只保留一个交易对的数据
+
+        Args:
+            cache_dir: 缓存目录
+            pairs: 交易对列表，顺序即列顺序
+            read_pair: read_pair(交易对, 列名列表) -> 含timestamp/close/volume列的DataFrame
+            fingerprint: 数据源指纹，用于判断缓存是否过期
+
+        Returns:
+            PriceMatrix: 以只读memmap打开的缓存矩阵
+        """
+        # 第一遍只读时间戳，得到统一时间轴
+        pair_ts = [frame_timestamps(read_pair(pair, ['timestamp'])) for pair in pairs]
+        timestamps = np.unique(np.concatenate(pair_ts)) if pair_ts else np.zeros(0, dtype=np.int64)
+        del pair_ts
+
+        tmp_dir = f"{cache_dir}.tmp{os.getpid()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        shape = (len(timestamps), len(pairs))
+        if shape[0] > 0:
+            np.memmap(os.path.join(tmp_dir, 'timestamps.i64'), dtype=np.int64, mode='w+', shape=(shape[0],))[:] = timestamps
+            close = np.memmap(os.path.join(tmp_dir, 'close.f64'), dtype=np.float64, mode='w+', shape=shape)
+            volume = np.memmap(os.path.join(tmp_dir, 'volume.f64'), dtype=np.float64, mode='w+', shape=shape)
+            age = np.memmap(os.path.join(tmp_dir, 'age.f32'), dtype=np.float32, mode='w+', shape=shape)
+
+            # 第二遍逐列填充
+            for j, pair in enumerate(pairs):
+                df = read_pair(pair, ['timestamp', 'close', 'volume'])
+                close[:, j], volume[:, j], age[:, j] = align_pair(
+                    timestamps,
+                    frame_timestamps(df),
+                    df['close'].to_numpy(dtype=np.float64),
+                    df['volume'].to_numpy(dtype=np.float64)
+                )
+            close.flush()
+            volume.flush()
+            age.flush()
+            del close, volume, age
+
+        write_cache_header(tmp_dir, pairs, timestamps, fingerprint)
+        _publish_cache(tmp_dir, cache_dir)
+        matrix_logger.info(f"价格矩阵缓存已写入 {cache_dir}: {shape[0]} 个时间点 × {shape[1]} 个交易对")
+        return cls.open_cache(cache_dir)
+
+
+def write_cache_header(cache_dir: str, pairs: List[str], timestamps: np.ndarray, fingerprint: Optional[list]):
+    """写入缓存的JSON头: 交易对名称、时间轴范围和数据源指纹"""
+    header = {
+        'version': CACHE_VERSION,
+        'pairs': list(pairs),
+        'num_rows': int(len(timestamps)),
+        'start_ts': int(timestamps[0]) if len(timestamps) else None,
+        'end_ts': int(timestamps[-1]) if len(timestamps) else None,
+        'fingerprint': fingerprint,
+    }
+    with open(os.path.join(cache_dir, CACHE_HEADER), 'w', encoding='utf-8') as f:
+        json.dump(header, f)
+
+
+def read_cache_header(cache_dir: str) -> Optional[dict]:
+    """读取缓存的JSON头，不存在或损坏时返回None"""
+    try:
+        with open(os.path.join(cache_dir, CACHE_HEADER), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_cache_valid(cache_dir: str, fingerprint: Optional[list]) -> bool:
+    """缓存是否存在且与当前数据源一致"""
+    header = read_cache_header(cache_dir)
+    if header is None or header.get('version') != CACHE_VERSION:
+        return False
+    return header.get('fingerprint') == fingerprint
+
+
+def _publish_cache(tmp_dir: str, cache_dir: str):
+    """把构建完成的临时目录发布为正式缓存目录
+
+    旧缓存先改名移开，再把临时目录改名到位，缓存目录下不会出现删了一半的旧缓存或写了一半的新缓存。
+    两次改名之间缓存目录短暂不存在，此时打开缓存的进程按缓存缺失处理。移开的旧缓存最后删除，
+    已映射其文件的进程不受影响。
+    """
+    old_dir = f"{cache_dir}.old{os.getpid()}"
+    try:
+        os.rename(cache_dir, old_dir)
+    except OSError:
+        # 没有旧缓存，或其他进程正在替换
+        old_dir = None
+    try:
+        os.rename(tmp_dir, cache_dir)
+    except OSError:
+        # 其他进程已抢先发布了同样的缓存
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    if old_dir is not None:
+        shutil.rmtree(old_dir, ignore_errors=True)
@@ -0,0 +1,404 @@
+import os
+import glob
+import json
+import sqlite3
+import hashlib
+import logging
+import datetime
+import pandas as pd
+from contextlib import closing
+from typing import Dict, List, Optional
+
+catalog_logger = logging.getLogger('results_catalog')
+
+# 不影响回测结果的配置项，不参与配置指纹
+NON_RESULT_FIELDS = ('debug', 'plot', 'profile_phases', 'profile_mode', 'checkpoint_dir', 'resume',
+                     'export_trades_excel', 'data_feed', 'feed_chunk_rows', 'matrix_cache', 'download_data',
+                     'download_workers', 'download_rate_limit', 'batch_test_dates', 'batch_workers',
+                     'batch_worker_memory_gb', 'results_catalog')
+# 随日期范围变化的配置项，也不参与配置指纹，同一组参数在不同日期上的回测指纹相同
+RANGE_FIELDS = ('start_date', 'end_date', 'specific_data_dir')
+
+# 每次回测一行
+RUN_COLUMNS = [
+    'results_file', 'created_at', 'kind', 'fingerprint', 'engine', 'start_date', 'end_date', 'days',
+    'base_currency', 'base_currencies', 'threshold', 'maker_fee', 'taker_fee', 'max_legs', 'eval_mode',
+    'traded_pairs', 'initial_cash', 'final_value', 'absolute_profit', 'percent_profit', 'num_trades',
+    'total_arb_profit', 'engine_run_ms', 'bar_p50_ms', 'bar_p99_ms', 'config',
+]
+# 查询结果默认显示的列
+SUMMARY_COLUMNS = [
+    'run_id', 'created_at', 'kind', 'engine', 'start_date', 'end_date', 'base_currency', 'threshold',
+    'taker_fee', 'num_trades', 'absolute_profit', 'percent_profit', 'engine_run_ms', 'fingerprint',
+]
+# aggregate可以分组的列
+GROUP_COLUMNS = ('fingerprint', 'kind', 'engine', 'start_date', 'end_date', 'base_currency', 'base_currencies',
+                 'threshold', 'maker_fee', 'taker_fee', 'max_legs', 'eval_mode')
+
+_CREATE_TABLES = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    results_file TEXT UNIQUE,
+    created_at TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    engine TEXT,
+    start_date TEXT,
+    end_date TEXT,
+    days INTEGER,
+    base_currency TEXT,
+    base_currencies TEXT,
+    threshold REAL,
+    maker_fee REAL,
+    taker_fee REAL,
+    max_legs INTEGER,
+    eval_mode TEXT,
+    traded_pairs INTEGER,
+    initial_cash REAL,
+    final_value REAL,
+    absolute_profit REAL,
+    percent_profit REAL,
+    num_trades INTEGER,
+    total_arb_profit REAL,
+    engine_run_ms REAL,
+    bar_p50_ms REAL,
+    bar_p99_ms REAL,
+    config TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_fingerprint ON runs (fingerprint);
+CREATE INDEX IF NOT EXISTS runs_dates ON runs (start_date, end_date);
+CREATE INDEX IF NOT EXISTS runs_params ON runs (base_currency, threshold, taker_fee);
+CREATE TABLE IF NOT EXISTS run_trade_files (
+    run_id INTEGER NOT NULL,
+    base_currency TEXT NOT NULL,
+    path TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS run_trade_files_run ON run_trade_files (run_id);
+CREATE TABLE IF NOT EXISTS run_phases (
+    run_id INTEGER NOT NULL,
+    phase TEXT NOT NULL,
+    total_ms REAL NOT NULL,
+    calls INTEGER NOT NULL,
+    PRIMARY KEY (run_id, phase)
+);
+"""
+
+
+def config_fingerprint(config: dict) -> str:
+    """配置指纹: 影响回测结果且与日期范围无关的配置项的哈希
+
+    Args:
+        config: ArbConfig.to_dict()的结果
+
+    Returns:
+        str: 十六进制哈希
+    """
+    excluded = set(NON_RESULT_FIELDS) | set(RANGE_FIELDS)
+    settings = {key: value for key, value in config.items() if key not in excluded}
+    content = json.dumps(settings, sort_keys=True, default=str)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]
+
+
+def _days(start_date: Optional[str], end_date: Optional[str]) -> Optional[int]:
+    """日期范围的天数，包含首尾两天"""
+    if not start_date or not end_date:
+        return None
+    start = datetime.datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.datetime.strptime(end_date, '%Y-%m-%d')
+    return (end - start).days + 1
+
+
+def results_run_row(results: dict, results_file: str, created_at: Optional[str] = None) -> dict:
+    """把export_results写出的结果字典整理为runs表的一行
+
+    Args:
+        results: 结果JSON的内容
+        results_file: 结果文件路径
+        created_at: 记录时间，默认为当前时间
+
+    Returns:
+        dict: 键为RUN_COLUMNS
+    """
+    config = results.get('config') or {}
+    summary = results.get('backtest_summary') or {}
+    financial = results.get('financial_results') or {}
+    strategy = results.get('strategy_results') or {}
+    settings = results.get('binance_settings') or {}
+    performance = results.get('performance') or {}
+    latency = performance.get('bar_latency') or {}
+    phases = (performance.get('phases') or {}).get('phases') or {}
+    return {
+        'results_file': results_file,
+        'created_at': created_at or datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'kind': 'backtest',
+        'fingerprint': config_fingerprint(config),
+        'engine': config.get('engine'),
+        'start_date': summary.get('start_date'),
+        'end_date': summary.get('end_date'),
+        'days': _days(summary.get('start_date'), summary.get('end_date')),
+        'base_currency': summary.get('base_currency'),
+        'base_currencies': ','.join(summary.get('base_currencies') or [summary.get('base_currency') or '']),
+        'threshold': config.get('threshold'),
+        'maker_fee': settings['maker_fee_pct'] / 100 if 'maker_fee_pct' in settings else None,
+        'taker_fee': settings['taker_fee_pct'] / 100 if 'taker_fee_pct' in settings else None,
+        'max_legs': config.get('max_path_legs'),
+        'eval_mode': config.get('eval_mode'),
+        'traded_pairs': summary.get('traded_pairs'),
+        'initial_cash': financial.get('initial_cash'),
+        'final_value': financial.get('final_value'),
+        'absolute_profit': financial.get('absolute_profit'),
+        'percent_profit': financial.get('percent_profit'),
+        'num_trades': strategy.get('triangle_arb_trades'),
+        'total_arb_profit': strategy.get('total_arb_profit'),
+        'engine_run_ms': phases.get('engine.run', {}).get('total_ms'),
+        'bar_p50_ms': latency.get('p50_ms'),
+        'bar_p99_ms': latency.get('p99_ms'),
+        'config': json.dumps(config, sort_keys=True, default=str),
+    }
+
+
+class ResultsCatalog:
+    """回测结果目录，保存在结果目录下的SQLite文件中
+
+    每次回测导出结果时写入一行(runs)，同时记录交易记录文件(run_trade_files)和
+    分阶段耗时(run_phases)；参数扫描的每组参数也各记一行。比较大量回测时只查询
+    这几张表，不需要逐个读取结果文件。
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path: SQLite文件路径
+        """
+        self.db_path = db_path
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.executescript(_CREATE_TABLES)
+        return conn
+
+    @staticmethod
+    def _insert_run(conn: sqlite3.Connection, row: dict) -> int:
+        """写入一行，同一结果文件已存在时先删除旧记录"""
+        if row['results_file'] is not None:
+            old = [run_id for run_id, in conn.execute(
+                "SELECT run_id FROM runs WHERE results_file = ?", (row['results_file'],))]
+            for table in ('run_trade_files', 'run_phases', 'runs'):
+                conn.executemany(f"DELETE FROM {table} WHERE run_id = ?", [(run_id,) for run_id in old])
+        placeholders = ', '.join('?' for _ in RUN_COLUMNS)
+        cursor = conn.execute(f"INSERT INTO runs ({', '.join(RUN_COLUMNS)}) VALUES ({placeholders})",
+                              [row[column] for column in RUN_COLUMNS])
+        return cursor.lastrowid
+
+    def record(self, results: dict, results_file: str, created_at: Optional[str] = None) -> int:
+        """记录一次回测
+
+        Args:
+            results: export_results写出的结果字典
+            results_file: 结果JSON文件路径
+            created_at: 记录时间，默认为当前时间
+
+        Returns:
+            int: run_id
+        """
+        row = results_run_row(results, results_file, created_at)
+        phases = (((results.get('performance') or {}).get('phases') or {}).get('phases') or {})
+        trade_files = results.get('trade_files') or {}
+        with closing(self._connect()) as conn, conn:
+            run_id = self._insert_run(conn, row)
+            conn.executemany(
+                "INSERT INTO run_trade_files (run_id, base_currency, path) VALUES (?, ?, ?)",
+                [(run_id, base, path) for base, paths in trade_files.items() for path in paths]
+            )
+            conn.executemany(
+                "INSERT INTO run_phases (run_id, phase, total_ms, calls) VALUES (?, ?, ?, ?)",
+                [(run_id, name, phase['total_ms'], phase['calls']) for name, phase in phases.items()]
+            )
+        return run_id
+
+    def record_sweep(self, config: dict, table: pd.DataFrame, results_file: str) -> int:
+        """把参数扫描结果表的每组参数记为一行
+
+        Args:
+            config: 扫描使用的ArbConfig.to_dict()，表中的参数列覆盖对应字段
+            table: ParameterSweep.run的结果表
+            results_file: 结果表文件路径，各行记为 路径#行号
+
+        Returns:
+            int: 记录的行数
+        """
+        created_at = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        params = [name for name in table.columns if name in config]
+        rows = []
+        # 参数扫描只评估主基础货币
+        base_currency = (config.get('base_currencies') or [config.get('base_currency')])[0]
+        for i, record in enumerate(table.to_dict('records')):
+            run_config = {**config, **{name: record[name] for name in params}, 'engine': 'sweep'}
+            rows.append({
+                'results_file': f"{results_file}#{i}",
+                'created_at': created_at,
+                'kind': 'sweep',
+                'fingerprint': config_fingerprint(run_config),
+                'engine': run_config['engine'],
+                'start_date': run_config.get('start_date'),
+                'end_date': run_config.get('end_date'),
+                'days': _days(run_config.get('start_date'), run_config.get('end_date')),
+                'base_currency': base_currency,
+                'base_currencies': base_currency,
+                'threshold': run_config.get('threshold'),
+                'maker_fee': run_config.get('commission_maker'),
+                'taker_fee': run_config.get('commission_taker'),
+                'max_legs': run_config.get('max_path_legs'),
+                'eval_mode': None,
+                'traded_pairs': None,
+                'initial_cash': run_config.get('initial_cash'),
+                'final_value': record.get('final_value'),
+                'absolute_profit': record.get('absolute_profit'),
+                'percent_profit': record.get('percent_profit'),
+                'num_trades': record.get('triangle_arb_trades'),
+                'total_arb_profit': record.get('total_arb_profit'),
+                'engine_run_ms': None,
+                'bar_p50_ms': None,
+                'bar_p99_ms': None,
+                'config': json.dumps(run_config, sort_keys=True, default=str),
+            })
+        with closing(self._connect()) as conn, conn:
+            for row in rows:
+                self._insert_run(conn, row)
+        return len(rows)
+
+    @staticmethod
+    def _where(filters: Dict) -> tuple:
+        """由过滤条件生成WHERE子句
+
+        Args:
+            filters: 列名 -> 值或值列表；start_date/end_date表示回测范围落在其中
+
+        Returns:
+            tuple: (WHERE子句, 参数列表)
+        """
+        clauses, params = [], []
+        for column, value in filters.items():
+            if value is None:
+                continue
+            if column == 'start_date':
+                clauses.append("start_date >= ?")
+                params.append(value)
+            elif column == 'end_date':
+                clauses.append("end_date <= ?")
+                params.append(value)
+            elif column not in RUN_COLUMNS and column != 'run_id':
+                raise ValueError(f"不支持的过滤字段: {column}")
+            elif isinstance(value, (list, tuple, set)):
+                clauses.append(f"{column} IN ({', '.join('?' for _ in value)})")
+                params.extend(value)
+            else:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        return (f"WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+    def runs(self, columns: Optional[List[str]] = None, order_by: str = 'run_id', limit: Optional[int] = None,
+             **filters) -> pd.DataFrame:
+        """查询回测记录
+
+        Args:
+            columns: 返回的列，默认SUMMARY_COLUMNS
+            order_by: 排序列，前缀'-'表示降序
+            limit: 最多返回的行数
+            **filters: 过滤条件，见_where
+
+        Returns:
+            pd.DataFrame: 回测记录
+        """
+        columns = columns or SUMMARY_COLUMNS
+        for column in columns + [order_by.lstrip('-')]:
+            if column not in RUN_COLUMNS and column != 'run_id':
+                raise ValueError(f"未知的列: {column}")
+        if not os.path.exists(self.db_path):
+            return pd.DataFrame(columns=columns)
+        where, params = self._where(filters)
+        direction = 'DESC' if order_by.startswith('-') else 'ASC'
+        sql = f"SELECT {', '.join(columns)} FROM runs {where} ORDER BY {order_by.lstrip('-')} {direction}"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(sql, conn, params=params)
+
+    def aggregate(self, group_by: List[str], **filters) -> pd.DataFrame:
+        """按列分组汇总回测记录
+
+        Args:
+            group_by: 分组列，取值见GROUP_COLUMNS
+            **filters: 过滤条件，见_where
+
+        Returns:
+            pd.DataFrame: 每组一行，包含 runs、days、first_date、last_date、num_trades、absolute_profit、
+                mean/min/max_percent_profit、mean_engine_run_ms，按平均收益率降序
+        """
+        unknown = set(group_by) - set(GROUP_COLUMNS)
+        if unknown or not group_by:
+            raise ValueError(f"不支持的分组字段: {sorted(unknown) or group_by}")
+        if not os.path.exists(self.db_path):
+            return pd.DataFrame(columns=list(group_by))
+        where, params = self._where(filters)
+        groups = ', '.join(group_by)
+        sql = f"""
+            SELECT {groups},
+                   COUNT(*) AS runs,
+                   SUM(days) AS days,
+                   MIN(start_date) AS first_date,
+                   MAX(end_date) AS last_date,
+                   SUM(num_trades) AS num_trades,
+                   SUM(absolute_profit) AS absolute_profit,
+                   AVG(percent_profit) AS mean_percent_profit,
+                   MIN(percent_profit) AS min_percent_profit,
+                   MAX(percent_profit) AS max_percent_profit,
+                   AVG(engine_run_ms) AS mean_engine_run_ms
+            FROM runs {where}
+            GROUP BY {groups}
+            ORDER BY mean_percent_profit DESC
+        """
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(sql, conn, params=params)
+
+    def phases(self, run_ids: List[int]) -> pd.DataFrame:
+        """查询回测的分阶段耗时，每个 回测/阶段 一行"""
+        if not os.path.exists(self.db_path) or not run_ids:
+            return pd.DataFrame(columns=['run_id', 'phase', 'total_ms', 'calls'])
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(
+                f"SELECT * FROM run_phases WHERE run_id IN ({', '.join('?' for _ in run_ids)}) "
+                f"ORDER BY run_id, total_ms DESC", conn, params=list(run_ids)
+            )
+
+    def trade_files(self, run_ids: List[int]) -> pd.DataFrame:
+        """查询回测的交易记录文件"""
+        if not os.path.exists(self.db_path) or not run_ids:
+            return pd.DataFrame(columns=['run_id', 'base_currency', 'path'])
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(
+                f"SELECT * FROM run_trade_files WHERE run_id IN ({', '.join('?' for _ in run_ids)}) "
+                f"ORDER BY run_id, base_currency, path", conn, params=list(run_ids)
+            )
+
+    def rebuild(self, results_dir: str) -> int:
+        """扫描结果目录中已有的结果JSON，补充到目录中
+
+        Args:
+            results_dir: 结果目录
+
+        Returns:
+            int: 记录的回测数
+        """
+        count = 0
+        for file_path in sorted(glob.glob(os.path.join(results_dir, "arb_results_*.json"))):
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    results = json.load(f)
+                created_at = datetime.datetime.fromtimestamp(os.path.getmtime(file_path))
+                self.record(results, file_path, created_at.strftime('%Y-%m-%d %H:%M:%S'))
+                count += 1
+            except (OSError, ValueError, KeyError) as e:
+                catalog_logger.warning(f"跳过无法解析的结果文件 {file_path}: {str(e)}")
+        return count
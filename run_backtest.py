@@ -32,8 +32,8 @@ def display_config_summary(config: ArbConfig):
     
     print("=========================\n")
 
-def main():
-    config = ArbConfig()
+def main(config=None):
+    config = config or ArbConfig()
 
     date_str = config.start_date.replace('-', '')
     log_file = setup_logging(date_str)
@@ -54,9 +54,9 @@ def main():
         print("\n===== 回测结果摘要 =====")
         print(f"总耗时: {duration:.2f} 秒")
         print(f"初始资金: {config.initial_cash:.2f}")
-        print(f"最终资金: {backtest.cerebro.broker.getvalue():.2f}")
-        print(f"绝对收益: {backtest.cerebro.broker.getvalue() - config.initial_cash:.2f}")
-        print(f"收益率: {(backtest.cerebro.broker.getvalue() / config.initial_cash - 1) * 100:.2f}%")
+        print(f"最终资金: {backtest.get_final_value():.2f}")
+        print(f"绝对收益: {backtest.get_final_value() - config.initial_cash:.2f}")
+        print(f"收益率: {(backtest.get_final_value() / config.initial_cash - 1) * 100:.2f}%")
         
         if hasattr(strategy, 'num_trades'):
             print(f"套利交易次数: {strategy.num_trades}")
@@ -0,0 +1,137 @@
+import math
+import numpy as np
+import backtrader as bt
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from typing import Callable, Iterator, Dict
+
+from market_store import MarketStore, CSV_COLUMN_MAP, DAY_MS
+
+# 流式数据源读取的列(存储格式列名)
+FEED_COLUMNS = ('timestamp', 'open', 'high', 'low', 'close', 'volume')
+# 每个交易对常驻内存的行数
+FEED_CHUNK_ROWS = 4096
+# 估算的CSV每行字节数，用于把行数换算为Arrow CSV读取的块大小
+CSV_ROW_BYTES = 256
+# 1970-01-01的公历序数，与backtrader的date2num一致
+EPOCH_ORDINAL = 719163
+
+
+def kline_date_nums(timestamps: np.ndarray) -> list:
+    """毫秒时间戳转换为backtrader的日期数值
+
+    与bt.date2num逐位一致(同样对各时间分量做math.fsum)，分量在NumPy中批量计算。
+    """
+    days, ms = np.divmod(np.asarray(timestamps, dtype=np.int64), DAY_MS)
+    ordinals = (days + EPOCH_ORDINAL).astype(np.float64)
+    hours = (ms // 3_600_000) / 24.0
+    minutes = (ms // 60_000 % 60) / 1440.0
+    seconds = (ms // 1000 % 60) / 86400.0
+    micros = (ms % 1000 * 1000) / 8.64e10
+    return [math.fsum(terms) for terms in zip(ordinals.tolist(), hours.tolist(), minutes.tolist(),
+                                              seconds.tolist(), micros.tolist())]
+
+
+def iter_csv_chunks(file_path: str, chunk_rows: int = FEED_CHUNK_ROWS) -> Iterator[Dict[str, np.ndarray]]:
+    """分块读取下载器CSV中的时间戳、OHLC和成交量
+
+    Arrow按字节块流式解析，块大小按chunk_rows估算，其余列不解码。
+    Arrow的浮点解析是精确舍入的，与pandas默认解析器可能有最后一位的差别。
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        header = f.readline().strip().split(',')
+    # 旧版CSV列名(如Open) -> 存储格式列名
+    names = {name: CSV_COLUMN_MAP.get(name, name.lower()) for name in header}
+    include = [name for name in header if names[name] in FEED_COLUMNS]
+    types = {name: pa.int64() if names[name] == 'timestamp' else pa.float64() for name in include}
+
+    # 传入Python文件对象: 按路径打开时Arrow会在后台预读整个文件
+    with open(file_path, 'rb') as f:
+        reader = pa_csv.open_csv(
+            f,
+            read_options=pa_csv.ReadOptions(block_size=max(chunk_rows * CSV_ROW_BYTES, 1 << 16), use_threads=False),
+            convert_options=pa_csv.ConvertOptions(include_columns=include, column_types=types),
+        )
+        for batch in reader:
+            if batch.num_rows:
+                yield {names[name]: batch.column(name).to_numpy() for name in include}
+
+
+def iter_store_chunks(store: MarketStore, pair: str, start_date, end_date,
+                      chunk_rows: int = FEED_CHUNK_ROWS) -> Iterator[Dict[str, np.ndarray]]:
+    """分块读取列式存储中日期范围内的数据"""
+    for batch in store.iter_batches(pair, start_date, end_date, list(FEED_COLUMNS), chunk_rows):
+        if batch.num_rows:
+            yield {name: batch.column(name).to_numpy() for name in FEED_COLUMNS}
+
+
+class StreamingKlineFeed(bt.feed.DataBase):
+    """按块读取K线的Backtrader数据源
+
+    同一时间每个交易对只保留当前块，配合Cerebro(preload=False, runonce=False,
+    exactbars=1)使用时内存与数据总长度无关。chunks为返回块迭代器的无参函数，
+    每块为 列名 -> 数组 的字典，包含FEED_COLUMNS中的列。
+    """
+
+    params = (
+        ('chunks', None),
+    )
+
+    def start(self):
+        super(StreamingKlineFeed, self).start()
+        self._chunks = self.p.chunks()
+        self._pos = 0
+        self._size = 0
+        self._columns = None
+
+    def qbuffer(self, savemem=0, replaying=False):
+        # 多保留一个位置，rewind弹出提前读到的K线后仍能读到上一根
+        for line in self.lines:
+            line.qbuffer(savemem=savemem, extrasize=1)
+
+    def rewind(self, size=1):
+        """交易对之间时间不对齐时，Cerebro把提前读到的K线回退到下一轮再交付
+
+        exactbars模式下LineBuffer.rewind不移动环形缓冲的索引，回退的K线会提前可见；
+        这里把它弹出并放回栈中，下次load时取出，两种缓冲模式下行为一致。
+        """
+        for _ in range(size):
+            self._save2stack(erase=True, force=True)
+
+    def _next_chunk(self) -> bool:
+        for chunk in self._chunks:
+            size = len(chunk['timestamp'])
+            if not size:
+                continue
+            self._columns = (
+                kline_date_nums(chunk['timestamp']),
+                chunk['open'].tolist(),
+                chunk['high'].tolist(),
+                chunk['low'].tolist(),
+                chunk['close'].tolist(),
+                chunk['volume'].tolist(),
+            )
+            self._pos, self._size = 0, size
+            return True
+        self._columns = None
+        return False
+
+    def _load(self):
+        if self._pos >= self._size and not self._next_chunk():
+            return False
+        i = self._pos
+        self._pos += 1
+        dt, open_, high, low, close, volume = self._columns
+        lines = self.lines
+        lines.datetime[0] = dt[i]
+        lines.open[0] = open_[i]
+        lines.high[0] = high[i]
+        lines.low[0] = low[i]
+        lines.close[0] = close[i]
+        lines.volume[0] = volume[i]
+        return True
+
+
+def streaming_feed(chunks: Callable[[], Iterator[Dict[str, np.ndarray]]], name: str) -> StreamingKlineFeed:
+    """创建1秒K线的流式数据源"""
+    return StreamingKlineFeed(chunks=chunks, name=name, timeframe=bt.TimeFrame.Seconds, compression=1)
@@ -0,0 +1,198 @@
+import os
+import logging
+import datetime
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+sink_logger = logging.getLogger('trade_sink')
+
+# 定长交易记录，路径以id保存，可读的路径描述写在旁边的路径表中
+TRADE_DTYPE = np.dtype([
+    ('timestamp', np.int64),       # 毫秒时间戳
+    ('path_id', np.int32),
+    ('profit_rate', np.float64),
+    ('amount', np.float64),
+    ('final_amount', np.float64),
+])
+TRADE_FORMATS = ('parquet', 'csv')
+# 每个缓冲块的记录数，写满后交给后台线程写出
+TRADE_CHUNK_ROWS = 65536
+# Excel单个工作表最多的数据行数(不含表头)
+EXCEL_MAX_ROWS = 1_048_575
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def datetime_to_ms(dt: datetime.datetime) -> int:
+    """不带时区(UTC)的datetime转换为毫秒时间戳，四舍五入到毫秒"""
+    return int(round((dt - _EPOCH) / datetime.timedelta(milliseconds=1)))
+
+
+def paths_table_path(file_path: str) -> str:
+    """交易记录文件对应的路径表文件"""
+    return f"{os.path.splitext(file_path)[0]}_paths.csv"
+
+
+class TradeSink:
+    """流式交易记录写入器
+
+    交易记录以TRADE_DTYPE写入预分配的NumPy缓冲块，写满后由后台线程追加到
+    Parquet或CSV文件，内存中最多同时存在一个正在写出的块和一个正在填充的块。
+    没有任何交易时不创建文件。
+    """
+
+    def __init__(self, file_path: str, fmt: str = 'parquet', path_set=None, chunk_rows: int = TRADE_CHUNK_ROWS):
+        """
+        Args:
+            file_path: 输出文件路径
+            fmt: 'parquet' 或 'csv'
+            path_set: 可选，PathSet，关闭时为出现过的路径写出路径表
+            chunk_rows: 每个缓冲块的记录数
+        """
+        if fmt not in TRADE_FORMATS:
+            raise ValueError(f"不支持的交易记录格式: {fmt}")
+        self.file_path = file_path
+        self.fmt = fmt
+        self.path_set = path_set
+        self.chunk_rows = chunk_rows
+        self.rows = 0
+        self._buffer = np.empty(chunk_rows, dtype=TRADE_DTYPE)
+        self._filled = 0
+        self._writer = None
+        self._executor = None
+        self._pending = None
+        self._used_paths = set()
+        self._closed = False
+
+    def append(self, timestamp: int, path_id: int, profit_rate: float, amount: float, final_amount: float):
+        """追加一条交易记录
+
+        Args:
+            timestamp: 毫秒时间戳
+            path_id: 路径在PathSet中的id
+            profit_rate: 实际收益率
+            amount: 投入金额
+            final_amount: 路径执行后得到的金额
+        """
+        self._buffer[self._filled] = (timestamp, path_id, profit_rate, amount, final_amount)
+        self._filled += 1
+        self.rows += 1
+        if self._filled == self.chunk_rows:
+            self._flush()
+
+    def _flush(self):
+        """把当前缓冲块交给后台线程写出"""
+        if self._filled == 0:
+            return
+        chunk = self._buffer[:self._filled]
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='trade_sink')
+        # 上一块写完再提交下一块，限制内存占用并尽早暴露写入错误
+        if self._pending is not None:
+            self._pending.result()
+        self._pending = self._executor.submit(self._write_chunk, chunk)
+        self._buffer = np.empty(self.chunk_rows, dtype=TRADE_DTYPE)
+        self._filled = 0
+
+    def _write_chunk(self, chunk: np.ndarray):
+        import pyarrow as pa
+
+        table = pa.table({
+            'datetime': pa.array(chunk['timestamp'], type=pa.timestamp('ms')),
+            'path_id': chunk['path_id'],
+            'profit_rate': chunk['profit_rate'],
+            'amount': chunk['amount'],
+            'final_amount': chunk['final_amount'],
+        })
+        if self._writer is None:
+            os.makedirs(os.path.dirname(self.file_path) or '.', exist_ok=True)
+            if self.fmt == 'parquet':
+                import pyarrow.parquet as pq
+                self._writer = pq.ParquetWriter(self.file_path, table.schema, compression='zstd')
+            else:
+                import pyarrow.csv as pa_csv
+                self._writer = pa_csv.CSVWriter(self.file_path, table.schema)
+        self._writer.write_table(table)
+        self._used_paths.update(np.unique(chunk['path_id']).tolist())
+
+    def close(self) -> Optional[str]:
+        """写出剩余记录并关闭文件
+
+        Returns:
+            str: 交易记录文件路径，没有任何交易时返回None
+        """
+        if self._closed:
+            return self.file_path if self.rows else None
+        self._closed = True
+        try:
+            self._flush()
+            if self._pending is not None:
+                self._pending.result()
+        finally:
+            if self._writer is not None:
+                self._writer.close()
+            if self._executor is not None:
+                self._executor.shutdown()
+        if not self.rows:
+            return None
+        if self.path_set is not None:
+            self._write_paths_table()
+        return self.file_path
+
+    def _write_paths_table(self):
+        """写出 路径id -> 路径描述 的对照表，只包含出现过的路径"""
+        with open(paths_table_path(self.file_path), 'w', encoding='utf-8') as f:
+            f.write("path_id,path\n")
+            for path_id in sorted(self._used_paths):
+                f.write(f"{path_id},{self.path_set.path_str(path_id)}\n")
+
+
+def read_trades(file_path: str, with_paths: bool = True):
+    """读取TradeSink写出的交易记录
+
+    Args:
+        file_path: 交易记录文件(.parquet或.csv)，或按天分段回测写出的交易记录目录
+        with_paths: 是否按路径表补充path列
+
+    Returns:
+        pd.DataFrame: 交易记录
+    """
+    import pandas as pd
+
+    if os.path.isdir(file_path):
+        parts = sorted(os.path.join(file_path, name) for name in os.listdir(file_path)
+                       if name.endswith(('.parquet', '.csv')) and not name.endswith('_paths.csv'))
+        frames = [read_trades(part, with_paths) for part in parts]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if file_path.endswith('.parquet'):
+        df = pd.read_parquet(file_path)
+    else:
+        df = pd.read_csv(file_path, parse_dates=['datetime'])
+    paths_file = paths_table_path(file_path)
+    if with_paths and os.path.exists(paths_file):
+        paths = pd.read_csv(paths_file)
+        df = df.merge(paths, on='path_id', how='left')
+        df = df[['datetime', 'path_id', 'path', 'profit_rate', 'amount', 'final_amount']]
+    return df
+
+
+def export_trades_excel(file_path: str, excel_path: Optional[str] = None) -> str:
+    """把交易记录转换为Excel文件，超过单表行数上限时拆分为多个工作表
+
+    Args:
+        file_path: TradeSink写出的交易记录文件
+        excel_path: 输出文件路径，默认与交易记录同名
+
+    Returns:
+        str: Excel文件路径
+    """
+    import pandas as pd
+
+    df = read_trades(file_path)
+    df['datetime'] = df['datetime'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    excel_path = excel_path or f"{os.path.splitext(file_path)[0]}.xlsx"
+    with pd.ExcelWriter(excel_path) as writer:
+        for sheet, start in enumerate(range(0, max(len(df), 1), EXCEL_MAX_ROWS)):
+            df.iloc[start:start + EXCEL_MAX_ROWS].to_excel(writer, sheet_name=f"trades{sheet + 1}", index=False)
+    return excel_path
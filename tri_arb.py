@@ -1,73 +1,24 @@
 import backtrader as bt
-import networkx as nx
 import logging
 import time
 import datetime
-import pandas as pd
 import os
 import json
 
+from path_engine import VectorizedPathEvaluator, IncrementalPathEvaluator, mask_stale, feed_date_nums, date_num_ages
+from path_set import PathSet
+from cycle_discovery import CurrencyGraph, NegativeCycleDetector, find_arb_paths
+from path_cache import canonical_pairs, path_cache_key, default_path_cache
+from trade_sink import TradeSink, datetime_to_ms, export_trades_excel
+from latency import LatencyHistogram
+from phase_profiler import PhaseProfiler
+
 # 设置日志
 arb_logger = logging.getLogger('tri_arb')
-# 保存路径的目录
+# 保存路径的目录，首次写入时创建
 ARB_PATHS_DIR = "arb_paths"
-if not os.path.exists(ARB_PATHS_DIR):
-    os.makedirs(ARB_PATHS_DIR)
-# 保存交易记录的目录
+# 保存交易记录的目录，首次写入时由TradeSink创建
 TRADES_DIR = "./trades"
-if not os.path.exists(TRADES_DIR):
-    os.makedirs(TRADES_DIR)
-
-def build_currency_graph(pairs):
-    """构建币种交易对图结构"""
-    graph = nx.DiGraph()
-    for pair in pairs:
-        try:
-            if '/' in pair:
-                pair = pair.replace('/', '_')
-            base, quote = pair.split('_')
-            # 添加正向和反向边
-            graph.add_edge(base, quote, symbol=pair, direction=1)  # 卖出方向
-            graph.add_edge(quote, base, symbol=pair, direction=-1) # 买入方向
-        except Exception as e:
-            arb_logger.error(f"解析交易对 {pair} 出错: {str(e)}")
-    return graph
-
-def find_triangular_paths(graph, base_currency):
-    """使用NetworkX高效查找三角套利路径
-    
-    Args:
-        graph: 币种交易图
-        base_currency: 基础货币，如'USDT'
-        
-    Returns:
-        list: 套利路径列表
-    """
-    triangles = []
-    if base_currency not in graph:
-        arb_logger.warning(f"警告: 基础货币 {base_currency} 不在交易图中!")
-        return triangles
- 
-    # 统计可能的中间货币数量
-    mid_currencies = list(graph.successors(base_currency))
-    if not mid_currencies:
-        arb_logger.error(f"错误: 没有从 {base_currency} 出发的交易对，无法构建套利路径。")
-        return triangles
-    arb_logger.info(f"找到 {len(mid_currencies)} 个可作为中间货币的币种")
-
-    # 查找所有简单循环 - 长度为3
-    for mid in mid_currencies:
-        for end in graph.successors(mid):
-            if end != base_currency and end != mid and base_currency in graph.successors(end):
-                path = [
-                    (graph[base_currency][mid]['symbol'], graph[base_currency][mid]['direction']),
-                    (graph[mid][end]['symbol'], graph[mid][end]['direction']),
-                    (graph[end][base_currency]['symbol'], graph[end][base_currency]['direction'])
-                ]
-                triangles.append(path)
-
-    arb_logger.info(f"找到 {len(triangles)} 条以 {base_currency} 为起点和终点的三角套利路径")
-    return triangles
 
 def save_paths_to_file(paths, required_pairs, base_currency, file_name=None, calculation_time=None):
     """将套利路径保存到文件中
@@ -82,11 +33,13 @@ def save_paths_to_file(paths, required_pairs, base_currency, file_name=None, cal
     Returns:
         str: 保存的文件路径
     """
+    paths = PathSet.from_paths(paths, base_currency)
     if file_name is None:
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         file_name = f"arb_paths_{base_currency}_{timestamp}.txt"
     
     file_path = os.path.join(ARB_PATHS_DIR, file_name)
+    os.makedirs(ARB_PATHS_DIR, exist_ok=True)
     
     with open(file_path, 'w', encoding='utf-8') as f:
         # 写入元数据
@@ -97,10 +50,9 @@ def save_paths_to_file(paths, required_pairs, base_currency, file_name=None, cal
             f.write(f"# 计算耗时: {calculation_time:.2f}毫秒\n")
         f.write("\n")
         
-        # 写入路径数据
-        for i, path in enumerate(paths):
-            path_str = " → ".join([f"{pair}({'+' if dir==1 else '-'})" for pair, dir in path])
-            f.write(f"路径{i+1}: {path_str}\n")
+        # 写入路径数据，行号即路径id+1
+        for path_id in range(len(paths)):
+            f.write(f"路径{path_id+1}: {paths.path_str(path_id)}\n")
         # 写入所需交易对列表
         f.write("\n# 所需交易对列表\n")
         f.write(", ".join([f'"{pair}"' for pair in required_pairs]))
@@ -108,21 +60,31 @@ def save_paths_to_file(paths, required_pairs, base_currency, file_name=None, cal
 
         # 写入机器可读的JSON格式
         f.write("\n# JSON格式路径数据 (用于程序读取)\n")
-        f.write(json.dumps(paths))
+        f.write(json.dumps(paths.to_list()))
     
     return file_path
 
-def load_paths_from_file(file_path):
+def load_paths_from_file(file_path, base_currency=None):
     """从文件中加载套利路径
     
     Args:
-        file_path: 套利路径文件的路径
+        file_path: 套利路径文件的路径，.npz为路径缓存文件
+        base_currency: 可选，基础货币，不提供时从文件头读取
         
     Returns:
-        list: 套利路径列表
+        PathSet: 套利路径集合
     """
+    if file_path.endswith('.npz'):
+        # 路径缓存文件，基础货币保存在文件中
+        return PathSet.load(file_path)
+
     with open(file_path, 'r', encoding='utf-8') as f:
         content = f.read()
+
+        if base_currency is None:
+            header = content.split("\n", 1)[0]
+            if "基础货币:" in header:
+                base_currency = header.split("基础货币:")[1].strip()
         
         # 查找JSON数据部分
         json_start = content.find("[[[")
@@ -130,92 +92,508 @@ def load_paths_from_file(file_path):
             json_data = content[json_start:]
             try:
                 paths = json.loads(json_data)
-                return paths
+                if base_currency is None and paths:
+                    # 文件头缺失时由第一条腿推断基础货币
+                    pair, direction = paths[0][0]
+                    base_currency = pair.split('_')[0 if direction == 1 else 1]
+                return PathSet.from_paths(paths, base_currency)
             except json.JSONDecodeError:
                 arb_logger.error(f"从文件 {file_path} 解析JSON数据失败")
     
     arb_logger.error(f"无法从文件 {file_path} 加载套利路径")
-    return []
+    return PathSet.from_paths([], base_currency)
 
-def calculate_arb_paths(pairs, base_currency, save_to_file=True):
+def base_currency_list(base_currency):
+    """把基础货币参数统一为列表，兼容单个字符串"""
+    if isinstance(base_currency, str):
+        return [base_currency]
+    return list(base_currency)
+
+def calculate_arb_paths(pairs, base_currency, save_to_file=True, max_legs=3, use_cache=True):
     """计算套利路径并可选保存到文件
+
+    结果按 交易对集合、基础货币、最多腿数 的哈希缓存(见path_cache)，同一组交易对
+    重复回测时直接读取缓存，不再构建币种图；路径文本文件名同样由哈希决定，已存在时不重复写入。
     
     Args:
-        pairs: 交易对列表
-        base_currency: 基础货币
+        pairs: 交易对列表，顺序和重复不影响结果
+        base_currency: 基础货币，或多个基础货币的列表(共享同一张币种图)
         save_to_file: 是否保存到文件
+        max_legs: 路径最多腿数，3为三角套利
+        use_cache: 是否使用路径缓存
         
     Returns:
-        tuple: (套利路径列表, 文件路径(如果保存了))
+        tuple: (套利路径集合PathSet, 文件路径(如果保存了), 所需交易对列表)；
+            base_currency为列表时前两项是 基础货币 -> PathSet / 文件路径 的字典，
+            所需交易对为各基础货币的并集
     """
-    start_time = time.time()
-    
-    # 确保使用下划线格式
-    formatted_pairs = [pair.replace('/', '_') if '/' in pair else pair for pair in pairs]
-    
-    # 创建完整的图用于最终验证
-    graph = build_currency_graph(formatted_pairs)
-    arb_logger.info(f"总图构建完成: {len(graph.nodes())} 个节点, {len(graph.edges())} 条边")
-    
-    all_paths = find_triangular_paths(graph, base_currency)
-    
-    calculation_time = (time.time() - start_time) * 1000
-    arb_logger.info(f"路径计算完成，耗时 {calculation_time:.2f} 毫秒")
-    arb_logger.info(f"共找到 {len(all_paths)} 条套利路径")
-
-    required_pairs = extract_required_pairs(all_paths)
-
-    file_path = None
-    if save_to_file and all_paths:
-        file_path = save_paths_to_file(all_paths, required_pairs, base_currency, calculation_time=calculation_time)
-        arb_logger.info(f"套利路径已保存到文件: {file_path}")
-        # 输出路径示例
-        for i, path in enumerate(all_paths[:3]):
-            if i >= 3:
-                break
-            path_str = " → ".join([f"{pair}({'+' if dir==1 else '-'})" for pair, dir in path])
-            arb_logger.info(f"路径示例{i+1}: {path_str}")
-    
-    
-    return all_paths, file_path, required_pairs
+    # 统一为排序后的下划线格式，路径顺序只取决于交易对集合
+    formatted_pairs = canonical_pairs(pairs)
+    cache = default_path_cache() if use_cache else None
+    graph = None
+
+    path_sets, file_paths, required_pairs = {}, {}, {}
+    for base in base_currency_list(base_currency):
+        key = path_cache_key(formatted_pairs, base, max_legs)
+        all_paths = cache.get(key) if cache is not None else None
+        calculation_time = None
+        if all_paths is not None:
+            arb_logger.info(f"使用缓存的 {base} 套利路径: {len(all_paths)} 条")
+        else:
+            if graph is None:
+                graph = CurrencyGraph.from_pairs(formatted_pairs)
+                arb_logger.info(f"币种图构建完成: {graph.num_nodes} 个节点, {graph.num_edges} 条边")
+            start_time = time.time()
+            all_paths = find_arb_paths(graph, base, max_legs=max_legs)
+            calculation_time = (time.time() - start_time) * 1000
+            arb_logger.info(f"路径计算完成，耗时 {calculation_time:.2f} 毫秒")
+            arb_logger.info(f"共找到 {len(all_paths)} 条 {base} 套利路径")
+            if cache is not None:
+                cache.put(key, all_paths)
+
+        base_pairs = extract_required_pairs(all_paths)
+
+        file_path = None
+        if save_to_file and all_paths:
+            file_name = f"arb_paths_{base}_{key[:12]}.txt"
+            file_path = os.path.join(ARB_PATHS_DIR, file_name)
+            if not os.path.exists(file_path):
+                save_paths_to_file(all_paths, base_pairs, base, file_name=file_name, calculation_time=calculation_time)
+                arb_logger.info(f"套利路径已保存到文件: {file_path}")
+                # 输出路径示例
+                for path_id in range(min(3, len(all_paths))):
+                    arb_logger.info(f"路径示例{path_id+1}: {all_paths.path_str(path_id)}")
+
+        path_sets[base], file_paths[base] = all_paths, file_path
+        required_pairs.update(dict.fromkeys(base_pairs))
+
+    if isinstance(base_currency, str):
+        return path_sets[base_currency], file_paths[base_currency], list(required_pairs)
+    return path_sets, file_paths, list(required_pairs)
 
 def extract_required_pairs(paths):
     """从套利路径中提取所需的交易对"""
-    required_pairs = set()
-    for path in paths:
-        for pair, _ in path:
-            required_pairs.add(pair)
-    required_pairs_list = list(required_pairs)
+    if isinstance(paths, PathSet):
+        required_pairs_list = paths.required_pairs()
+    else:
+        required_pairs = set()
+        for path in paths:
+            for pair, _ in path:
+                required_pairs.add(pair)
+        required_pairs_list = list(required_pairs)
     arb_logger.info(f"路径所需 {len(required_pairs_list)} 个交易对")
     return required_pairs_list
 
+def simulate_path_trade(path, prices, amount, fee, base_currency):
+    """按给定价格虚拟执行一条套利路径
+    
+    Args:
+        path: 交易路径
+        prices: 与路径各腿对应的价格列表
+        amount: 投入的基础货币数量
+        fee: 每条腿的手续费率
+        base_currency: 基础货币
+        
+    Returns:
+        tuple: (最终基础货币数量, 折算为计价货币的手续费合计, 各腿手续费描述列表)
+        
+    Raises:
+        ValueError: 路径货币不匹配或未回到基础货币
+    """
+    total_fee = 0.0
+    fee_amounts = []
+    current_amount = amount
+    current_currency = base_currency
+
+    for (pair, direction), price in zip(path, prices):
+        base, quote = pair.split('_')
+
+        if direction == 1:
+            if current_currency == base:
+                size = current_amount
+                fee_amount = size * price * fee
+                fee_amounts.append(f"{fee_amount:.6f} {quote}")
+                total_fee += fee_amount
+                current_amount = size * price - fee_amount
+                current_currency = quote
+            else:
+                raise ValueError(f"货币不匹配: 当前持有{current_currency}，但需要卖出{base}")
+        else:
+            if current_currency == quote:
+                size = current_amount / price
+                fee_amount = size * fee
+                fee_amounts.append(f"{fee_amount:.6f} {base}")
+                total_fee += fee_amount * price 
+                current_amount = size - fee_amount
+                current_currency = base
+            else:
+                raise ValueError(f"货币不匹配: 当前持有{current_currency}，但需要使用{quote}")
+            
+    if current_currency != base_currency:
+        raise ValueError(f"套利交易未能回到基础货币: 当前持有{current_currency}")
+    return current_amount, total_fee, fee_amounts
+
+def format_trade_log(path, prices, profit_rate, final_amount):
+    """生成套利交易的日志描述"""
+    currency_pairs = []
+    rates = []
+    for (pair, direction), price in zip(path, prices):
+        if direction == 1:
+            currency_pairs.append(pair)
+            rates.append(f"{price:.8f}")
+        else:
+            base, quote = pair.split('_')
+            currency_pairs.append(f"{quote}_{base}")
+            rates.append(f"1/{price:.8f}")
+    return (f"执行套利：{' → '.join(currency_pairs)}; "
+            f"汇率: {', '.join(rates)}; "
+            f"收益率: {profit_rate*100:.4f}%; "
+            f"资产: {final_amount:.4f}")
+
+def trade_file_path(base_currency, threshold, fmt='parquet'):
+    """生成交易记录文件路径，文件名包含微秒和进程号，同一秒内的多次回测和并行进程不会写到同一个文件
+    
+    Args:
+        base_currency: 基础货币
+        threshold: 收益阈值
+        fmt: 文件格式，'parquet' 或 'csv'
+        
+    Returns:
+        str: 文件路径
+    """
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    threshold_info = f"thresh{threshold*100:.2f}"
+    filename = f"arb_trades_{base_currency}_{threshold_info}_{timestamp}_{os.getpid()}.{fmt}"
+    return os.path.join(TRADES_DIR, filename)
+
+def load_strategy_paths(params, pairs, log):
+    """按策略参数加载或计算套利路径
+    
+    Args:
+        params: 策略参数，需包含paths_file、base_currency、save_paths、max_legs、path_cache、debug；
+            base_currency可以是列表，paths_file可以是 基础货币 -> 文件 的字典
+        pairs: 实际可用的交易对列表
+        log: 日志函数
+        
+    Returns:
+        list: 每个基础货币一项 (基础货币, 套利路径集合PathSet, 路径文件路径)，顺序与base_currency一致
+    """
+    bases = base_currency_list(params.base_currency)
+    if isinstance(params.paths_file, dict):
+        paths_files = params.paths_file
+    else:
+        paths_files = {bases[0]: params.paths_file} if params.paths_file else {}
+
+    # 没有路径文件的基础货币在同一张币种图上一起计算
+    to_calculate = [base for base in bases if not paths_files.get(base)]
+    path_sets, file_paths = {}, {}
+    if to_calculate:
+        log("基于实际可用交易对计算套利路径...")
+        path_sets, file_paths, _ = calculate_arb_paths(
+            pairs, 
+            to_calculate,
+            save_to_file=params.save_paths,
+            max_legs=params.max_legs,
+            use_cache=params.path_cache
+        )
+
+    results = []
+    for base in bases:
+        if paths_files.get(base):
+            # 从文件加载套利路径
+            log(f"从文件加载套利路径: {paths_files[base]}")
+            arb_paths = load_paths_from_file(paths_files[base], base)
+            log(f"从文件加载了 {len(arb_paths)} 条套利路径")
+            paths_file_path = paths_files[base]
+        else:
+            arb_paths, paths_file_path = path_sets[base], file_paths[base]
+            if paths_file_path:
+                log(f"套利路径已保存到: {paths_file_path}")
+
+        if arb_paths:
+            log(f"{base}: 找到 {len(arb_paths)} 个套利路径")
+            if params.debug:
+                for path_id in range(min(3, len(arb_paths))):
+                    log(f"路径示例{path_id+1}: {arb_paths.path_str(path_id)}")
+        else:
+            log(f"{base}: 没有找到符合要求的套利路径")
+        results.append((base, arb_paths, paths_file_path))
+    return results
+
+def build_path_evaluator(arb_paths, feed_names, params):
+    """按eval_mode创建路径评估器
+    
+    Args:
+        arb_paths: 套利路径集合
+        feed_names: 数据源名称列表，顺序与价格向量一致
+        params: 策略参数，需包含eval_mode、fee、threshold
+        
+    Returns:
+        评估器对象，'loop'模式或没有路径时返回None
+    """
+    if not arb_paths:
+        return None
+    if params.eval_mode == 'vectorized':
+        return VectorizedPathEvaluator(arb_paths, feed_names, params.fee)
+    if params.eval_mode == 'incremental':
+        return IncrementalPathEvaluator(arb_paths, feed_names, params.fee, floor=params.threshold)
+    return None
+
+def build_cycle_detector(params, pairs, feed_names, ledgers):
+    """按cycle_detection参数创建负权环检测器
+
+    Args:
+        params: 策略参数，需包含cycle_detection、fee、threshold
+        pairs: 实际可用的交易对列表
+        feed_names: 数据源名称列表，顺序与价格向量一致
+        ledgers: ArbLedger列表，检测时的腿数取各路径集合中最长的路径
+
+    Returns:
+        NegativeCycleDetector: 未开启或没有路径时返回None
+    """
+    path_sets = [ledger.arb_paths for ledger in ledgers if ledger.arb_paths]
+    if not params.cycle_detection or not path_sets:
+        return None
+    max_legs = max(path_set.max_legs for path_set in path_sets)
+    return NegativeCycleDetector(pairs, feed_names, params.fee, params.threshold, max_legs)
+
+class ArbLedger:
+    """单个基础货币的路径集合和账本
+
+    多基础货币回测时各基础货币共享数据源和每根K线的价格向量，但各自拥有
+    路径集合、评估器、资金、持仓、跳过时间和交易记录，金额均以本币计。
+    """
+
+    def __init__(self, base_currency, arb_paths, paths_file_path, cash, trade_amount, trade_sink=None):
+        """
+        Args:
+            base_currency: 基础货币
+            arb_paths: 该基础货币的套利路径集合
+            paths_file_path: 路径文件路径
+            cash: 初始资金(本币)
+            trade_amount: 每次交易金额(本币)
+            trade_sink: 可选，TradeSink，逐笔写出交易记录
+        """
+        self.base_currency = base_currency
+        self.arb_paths = arb_paths
+        self.paths_file_path = paths_file_path
+        self.evaluator = None
+        self.initial_cash = cash
+        self.cash = cash
+        self.trade_amount = trade_amount
+        self.active_trades = set()
+        self.num_trades = 0
+        self.total_profit = 0.0
+        self.last_trade_time = None
+        self.skip_until = None
+        self.trade_sink = trade_sink
+        self.trade_files = []  # 已写出的交易记录文件
+
+    def max_trades(self, max_positions):
+        """本轮最多可执行的交易数"""
+        return min(max_positions, int(self.cash / self.trade_amount))
+
+    def settle(self, path_id, prices, fee, timestamp):
+        """按给定价格虚拟执行路径并记账
+
+        Args:
+            path_id: 路径在PathSet中的id
+            prices: 与路径各腿对应的价格列表
+            fee: 每条腿的手续费率
+            timestamp: 交易时间(毫秒时间戳)
+
+        Returns:
+            tuple: (实际收益率, 执行后资金)
+
+        Raises:
+            ValueError: 路径无法执行
+        """
+        amount = self.trade_amount
+        current_amount, _, _ = simulate_path_trade(self.arb_paths[path_id], prices, amount, fee, self.base_currency)
+
+        initial_amount = self.cash
+        final_amount = initial_amount - amount + current_amount
+        self.cash = final_amount
+
+        actual_profit = final_amount - initial_amount
+        profit_rate = actual_profit / amount
+        self.total_profit += actual_profit
+        self.num_trades += 1
+
+        if self.trade_sink is not None:
+            self.trade_sink.append(timestamp, path_id, profit_rate, amount, current_amount)
+        return profit_rate, final_amount
+
+    def close_trades(self):
+        """写出剩余的交易记录
+
+        Returns:
+            str: 交易记录文件路径，没有交易或未记录时返回None
+        """
+        if self.trade_sink is None:
+            return None
+        return self.trade_sink.close()
+
+    def summary(self):
+        """账本摘要，金额以本币计"""
+        return {
+            'initial_cash': self.initial_cash,
+            'final_value': self.cash,
+            'absolute_profit': self.cash - self.initial_cash,
+            'percent_profit': (self.cash / self.initial_cash - 1) * 100 if self.initial_cash else 0.0,
+            'num_paths': len(self.arb_paths),
+            'triangle_arb_trades': self.num_trades,
+            'total_arb_profit': self.total_profit,
+        }
+
+def build_ledgers(params, pairs, feed_names, cash, log):
+    """为每个基础货币加载路径并创建账本
+
+    Args:
+        params: 策略参数，除load_strategy_paths所需字段外还需trade_amount、base_settings、
+            threshold、trade_format
+        pairs: 实际可用的交易对列表
+        feed_names: 数据源名称列表，顺序与价格向量一致
+        cash: 第一个基础货币的初始资金，也是其他基础货币未单独设置时的默认值
+        log: 日志函数
+
+    Returns:
+        list: ArbLedger列表，第一个为主基础货币
+    """
+    base_settings = params.base_settings or {}
+    ledgers = []
+    for base, arb_paths, paths_file_path in load_strategy_paths(params, pairs, log):
+        settings = base_settings.get(base, {})
+        # 主基础货币的资金与账户(broker)保持一致，不受base_settings影响
+        base_cash = settings.get('initial_cash', cash) if ledgers else cash
+        trade_sink = None
+        if params.trade_format:
+            trade_sink = TradeSink(trade_file_path(base, params.threshold, params.trade_format),
+                                   params.trade_format, arb_paths)
+        ledger = ArbLedger(base, arb_paths, paths_file_path, base_cash,
+                           settings.get('trade_amount', params.trade_amount), trade_sink)
+        ledger.evaluator = build_path_evaluator(arb_paths, feed_names, params)
+        ledgers.append(ledger)
+    return ledgers
+
+def convert_amount(amount, from_currency, to_currency, getprice):
+    """按直接交易对的当前价格把金额折算为另一种货币
+
+    Args:
+        amount: 金额
+        from_currency: 原货币
+        to_currency: 目标货币
+        getprice: 交易对名称 -> 当前价格的函数，没有该交易对时返回None
+
+    Returns:
+        float: 折算后的金额，没有直接交易对或价格无效时返回None
+    """
+    if from_currency == to_currency:
+        return amount
+    price = getprice(f"{from_currency}_{to_currency}")
+    if price is not None and price > 0:
+        return amount * price
+    price = getprice(f"{to_currency}_{from_currency}")
+    if price is not None and price > 0:
+        return amount / price
+    return None
+
+def summarize_ledgers(ledgers, getprice):
+    """汇总各基础货币的结果
+
+    合计的交易次数直接相加；资金和收益按回测结束时的价格折算为第一个基础货币，
+    无法折算的基础货币列在unconverted中，不计入合计金额。
+
+    Args:
+        ledgers: ArbLedger列表
+        getprice: 交易对名称 -> 当前价格的函数
+
+    Returns:
+        dict: {'per_base': {基础货币: 摘要}, 'combined': 合计}
+    """
+    primary = ledgers[0].base_currency
+    combined = {
+        'base_currency': primary,
+        'initial_cash': 0.0,
+        'final_value': 0.0,
+        'triangle_arb_trades': 0,
+        'total_arb_profit': 0.0,
+        'unconverted': [],
+    }
+    for ledger in ledgers:
+        combined['triangle_arb_trades'] += ledger.num_trades
+        values = [convert_amount(value, ledger.base_currency, primary, getprice)
+                  for value in (ledger.initial_cash, ledger.cash, ledger.total_profit)]
+        if any(value is None for value in values):
+            combined['unconverted'].append(ledger.base_currency)
+            continue
+        combined['initial_cash'] += values[0]
+        combined['final_value'] += values[1]
+        combined['total_arb_profit'] += values[2]
+    combined['absolute_profit'] = combined['final_value'] - combined['initial_cash']
+    return {
+        'per_base': {ledger.base_currency: ledger.summary() for ledger in ledgers},
+        'combined': combined,
+    }
+
+def export_trade_records(ledgers, export_excel, log):
+    """关闭各账本的交易记录文件，按需转换为Excel
+
+    Args:
+        ledgers: ArbLedger列表
+        export_excel: 是否另存为Excel
+        log: 日志函数
+    """
+    for ledger in ledgers:
+        try:
+            filepath = ledger.close_trades()
+            if filepath is None:
+                continue
+            ledger.trade_files.append(filepath)
+            log(f"{ledger.base_currency} 交易记录已导出到: {filepath}")
+            if export_excel:
+                log(f"Excel交易记录已导出到: {export_trades_excel(filepath)}")
+        except Exception as e:
+            log(f"导出交易记录时出错: {str(e)}")
+
 class TriangularArbStrategy(bt.Strategy):
-    """三角套利策略"""
+    """三角套利策略
+
+    base_currency可以是基础货币列表，各基础货币共享数据源和每根K线的价格向量，
+    各自独立记账；第一个基础货币的资金与账户(broker)同步。
+    """
     params = dict(
         fee=0.0005,            # 交易手续费
-        base_currency='USDT',  # 基础货币
+        base_currency='USDT',  # 基础货币，或多个基础货币的列表
         trade_amount=0.1,      # 每次固定交易0.1个基础货币
         threshold=0.001,       # 收益阈值 (0.1%)，超过此值才执行交易
-        max_positions=5,       # 最大同时持有的套利路径数
+        max_positions=5,       # 每个基础货币最大同时持有的套利路径数
         skip_seconds=3,        # 跳过的秒数
+        max_age=0,             # 价格年龄上限(秒)，任一腿超过该秒数没有新K线时跳过该路径，0表示不限制
         debug=False,           # 是否开启调试模式
-        paths_file=None,       # 套利路径文件路径
+        paths_file=None,       # 套利路径文件路径，多基础货币时可为 基础货币 -> 文件 的字典
         save_paths=True,       # 是否保存计算的路径到文件
         available_pairs=None,  # 可用的交易对列表
+        eval_mode='vectorized',  # 路径评估方式: 'vectorized' 向量化批量计算, 'incremental' 只计算价格变化的路径, 'loop' 逐条计算(不支持max_age)
+        max_legs=3,            # 套利路径最多腿数，3为三角套利
+        cycle_detection=False,  # 每根K线先用Bellman-Ford检测是否存在超过阈值的套利环，没有时跳过路径评估(不支持loop)
+        base_settings=None,    # 可选，基础货币 -> {'initial_cash', 'trade_amount'}，覆盖非主基础货币的资金和交易金额
+        path_cache=True,       # 是否使用按交易对集合哈希的路径缓存
+        trade_format='parquet',  # 交易记录格式: 'parquet' 或 'csv'，None表示不记录
+        export_excel=False,    # 回测结束后是否把交易记录另存为Excel
+        profiler=None,         # 可选，PhaseProfiler，记录路径评估、交易执行、日志等阶段的耗时
     )
 
     def __init__(self):
         """初始化策略"""
-        self.arb_paths = [] 
+        self.profiler = self.p.profiler or PhaseProfiler(enabled=False)
+        init_start = self.profiler.start()
         self.pairs = []
-        self.active_trades = set()
-        self.execution_times = []
-        self.num_trades = 0
-        self.total_profit = 0.0
-        self.last_trade_time = None
-        self.skip_until = None
-        self.trade_records = []
-        self.paths_file_path = None
+        self.latency = LatencyHistogram()  # 每根K线的处理耗时(纳秒)
+        self.summary = None
+        self.current_datetime = None  # 当前K线的时间，见next
+        # 交易对名称 -> 数据源，getprice为O(1)查找
+        self.feed_by_name = {d._name: d for d in self.datas}
 
         if self.p.available_pairs:
             # 如果提供了可用交易对列表，则使用它
@@ -226,121 +604,131 @@ class TriangularArbStrategy(bt.Strategy):
             self.pairs = [d._name for d in self.datas]
             self.log(f"从数据中获取 {len(self.pairs)} 个交易对")
         
+        if (self.p.max_age or self.p.cycle_detection) and self.p.eval_mode == 'loop':
+            arb_logger.warning("loop评估方式不支持max_age和cycle_detection，改用 vectorized")
+            self.p.eval_mode = 'vectorized'
+
         # 计算套利路径 - 始终使用实际可用的交易对
-        if self.p.paths_file:
-            # 从文件加载套利路径
-            self.log(f"从文件加载套利路径: {self.p.paths_file}")
-            self.arb_paths = load_paths_from_file(self.p.paths_file)
-            self.log(f"从文件加载了 {len(self.arb_paths)} 条套利路径")
-            self.paths_file_path = self.p.paths_file
-        else:
-            self.log("基于实际可用交易对计算套利路径...")
-            self.arb_paths, file_path, _ = calculate_arb_paths(
-                self.pairs, 
-                self.p.base_currency,
-                save_to_file=self.p.save_paths
-            )
-            if file_path:
-                self.log(f"套利路径已保存到: {file_path}")
-                self.paths_file_path = file_path
-
-        if self.arb_paths:
-            self.log(f"找到 {len(self.arb_paths)} 个套利路径")
-            if len(self.arb_paths) > 0 and self.p.debug:
-                for i, path in enumerate(self.arb_paths[:3]):
-                    path_str = " → ".join([f"{pair}({'+' if dir==1 else '-'})" for pair, dir in path])
-                    self.log(f"路径示例{i+1}: {path_str}")
-        else:
-            self.log(f"没有找到符合要求的套利路径")
+        feed_names = [d._name for d in self.datas]
+        self.ledgers = build_ledgers(self.p, self.pairs, feed_names, self.broker.getcash(), self.log)
+        self.arb_paths = self.ledgers[0].arb_paths
+        self.cycle_detector = build_cycle_detector(self.p, self.pairs, feed_names, self.ledgers)
+        self.profiler.stop('strategy.init', init_start)
+
+    @property
+    def num_trades(self):
+        """所有基础货币的套利次数合计"""
+        return sum(ledger.num_trades for ledger in self.ledgers)
+
+    @property
+    def total_profit(self):
+        """套利理论收益，多基础货币时为折算成主基础货币的合计"""
+        if self.summary is not None:
+            return self.summary['combined']['total_arb_profit']
+        return self.ledgers[0].total_profit
         
     def next(self):
         """主策略逻辑"""
-        if not hasattr(self, 'arb_paths') or not self.arb_paths:
-            return
-        
-        start_time = time.time()
-        # 检查是否需要跳过当前时间点
-        current_datetime = self.datas[0].datetime.datetime(0)
-        if self.skip_until and current_datetime < self.skip_until:
-            return
-        
-        # 获取可用资金和可执行交易数量
-        total_available_cash = self.broker.getcash()
-        per_trade_amount = self.p.trade_amount
-        max_positions = self.p.max_positions
-        max_possible_trades = min(max_positions, int(total_available_cash / per_trade_amount))
-        
-        if max_possible_trades <= 0:
-            return
-        
-        profitable_paths = self._check_paths_chunk(self.arb_paths, per_trade_amount)
-        if not profitable_paths:
-            return
-        profitable_paths.sort(reverse=True, key=lambda x: x[0])
-        executed_count = 0
-        
-        for profit, path in profitable_paths[:max_possible_trades]:
-            path_id = hash(str(path))
-            if path_id in self.active_trades:
+        start_time = time.perf_counter_ns()
+        # 第一个交易对在这一秒可能没有K线，以所有数据源中最新的时间为当前时间
+        date_nums = feed_date_nums(self.datas)
+        current_datetime = self.current_datetime = bt.num2date(date_nums.max())
+        prices = None
+        no_cycle = False
+        evaluated = False
+
+        for ledger in self.ledgers:
+            if not ledger.arb_paths:
                 continue
-                
-            self.active_trades.add(path_id)
-            self._execute_trade(path, per_trade_amount, path_id, profit)
-            executed_count += 1
-        
-        if executed_count > 0:
-            self.last_trade_time = current_datetime
-            self.skip_until = current_datetime + datetime.timedelta(seconds=self.p.skip_seconds)
-        
+            # 检查是否需要跳过当前时间点
+            if ledger.skip_until and current_datetime < ledger.skip_until:
+                continue
+
+            # 获取可用资金和可执行交易数量
+            max_possible_trades = ledger.max_trades(self.p.max_positions)
+            if max_possible_trades <= 0:
+                continue
+
+            eval_start = self.profiler.start()
+            if ledger.evaluator is not None:
+                # 所有基础货币共享同一个价格向量，每根K线只收集一次
+                if prices is None:
+                    prices = ledger.evaluator.gather_prices(self.datas)
+                    if self.p.max_age:
+                        prices = mask_stale(prices, date_num_ages(date_nums), self.p.max_age)
+                    # 整张币种图上都没有超过阈值的环时，任何路径都不会成交
+                    no_cycle = self.cycle_detector is not None and self.cycle_detector.find(prices) is None
+                if no_cycle:
+                    candidates = []
+                else:
+                    candidates = ledger.evaluator.best_paths(
+                        prices, self.p.threshold, max_possible_trades, exclude=ledger.active_trades
+                    )
+            else:
+                candidates = self._loop_candidates(ledger, max_possible_trades)
+            self.profiler.stop('strategy.evaluate', eval_start)
+            evaluated = True
+
+            for path_id, profit in candidates:
+                ledger.active_trades.add(path_id)
+                self._execute_trade(ledger, path_id, profit)
+
+            if candidates:
+                ledger.last_trade_time = current_datetime
+                ledger.skip_until = current_datetime + datetime.timedelta(seconds=self.p.skip_seconds)
+
         # 记录执行时间
-        execution_time = (time.time() - start_time) * 1000  # 转换为毫秒
-        self.execution_times.append(execution_time)
-    
-    def _check_paths_chunk(self, paths, amount):
+        elapsed = time.perf_counter_ns() - start_time
+        if evaluated:
+            self.latency.record(elapsed)
+        self.profiler.add('strategy.next', elapsed)
+
+    def _loop_candidates(self, ledger, max_trades):
+        """逐条计算路径收益，返回收益最高的若干条
+
+        Args:
+            ledger: 基础货币账本
+            max_trades: 本轮最多执行的交易数
+
+        Returns:
+            list: [(路径id, 收益率), ...]，按收益率降序
+        """
+        profitable_paths = self._check_paths_chunk(ledger, ledger.trade_amount)
+        profitable_paths.sort(reverse=True, key=lambda x: x[0])
+        return [(path_id, profit) for profit, path_id in profitable_paths[:max_trades]]
+
+    def _check_paths_chunk(self, ledger, amount):
         """检查一组路径是否有利可图
         
         Args:
-            paths: 路径列表
+            ledger: 基础货币账本
             amount: 交易金额
             
         Returns:
-            list: 包含(利润, 路径)元组的列表
+            list: 包含(利润, 路径id)元组的列表
         """
         profitable = []
-        # max_profit = -float('inf')
-        for path in paths:
-            path_id = hash(str(path))
-            if path_id in self.active_trades:
+        for path_id, path in enumerate(ledger.arb_paths):
+            if path_id in ledger.active_trades:
                 continue
             
-            profit = self._calculate_profit(path, amount)
-            # max_profit = max(max_profit, profit) if profit != -1 else max_profit
-
-            # path_str = " → ".join([f"{pair}({'+' if dir==1 else '-'})" for pair, dir in path])
-            prices = []
-            for pair, direction in path:
-                price = self.getprice(pair)
-                if price:
-                    prices.append(f"{pair}:{price:.8f}")
-                else:
-                    prices.append(f"{pair}:NA")
-            # self.log(f"检查路径: {path_str} - 汇率: {', '.join(prices)} - 利润率: {profit*100:.6f}%")        
+            profit = self._calculate_profit(path, amount, ledger.base_currency)
 
             if profit > self.params.threshold:
-                profitable.append((profit, path))
+                profitable.append((profit, path_id))
 
         return profitable
     
     def getprice(self, pair_name):
         """获取交易对的当前价格"""
-        for data in self.datas:
-            if data._name == pair_name:
-                return data.close[0]
-        return None
+        data = self.feed_by_name.get(pair_name)
+        if data is None:
+            return None
+        return data.close[0]
 
-    def _calculate_profit(self, path, amount):
+    def _calculate_profit(self, path, amount, base_currency=None):
         """计算套利路径的理论收益率"""
-        base_currency = self.p.base_currency
+        base_currency = base_currency or self.ledgers[0].base_currency
         initial = amount
         current = amount
         current_currency = base_currency
@@ -371,145 +759,61 @@ class TriangularArbStrategy(bt.Strategy):
             return -1
         return (current - initial) / initial
     
-    def _execute_trade(self, path, amount, path_id, profit):
+    def _execute_trade(self, ledger, path_id, profit):
         """执行套利交易
         
         Args:
-            path: 交易路径
-            amount: 交易金额
-            path_id: 路径ID
+            ledger: 基础货币账本
+            path_id: 路径在PathSet中的id
             profit: 预期收益率
         """
-        prices = []
-        currency_pairs = []
-        total_fee = 0.0
-        fee_amounts = []
-        
+        execute_start = self.profiler.start()
+        path = ledger.arb_paths[path_id]
         # 获取交易对价格
-        for pair, direction in path:
-            price = self.getprice(pair)
-            prices.append(price)
-            
-            if direction == 1:
-                currency_pairs.append(pair)
-            else:
-                base, quote = pair.split('_')
-                currency_pairs.append(f"{quote}_{base}")
-
-        # 获取当前时间
-        current_datetime = self.datas[0].datetime.datetime(0)
-        initial_amount = self.broker.getvalue()
+        prices = [self.getprice(pair) for pair, _ in path]
         
         try:
-            current_amount = amount
-            current_currency = self.p.base_currency
-
-            for i, (pair, direction) in enumerate(path):
-                price = self.getprice(pair)
-                base_currency, quote_currency = pair.split('_')
-
-                if direction == 1:
-                    if current_currency == base_currency:
-                        size = current_amount
-                        fee_amount = size * price * self.params.fee
-                        fee_amounts.append(f"{fee_amount:.6f} {quote_currency}")
-                        total_fee += fee_amount
-                        # 虚拟执行交易，不使用backtrader自带的交易系统
-                        current_amount = size * price - fee_amount
-                        current_currency = quote_currency
-                    else:
-                        raise ValueError(f"货币不匹配: 当前持有{current_currency}，但需要卖出{base_currency}")
-                else:
-                    if current_currency == quote_currency:
-                        size = current_amount / price
-                        fee_amount = size * self.params.fee
-                        fee_amounts.append(f"{fee_amount:.6f} {base_currency}")
-                        total_fee += fee_amount * price 
-                        # 虚拟执行交易
-                        current_amount = size - fee_amount
-                        current_currency = base_currency
-                    else:
-                        raise ValueError(f"货币不匹配: 当前持有{current_currency}，但需要使用{quote_currency}")
-                    
-            if current_currency != self.p.base_currency:
-                raise ValueError(f"套利交易未能回到基础货币: 当前持有{current_currency}")
-
-            final_amount = initial_amount - amount + current_amount
-            self.broker.setcash(final_amount)  # 更新账户余额
-
-            actual_profit = final_amount - initial_amount
-            profit_rate = actual_profit / amount
-            self.total_profit += actual_profit
-            self.num_trades += 1
-
-            # 构建路径描述字符串
-            path_str = " → ".join([f"{pair}({'+' if dir==1 else '-'})" for pair, dir in path])
-            
-            # 将交易记录添加到列表中
-            self.trade_records.append({
-                'datetime': current_datetime,
-                'path': path_str,
-                'profit_rate': profit_rate, 
-                'amount': amount,
-                'final_amount': current_amount
-            })
-
-            # 格式化输出
-            rates = []
-            for i, (pair, direction) in enumerate(path):
-                if direction == 1:
-                    rates.append(f"{prices[i]:.8f}")
-                else:
-                    rates.append(f"1/{prices[i]:.8f}")
-            
-            self.log(f"执行套利：{' → '.join([cp for cp in currency_pairs])}; "
-                    f"汇率: {', '.join(rates)}; "
-                    f"收益率: {profit_rate*100:.4f}%; "
-                    f"资产: {final_amount:.4f}")
+            # 虚拟执行交易，不使用backtrader自带的交易系统
+            profit_rate, final_amount = ledger.settle(
+                path_id, prices, self.params.fee, datetime_to_ms(self.current_datetime)
+            )
+            if ledger is self.ledgers[0]:
+                self.broker.setcash(final_amount)  # 更新账户余额
+
+            log_start = self.profiler.start()
+            self.log(format_trade_log(path, prices, profit_rate, final_amount))
+            self.profiler.stop('strategy.log', log_start)
             
         except Exception as e:
             self.log(f"执行套利交易失败: {str(e)}")
         finally:
-            self.active_trades.remove(path_id)
+            ledger.active_trades.remove(path_id)
+            self.profiler.stop('strategy.execute', execute_start)
 
     def log(self, txt, dt=None):
         """日志记录"""
-        dt = dt or self.datas[0].datetime.datetime(0)
-        arb_logger.info(f"{dt.isoformat()} {txt}")
+        # 初始化时还没有推进到任何K线，不带时间
+        if dt is None:
+            dt = self.current_datetime
+        prefix = dt.isoformat() if dt else ''
+        arb_logger.info(f"{prefix} {txt}")
     
     def stop(self):
         """策略结束时执行 - 输出性能统计和总结"""
-        if self.execution_times:
-            avg_time = sum(self.execution_times) / len(self.execution_times)
-            max_time = max(self.execution_times)
-            
-            self.log(f"策略完成: 共检查{len(self.arb_paths)}条路径, "
-                    f"执行{self.num_trades}次套利, 总收益:{self.total_profit:.4f}")
-            self.log(f"性能统计: 平均每轮耗时={avg_time:.2f}ms, 最长耗时={max_time:.2f}ms")
-            
-            if self.trade_records:
-                self.export_trade_records()
+        stop_start = self.profiler.start()
+        self.summary = summarize_ledgers(self.ledgers, self.getprice)
+        if self.latency.count:
+            for ledger in self.ledgers:
+                self.log(f"策略完成: {ledger.base_currency} 共检查{len(ledger.arb_paths)}条路径, "
+                        f"执行{ledger.num_trades}次套利, 总收益:{ledger.total_profit:.4f}")
+            self.log(f"性能统计: 每轮耗时 {self.latency.format_summary()}")
         else:
             self.log("策略执行完成，但未进行任何套利交易。")
+        if self.cycle_detector is not None:
+            self.log(self.cycle_detector.summary())
+        self.export_trade_records()
+        self.profiler.stop('strategy.stop', stop_start)
 
     def export_trade_records(self):
-        """将交易记录导出到Excel文件"""
-        if not self.trade_records:
-            self.log("没有交易记录可导出")
-            return
-        try:
-            # 创建DataFrame
-            df = pd.DataFrame(self.trade_records)
-            df['datetime'] = df['datetime'].apply(lambda x: x.strftime('%Y-%m-%d %H:%M:%S'))
-            df = df.sort_values('datetime')
-            
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            threshold_info = f"thresh{self.params.threshold*100:.2f}"
-            filename = f"arb_trades_{self.params.base_currency}_{threshold_info}_{timestamp}.xlsx"
-            filepath = os.path.join(TRADES_DIR, filename)
-            
-            # 将DataFrame保存为Excel文件
-            df.to_excel(filepath, index=False)
-            self.log(f"交易记录已导出到: {filepath}")
-        except Exception as e:
-            self.log(f"导出交易记录时出错: {str(e)}")
\ No newline at end of file
+        """关闭各基础货币的交易记录文件，按需另存为Excel"""
+        export_trade_records(self.ledgers, self.params.export_excel, self.log)